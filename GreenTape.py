@@ -1,13 +1,19 @@
-import os, json, requests, msal
+import os, json
+import numpy as np
 from datetime import datetime, timedelta, timezone
 import calendar
 
-GRAPH_BASE = "https://graph.microsoft.com/v1.0"
+from graph_client import GRAPH_BASE, get_client
+from graph_batch import BatchCoalescer
+from graph_ids import resolve_ids
+from graph_sessions import get_sessions
+from graph_async import READ_CONCURRENCY, READ_MODE, iter_table_rows_concurrent, iter_table_rows_windows
+from graph_columns import COLUMNAR, ColumnTable
+from graph_dates import DateParser, date_to_serial
+from graph_schema import ReorderPlan, get_schema_cache
+from graph_tables import rows_url
 
 # ========= CONFIG =========
-TENANT_ID     = os.getenv("TENANT_ID")
-CLIENT_ID     = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 SITE_HOSTNAME = os.getenv("SITE_HOSTNAME")
 SITE_PATH     = os.getenv("SITE_PATH")
 
@@ -28,60 +34,22 @@ IMPORT_CHUNK_SIZE  = int(os.getenv("IMPORT_CHUNK_SIZE") or "2000")
 IMPORT_MAX_RETRIES = int(os.getenv("IMPORT_MAX_RETRIES") or "3")
 
 # ========================== AUTH ==========================
-app = msal.ConfidentialClientApplication(
-    CLIENT_ID,
-    authority=f"https://login.microsoftonline.com/{TENANT_ID}",
-    client_credential=CLIENT_SECRET,
-)
-token = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])["access_token"]
-base_headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-
-
-def workbook_headers(session_id: str) -> dict:
-    h = dict(base_headers)
-    h["workbook-session-id"] = session_id
-    return h
-
-
-# ========================== GRAPH BASICS ==========================
-def get_site_id():
-    r = requests.get(f"{GRAPH_BASE}/sites/{SITE_HOSTNAME}:/{SITE_PATH}", headers=base_headers)
-    r.raise_for_status()
-    return r.json()["id"]
-
-def get_drive_id(site_id: str):
-    r = requests.get(f"{GRAPH_BASE}/sites/{site_id}/drive", headers=base_headers)
-    r.raise_for_status()
-    return r.json()["id"]
-
-def get_item_id(drive_id: str, path: str):
-    r = requests.get(f"{GRAPH_BASE}/drives/{drive_id}/root:{path}", headers=base_headers)
-    r.raise_for_status()
-    return r.json()["id"]
-
-def create_session(drive_id: str, item_id: str):
-    r = requests.post(
-        f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/createSession",
-        headers=base_headers,
-        data=json.dumps({"persistChanges": True}),
-    )
-    r.raise_for_status()
-    return r.json()["id"]
-
-def close_session(drive_id: str, item_id: str, session_id: str):
-    h = workbook_headers(session_id)
-    requests.post(f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/closeSession", headers=h)
+# Autenticação preguiçosa (1.ª chamada Graph), cache de tokens partilhada entre passos e
+# renovação automática: ver graph_auth.
+graph = get_client()
 
 
 # ========================== HEADERS ==========================
-def get_table_headers_safe(drive_id, item_id, table_name, session_id):
-    """Obtém headers por headerRowRange; se falhar, tenta /columns e /range (1ª linha)."""
-    h = workbook_headers(session_id)
+def get_table_headers_safe(drive_id, item_id, table_name, session_id, prefetched=None):
+    """
+    Obtém headers por headerRowRange; se falhar, tenta /columns e /range (1ª linha).
+    `prefetched`: headerRowRange já pedido num $batch (BatchFuture).
+    """
 
     # 1) headerRowRange
-    r = requests.get(
+    r = prefetched or graph.get(
         f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/headerRowRange",
-        headers=h
+        session_id=session_id
     )
     if r.ok:
         vals = r.json().get("values", [[]])
@@ -89,9 +57,9 @@ def get_table_headers_safe(drive_id, item_id, table_name, session_id):
             return [str(x) for x in vals[0]]
 
     # 2) columns
-    rc = requests.get(
+    rc = graph.get(
         f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/columns",
-        headers=h
+        session_id=session_id
     )
     if rc.ok:
         cols = rc.json().get("value", [])
@@ -100,9 +68,9 @@ def get_table_headers_safe(drive_id, item_id, table_name, session_id):
             return names
 
     # 3) range (primeira linha)
-    rr = requests.get(
+    rr = graph.get(
         f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/range",
-        headers=h
+        session_id=session_id
     )
     if rr.ok:
         vals = rr.json().get("values", [[]])
@@ -121,13 +89,17 @@ def get_table_headers_safe(drive_id, item_id, table_name, session_id):
 
 # ========================== LEITURA PAGINADA (ORIGEM) ==========================
 def list_table_rows_paged(drive_id, item_id, table_name, session_id, top=DEFAULT_TOP):
-    """Itera as linhas da tabela por $top/$skip para evitar payloads grandes."""
-    h = workbook_headers(session_id)
-    base = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/rows"
+    """Itera as linhas da tabela por $top/$skip para evitar payloads grandes (em paralelo se GRAPH_READ_CONCURRENCY > 1)."""
+    if READ_MODE == "window":   # blocos A1 do dataBodyRange em vez de $top/$skip
+        yield from iter_table_rows_windows(drive_id, item_id, table_name, session_id)
+        return
+    if READ_CONCURRENCY > 1:
+        yield from iter_table_rows_concurrent(drive_id, item_id, table_name, session_id, top=top)
+        return
     skip = 0
     while True:
-        url = f"{base}?$top={top}&$skip={skip}"
-        r = requests.get(url, headers=h)
+        url = rows_url(drive_id, item_id, table_name, top=top, skip=skip)   # só index + values
+        r = graph.get(url, session_id=session_id)
         if not r.ok:
             print("[DEBUG][paged] status:", r.status_code)
             try: print("[DEBUG][paged] json:", r.json())
@@ -156,6 +128,8 @@ def cutoff_datetime():
     # últimos 24 meses (rolling)
     return months_ago(now, 24)
 
+DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%d/%m/%Y")   # formatos comuns (ISO e PT)
+
 def parse_date_any(v):
     if v is None or v == "":
         return None
@@ -164,14 +138,16 @@ def parse_date_any(v):
         return epoch + timedelta(days=float(v))
     if isinstance(v, str):
         s = v.strip()
-        # formatos comuns (ISO e PT)
-        for fmt in ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%d/%m/%Y"):
+        for fmt in DATE_FORMATS:
             try:
                 return datetime.strptime(s, fmt).replace(tzinfo=timezone.utc)
             except:
                 pass
     return None
 
+# Coluna de datas de um bloco de rows de uma vez (formato inferido, memo); parse_date_any só no fallback
+DATES = DateParser(DATE_FORMATS, fallback=parse_date_any)
+
 
 # ========================== MAPEAMENTO DE COLUNAS ==========================
 def reorder_values_by_headers(src_headers, dst_headers, row_values):
@@ -179,23 +155,18 @@ def reorder_values_by_headers(src_headers, dst_headers, row_values):
     Reordena uma linha 'row_values' que vem na ordem de 'src_headers'
     para a ordem de 'dst_headers' (match por nome exato do header).
     Se um header de destino não existir na origem, coloca None.
+    Para muitas linhas: um graph_schema.ReorderPlan compilado uma vez (apply_many).
     """
-    pos = {name: i for i, name in enumerate(src_headers)}
-    out = []
-    for name in dst_headers:
-        idx = pos.get(name)
-        out.append(row_values[idx] if idx is not None and idx < len(row_values) else None)
-    return out
+    return ReorderPlan(src_headers, dst_headers).apply(row_values)
 
 
 # ========================== INSERT EM CHUNKS (DESTINO) ==========================
 def add_rows_chunked(drive_id, item_id, table_name, session_id, rows_2d,
                      chunk_size=IMPORT_CHUNK_SIZE, max_retries=IMPORT_MAX_RETRIES):
-    """Insere linhas no fim da tabela em chunks; trata 429 e payload-grande dividindo o chunk."""
+    """Insere linhas no fim da tabela em chunks; trata payload-grande dividindo o chunk (429/5xx → GraphClient)."""
     if not rows_2d:
         return 0
 
-    h = workbook_headers(session_id)
     url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/rows/add"
 
     total = 0
@@ -205,14 +176,8 @@ def add_rows_chunked(drive_id, item_id, table_name, session_id, rows_2d,
     def post_chunk(vals, attempt=1, local_chunk_size=None):
         nonlocal total
         body = {"index": None, "values": vals}
-        r = requests.post(url, headers=h, data=json.dumps(body))
-
-        # throttling
-        if r.status_code == 429:
-            ra = int(r.headers.get("Retry-After", "5"))
-            print(f"[WARN][ADD] 429 TooManyRequests. Aguardar {ra}s…")
-            import time; time.sleep(ra)
-            return post_chunk(vals, attempt+1, local_chunk_size)
+        # 5xx / rede → repetidos no GraphClient (graph_retry), até max_retries
+        r = graph.post(url, session_id=session_id, data=json.dumps(body), max_retries=max_retries)
 
         if not r.ok:
             try:
@@ -232,10 +197,6 @@ def add_rows_chunked(drive_id, item_id, table_name, session_id, rows_2d,
                 ok2 = post_chunk(vals[mid:], attempt+1, len(vals)-mid)
                 return ok1 and ok2
 
-            if attempt <= max_retries:
-                print(f"[WARN][ADD] Falhou (tentativa {attempt}). A tentar de novo…")
-                return post_chunk(vals, attempt+1, local_chunk_size)
-
             print("[DEBUG][ADD] STATUS:", r.status_code, "BODY:", err)
             r.raise_for_status()
 
@@ -255,19 +216,19 @@ def add_rows_chunked(drive_id, item_id, table_name, session_id, rows_2d,
 # ========================== MAIN ==========================
 def keep_last_24_months():
     # Ids e sessões
-    site_id = get_site_id()
-    drive_id = get_drive_id(site_id)
-
-    src_item_id = get_item_id(drive_id, SRC_FILE_PATH)
-    dst_item_id = get_item_id(drive_id, DST_FILE_PATH)
+    site_id, drive_id, (src_item_id, dst_item_id) = resolve_ids(SITE_HOSTNAME, SITE_PATH, [SRC_FILE_PATH, DST_FILE_PATH])
 
-    src_sid = create_session(drive_id, src_item_id)
-    dst_sid = create_session(drive_id, dst_item_id)
+    sessions = get_sessions().open()   # uma sessão por workbook, keep-alive e fecho em SIGTERM
+    dst_sid = sessions.get(drive_id, dst_item_id)
+    src_sid = sessions.get(drive_id, src_item_id, persist=False)   # origem só de leitura
 
     try:
-        # Headers origem/destino
-        src_headers = get_table_headers_safe(drive_id, src_item_id, SRC_TABLE, src_sid)
-        dst_headers = get_table_headers_safe(drive_id, dst_item_id, DST_TABLE, dst_sid)
+        # Headers origem/destino (headerRowRange de ambas num único $batch)
+        with BatchCoalescer() as boot:
+            f_src_hdr = boot.get(f"{GRAPH_BASE}/drives/{drive_id}/items/{src_item_id}/workbook/tables/{SRC_TABLE}/headerRowRange", session_id=src_sid)
+            f_dst_hdr = boot.get(f"{GRAPH_BASE}/drives/{drive_id}/items/{dst_item_id}/workbook/tables/{DST_TABLE}/headerRowRange", session_id=dst_sid)
+        src_headers = get_table_headers_safe(drive_id, src_item_id, SRC_TABLE, src_sid, prefetched=f_src_hdr)
+        dst_headers = get_table_headers_safe(drive_id, dst_item_id, DST_TABLE, dst_sid, prefetched=f_dst_hdr)
 
         if DATE_COLUMN not in src_headers:
             raise RuntimeError(f"A coluna '{DATE_COLUMN}' não existe na tabela de origem '{SRC_TABLE}'.")
@@ -281,17 +242,44 @@ def keep_last_24_months():
         print("[INFO] Cutoff (24m rolling):", cutoff.date())
 
         # Ler origem (paginado) + filtrar + reordenar para o destino
-        to_import = []
-        total_read = 0
-
-        for r in list_table_rows_paged(drive_id, src_item_id, SRC_TABLE, src_sid, top=DEFAULT_TOP):
-            vals = (r.get("values", [[]])[0] or [])
-            total_read += 1
-            if len(vals) <= date_idx:
-                continue
-            dt = parse_date_any(vals[date_idx])
-            if dt and dt >= cutoff:
-                to_import.append(reorder_values_by_headers(src_headers, dst_headers, vals))
+        cutoff_serial = date_to_serial(cutoff)
+        date_key = (src_item_id, SRC_TABLE, date_idx)   # formato / memo desta coluna (graph_dates)
+        if COLUMNAR:
+            # Colunar (graph_columns): máscara sobre os nºs de série + escolha de colunas
+            rows = ((r.get("values", [[]])[0] or []) for r in
+                    list_table_rows_paged(drive_id, src_item_id, SRC_TABLE, src_sid, top=DEFAULT_TOP))
+            total_read = 0
+
+            def after_cutoff(block):
+                nonlocal total_read
+                total_read += len(block)
+                return DATES.serials([r[date_idx] for r in block], column=date_key) >= cutoff_serial
+
+            to_import = ColumnTable.from_rows(rows, src_headers, keep=after_cutoff).select(dst_headers)
+        else:
+            to_import = []
+            total_read = 0
+            block = []
+
+            schemas = get_schema_cache()   # plano por (tabelas, hashes dos cabeçalhos)
+            plan = schemas.plan(schemas.table_key(drive_id, src_item_id, SRC_TABLE),
+                                schemas.table_key(drive_id, dst_item_id, DST_TABLE), src_headers, dst_headers)
+
+            def flush():
+                keep = DATES.serials([v[date_idx] for v in block], column=date_key) >= cutoff_serial
+                to_import.extend(plan.apply_many(block[i] for i in np.flatnonzero(keep).tolist()))
+                block.clear()
+
+            for r in list_table_rows_paged(drive_id, src_item_id, SRC_TABLE, src_sid, top=DEFAULT_TOP):
+                vals = (r.get("values", [[]])[0] or [])
+                total_read += 1
+                if len(vals) <= date_idx:
+                    continue
+                block.append(vals)
+                if len(block) >= DEFAULT_TOP:
+                    flush()
+            if block:
+                flush()
 
         print(f"[INFO] Lidas {total_read} linhas de origem; a importar {len(to_import)} linhas para '{DST_TABLE}'.")
 
@@ -306,8 +294,8 @@ def keep_last_24_months():
 
     finally:
         # Fechar sessões
-        close_session(drive_id, src_item_id, src_sid)
-        close_session(drive_id, dst_item_id, dst_sid)
+        sessions.close_all()
+        graph.print_stats()
 
 
 if __name__ == "__main__":
@@ -1,19 +1,25 @@
 
-import os, json, requests, msal
+import os, json
 from datetime import datetime, timedelta, timezone
 import calendar
 
 # PATCH: CSV exports
 import csv
 import io
+import itertools
 
+import numpy as np
 
-GRAPH_BASE = "https://graph.microsoft.com/v1.0"
+
+from graph_client import GRAPH_BASE, get_client
+from graph_ids import resolve_ids
+from graph_sessions import get_sessions
+from graph_tables import read_table_column
+from graph_async import READ_MODE, iter_table_rows_windows
+from graph_dates import DateParser, date_to_serial
+from graph_stream import report_peak_rss, stream_range_columns
 
 # ========= CONFIG =========
-TENANT_ID      = os.getenv("TENANT_ID")
-CLIENT_ID      = os.getenv("CLIENT_ID")
-CLIENT_SECRET  = os.getenv("CLIENT_SECRET")
 SITE_HOSTNAME  = os.getenv("SITE_HOSTNAME")
 SITE_PATH      = os.getenv("SITE_PATH")
 
@@ -29,95 +35,80 @@ BATCH_SIZE     = int(os.getenv("BATCH_SIZE", "20"))
 CUTOFF_MODE    = os.getenv("CUTOFF_MODE", "rolling")  # "rolling" | "fullmonth"
 # ==========================
 
-# ---- Autenticação ----
-app = msal.ConfidentialClientApplication(
-    CLIENT_ID, authority=f"https://login.microsoftonline.com/{TENANT_ID}",
-    client_credential=CLIENT_SECRET
-)
-token_result = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-token = token_result["access_token"]
-base_headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-
-# ---- Helpers base Graph ----
-def get_site_id():
-    return requests.get(f"{GRAPH_BASE}/sites/{SITE_HOSTNAME}:/{SITE_PATH}", headers=base_headers).json()["id"]
-
-def get_drive_id(site_id):
-    return requests.get(f"{GRAPH_BASE}/sites/{site_id}/drive", headers=base_headers).json()["id"]
-
-def get_item_id(drive_id, path):
-    return requests.get(f"{GRAPH_BASE}/drives/{drive_id}/root:{path}", headers=base_headers).json()["id"]
-
-def create_session(drive_id, item_id):
-    r = requests.post(f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/createSession",
-                      headers=base_headers, data=json.dumps({"persistChanges": True}))
-    return r.json()["id"]
-
-def close_session(drive_id, item_id, session_id):
-    h = dict(base_headers); h["workbook-session-id"] = session_id
-    requests.post(f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/closeSession", headers=h)
+# ---- Cliente Graph (autentica só na 1.ª chamada; ver graph_auth) ----
+graph = get_client()
 
 # ---------- Excel helpers ----------
-def workbook_headers(session_id):
-    h = dict(base_headers)
-    h["workbook-session-id"] = session_id
-    return h
-
 def get_table_header_and_rows(drive_id, item_id, table_name, session_id):
-    h = workbook_headers(session_id)
-    r = requests.get(
-        f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/range",
-        headers=h
+    if READ_MODE == "window":
+        # blocos A1 em paralelo em vez do /range inteiro num só pedido
+        headers = get_table_headers(drive_id, item_id, table_name, session_id)
+        rows = [r["values"][0] for r in iter_table_rows_windows(drive_id, item_id, table_name, session_id)]
+        return {"headers": headers, "rows": rows}
+
+    # streaming: o /range é descodificado coluna a coluna; as linhas do CSV saem das colunas
+    columns = stream_range_columns(
+        f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/range?$select=values",
+        session_id=session_id, client=graph, label=table_name
     )
-    r.raise_for_status()
-
-    values = r.json().get("values", [])
-    if not values:
+    if not columns:
         return {"headers": [], "rows": []}
 
     return {
-        "headers": values[0],
-        "rows": values[1:]
+        "headers": [col[0] for col in columns],
+        "rows": zip(*(itertools.islice(col, 1, None) for col in columns))
     }
 
-def get_table_databody_range(drive_id, item_id, table_name, session_id):
-    h = workbook_headers(session_id)
-    r = requests.get(
-        f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/dataBodyRange",
-        headers=h
+def get_table_headers(drive_id, item_id, table_name, session_id):
+    r = graph.get(
+        f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/headerRowRange?$select=values",
+        session_id=session_id
     )
     r.raise_for_status()
+    return (r.json().get("values") or [[]])[0]
+
+def get_table_databody_range(drive_id, item_id, table_name, session_id, select=None):
+    url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/dataBodyRange"
+    if select:
+        url += f"?$select={select}"
+    r = graph.get(url, session_id=session_id)
+    r.raise_for_status()
     return r.json()
 
+def get_date_column(drive_id, item_id, table_name, session_id, date_col_idx):
+    """Só a coluna de data (1 valor por row); se o Graph a recusar, extrai-a do dataBodyRange completo."""
+    dates = read_table_column(drive_id, item_id, table_name, session_id, date_col_idx)
+    if dates is None:
+        body = get_table_databody_range(drive_id, item_id, table_name, session_id, select="values")
+        dates = [r[date_col_idx] for r in body.get("values", [])]
+    return dates
+
 def table_sort_by_column(drive_id, item_id, table_name, session_id, column_index, ascending=True):
-    h = workbook_headers(session_id)
     body = {
         "fields": [{"key": column_index, "ascending": ascending}],
         "matchCase": False
     }
-    r = requests.post(
+    r = graph.post(
         f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/sort/apply",
-        headers=h,
+        session_id=session_id,
         data=json.dumps(body)
     )
     r.raise_for_status()
 
 def delete_range_on_sheet(drive_id, item_id, sheet_name, addr_a1, session_id):
-    h = workbook_headers(session_id)
     url = (
         f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}"
         f"/workbook/worksheets/{sheet_name}"
         f"/range(address='{addr_a1}')/delete"
     )
-    r = requests.post(url, headers=h, data=json.dumps({"shift": "Up"}))
+    r = graph.post(url, session_id=session_id, data=json.dumps({"shift": "Up"}))
     r.raise_for_status()
 
 def delete_table_row(drive_id, item_id, table_name, session_id, row_index):
-    h = workbook_headers(session_id)
-    r = requests.delete(
+    r = graph.delete(
         f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}"
         f"/workbook/tables/{table_name}/rows/{row_index}",
-        headers=h
+        session_id=session_id
     )
     r.raise_for_status()
 
@@ -152,6 +143,15 @@ def cutoff_datetime():
         now = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     return months_ago(now, 24)
 
+DATE_FORMATS = (
+    "%Y-%m-%d",
+    "%Y-%m-%dT%H:%M:%S",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d-%m-%Y %H:%M:%S"
+)
+
 def parse_date_any(value):
     if value is None or str(value).strip() == "":
         return None
@@ -159,14 +159,7 @@ def parse_date_any(value):
     if isinstance(value, (int, float)):
         return datetime(1899, 12, 30, tzinfo=timezone.utc) + timedelta(days=float(value))
 
-    for fmt in (
-        "%Y-%m-%d",
-        "%Y-%m-%dT%H:%M:%S",
-        "%d/%m/%Y",
-        "%d-%m-%Y",
-        "%d/%m/%Y %H:%M:%S",
-        "%d-%m-%Y %H:%M:%S"
-    ):
+    for fmt in DATE_FORMATS:
         try:
             return datetime.strptime(str(value), fmt).replace(tzinfo=timezone.utc)
         except Exception:
@@ -174,6 +167,9 @@ def parse_date_any(value):
 
     return None
 
+# Coluna de datas inteira de uma vez (formato inferido, memo); parse_date_any só no fallback
+DATES = DateParser(DATE_FORMATS, fallback=parse_date_any)
+
 
 # ---------- Batch helpers ----------
 def chunked_desc(indices, size):
@@ -182,11 +178,12 @@ def chunked_desc(indices, size):
         yield indices_sorted[i:i + size]
 
 def batch_delete_rows(drive_id, item_id, table_name, session_id, indices_chunk):
-    batch_url = f"{GRAPH_BASE}/$batch"
     requests_body = []
 
+    # índices do maior para o menor, encadeados com dependsOn: re-enviar um sub-pedido
+    # throttled (e os 424 seguintes) não apaga a row que entretanto subiu para essa posição
     for j, idx in enumerate(indices_chunk, start=1):
-        requests_body.append({
+        req = {
             "id": str(j),
             "method": "DELETE",
             "url": f"/drives/{drive_id}/items/{item_id}"
@@ -194,14 +191,14 @@ def batch_delete_rows(drive_id, item_id, table_name, session_id, indices_chunk):
             "headers": {
                 "workbook-session-id": session_id
             }
-        })
+        }
+        if j > 1:
+            req["dependsOn"] = [str(j - 1)]
+        requests_body.append(req)
 
-    r = requests.post(
-        batch_url,
-        headers=base_headers,
-        data=json.dumps({"requests": requests_body})
-    )
-    r.raise_for_status()
+    for e in graph.batch(requests_body):
+        if e.get("status") not in (200, 204):
+            print("[DEBUG][BATCH-DEL] Falhou id", e.get("id"), "| status:", e.get("status"), "| body:", e.get("body"))
 
 def delete_rows_in_batches(drive_id, item_id, table_name, session_id, indices, batch_size):
     deleted = 0
@@ -224,12 +221,11 @@ def table_to_csv_bytes(headers, rows, delimiter=";"):
 
     return buffer.getvalue().encode("utf-8-sig")
 
-def upload_csv_to_sharepoint(drive_id, csv_path, csv_bytes, access_token):
+def upload_csv_to_sharepoint(drive_id, csv_path, csv_bytes):
     url = f"{GRAPH_BASE}/drives/{drive_id}/root:{csv_path}:/content"
-    r = requests.put(
+    r = graph.put(
         url,
         headers={
-            "Authorization": f"Bearer {access_token}",
             "Content-Type": "text/csv"
         },
         data=csv_bytes
@@ -237,7 +233,7 @@ def upload_csv_to_sharepoint(drive_id, csv_path, csv_bytes, access_token):
     r.raise_for_status()
 
 def export_table_to_csv_sharepoint(
-    drive_id, item_id, table_name, session_id, excel_path, access_token, delimiter=";"
+    drive_id, item_id, table_name, session_id, excel_path, delimiter=";"
 ):
     data = get_table_header_and_rows(
         drive_id, item_id, table_name, session_id
@@ -256,8 +252,7 @@ def export_table_to_csv_sharepoint(
     upload_csv_to_sharepoint(
         drive_id,
         csv_path,
-        csv_bytes,
-        access_token
+        csv_bytes
     )
 
     print(f"CSV atualizado no SharePoint: {csv_path}")
@@ -265,15 +260,13 @@ def export_table_to_csv_sharepoint(
 
 # ---------- Main ----------
 def keep_last_24_months(mode="block"):
-    site_id = get_site_id()
-    drive_id = get_drive_id(site_id)
-    item_id = get_item_id(drive_id, DST_FILE_PATH)
-    session_id = create_session(drive_id, item_id)
+    site_id, drive_id, (item_id,) = resolve_ids(SITE_HOSTNAME, SITE_PATH, [DST_FILE_PATH])
+    sessions = get_sessions().open()   # keep-alive durante sort/deletes longos e fecho em SIGTERM
+    session_id = sessions.get(drive_id, item_id)
 
     try:
-        data_all = get_table_header_and_rows(drive_id, item_id, DST_TABLE, session_id)
-        headers = data_all["headers"]
-        rows = data_all["rows"]
+        # Só cabeçalho + coluna de data (a tabela completa só é lida no export CSV)
+        headers = get_table_headers(drive_id, item_id, DST_TABLE, session_id)
 
         date_col_idx = headers.index(DATE_COLUMN)
         cutoff = cutoff_datetime()
@@ -284,16 +277,16 @@ def keep_last_24_months(mode="block"):
                 session_id, date_col_idx, True
             )
 
+            dates = get_date_column(
+                drive_id, item_id, DST_TABLE, session_id, date_col_idx
+            )
             body = get_table_databody_range(
-                drive_id, item_id, DST_TABLE, session_id
+                drive_id, item_id, DST_TABLE, session_id, select="address"
             )
 
-            delete_count = 0
-            for r in body["values"]:
-                dt = parse_date_any(r[date_col_idx])
-                if dt is None or dt >= cutoff:
-                    break
-                delete_count += 1
+            # Tabela ordenada: apagar as rows antes da 1.ª sem data ou >= cutoff
+            old = DATES.serials(dates) < date_to_serial(cutoff)
+            delete_count = len(old) if old.all() else int(np.argmin(old))
 
             if delete_count > 0:
                 sheet, start, end = _parse_a1_address(body["address"])
@@ -306,11 +299,8 @@ def keep_last_24_months(mode="block"):
                 )
 
         elif mode == "batch":
-            indices = []
-            for i, r in enumerate(rows):
-                dt = parse_date_any(r[date_col_idx])
-                if dt and dt < cutoff:
-                    indices.append(i)
+            dates = get_date_column(drive_id, item_id, DST_TABLE, session_id, date_col_idx)
+            indices = np.flatnonzero(DATES.serials(dates) < date_to_serial(cutoff)).tolist()
 
             if indices:
                 delete_rows_in_batches(
@@ -329,12 +319,13 @@ def keep_last_24_months(mode="block"):
             table_name=DST_TABLE,
             session_id=session_id,
             excel_path=DST_FILE_PATH,
-            access_token=token,
             delimiter=";"
         )
 
     finally:
-        close_session(drive_id, item_id, session_id)
+        sessions.close_all()
+        graph.print_stats()
+        report_peak_rss("run")
 
 
 if __name__ == "__main__":
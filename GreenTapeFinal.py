@@ -1,18 +1,18 @@
 # ========================== IMPORTS ==========================
-import os, json, requests, msal 
+import os 
 import pandas as pd 
 import unicodedata 
 import re 
-import time 
 import math 
 
 # ========================== GRAPH BASE =======================
-GRAPH_BASE = "https://graph.microsoft.com/v1.0"
+from graph_client import GRAPH_BASE, get_client
+from graph_ids import resolve_ids
+from graph_sessions import get_sessions
+from graph_async import READ_MODE, iter_table_rows_windows
+from graph_stream import columns_to_dataframe, report_peak_rss, stream_range_columns
 
 # ========================== CONFIG ===========================
-TENANT_ID = os.getenv("TENANT_ID")
-CLIENT_ID = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 SITE_HOSTNAME = os.getenv("SITE_HOSTNAME")
 SITE_PATH = os.getenv("SITE_PATH")
 
@@ -44,99 +44,50 @@ DST_COLUMNS = [
 ]
 
 # ========================== AUTENTICAÇÃO =====================
-app = msal.ConfidentialClientApplication(
-    CLIENT_ID,
-    authority=f"https://login.microsoftonline.com/{TENANT_ID}",
-    client_credential=CLIENT_SECRET
-)
-
-token = app.acquire_token_for_client(
-    scopes=["https://graph.microsoft.com/.default"]
-)["access_token"]
-
-base_headers = {
-    "Authorization": f"Bearer {token}",
-    "Content-Type": "application/json"
-}
-
-# ========================== HELPERS BASE GRAPH ===============
-def get_site_id():
-    return requests.get(
-        f"{GRAPH_BASE}/sites/{SITE_HOSTNAME}:/{SITE_PATH}",
-        headers=base_headers
-    ).json()["id"]
-
-def get_drive_id(site_id):
-    return requests.get(
-        f"{GRAPH_BASE}/sites/{site_id}/drive",
-        headers=base_headers
-    ).json()["id"]
-
-def get_item_id(drive_id, path):
-    return requests.get(
-        f"{GRAPH_BASE}/drives/{drive_id}/root:{path}",
-        headers=base_headers
-    ).json()["id"]
-
-def create_session(drive_id, item_id):
-    r = requests.post(
-        f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/createSession",
-        headers=base_headers,
-        data=json.dumps({"persistChanges": True})
-    )
-    return r.json()["id"]
-
-def close_session(drive_id, item_id, session_id):
-    h = dict(base_headers)
-    h["workbook-session-id"] = session_id
-    requests.post(
-        f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/closeSession",
-        headers=h
-    )
+# Preguiçosa (1.ª chamada Graph), com cache de tokens partilhada entre passos: ver graph_auth.
+graph = get_client()
 
 # ========================== UTILIDADES ========================
-def _session_headers(session_id):
-    h = dict(base_headers); h["workbook-session-id"] = session_id
-    return h
-
-def get_ids_for_path(site_id, path):
-    drive = get_drive_id(site_id)
-    return drive, get_item_id(drive, path)
+def get_ids_for_path(path):
+    """(drive_id, item_id) via cache de IDs (graph_ids); sem pedidos se já resolvido."""
+    _, drive_id, (item_id,) = resolve_ids(SITE_HOSTNAME, SITE_PATH, [path])
+    return drive_id, item_id
 
 def read_table(drive_id, item_id, session_id, table):
-    h = _session_headers(session_id)
-    hdr = requests.get(
+    hdr = graph.get(
         f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table}/headerRowRange",
-        headers=h
+        session_id=session_id
     ).json()["values"][0]
-    body = requests.get(
-        f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table}/dataBodyRange",
-        headers=h
-    ).json().get("values", [])
-    return pd.DataFrame(body, columns=hdr)
+    if READ_MODE == "window":
+        # blocos A1 em paralelo em vez do dataBodyRange inteiro num só pedido
+        body = [r["values"][0] for r in iter_table_rows_windows(drive_id, item_id, table, session_id)]
+        return pd.DataFrame(body, columns=hdr)
+    # streaming: as células vão diretamente para as colunas, sem a lista de linhas completa
+    columns = stream_range_columns(
+        f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table}/dataBodyRange?$select=values",
+        session_id=session_id, client=graph, label=table
+    )
+    return columns_to_dataframe(columns, hdr)
 
 # ========================== MERGES ============================
 def build_merged_dataframe():
-    site_id = get_site_id()
-    ast_drive, ast_item = get_ids_for_path(site_id, AST_FILE_PATH)
-    cst_drive, cst_item = get_ids_for_path(site_id, CST_FILE_PATH)
-
-    sess_ast = create_session(ast_drive, ast_item)
-    sess_cst = create_session(cst_drive, cst_item)
-
-    try:
-        df_ast = read_table(ast_drive, ast_item, sess_ast, AST_TABLE)
-        df_bst = read_table(ast_drive, ast_item, sess_ast, BST_TABLE)
-        df_cst = read_table(cst_drive, cst_item, sess_cst, CST_TABLE)
-
-        return (
-            df_ast
-               .merge(df_bst, how="left", left_on="Refª Visita", right_on="Refª")
-               .merge(df_cst, how="left", left_on="Ref. Farmácia", right_on="Ref")
-        )
-    finally:
-        close_session(ast_drive, ast_item, sess_ast)
-        close_session(cst_drive, cst_item, sess_cst)
+    ast_drive, ast_item = get_ids_for_path(AST_FILE_PATH)
+    cst_drive, cst_item = get_ids_for_path(CST_FILE_PATH)
+
+    # Fontes só de leitura; as sessões ficam abertas (keep-alive) até ao close_all() do fim
+    sessions = get_sessions()
+    sess_ast = sessions.get(ast_drive, ast_item, persist=False)
+    sess_cst = sessions.get(cst_drive, cst_item, persist=False)
+
+    df_ast = read_table(ast_drive, ast_item, sess_ast, AST_TABLE)
+    df_bst = read_table(ast_drive, ast_item, sess_ast, BST_TABLE)
+    df_cst = read_table(cst_drive, cst_item, sess_cst, CST_TABLE)
+
+    return (
+        df_ast
+           .merge(df_bst, how="left", left_on="Refª Visita", right_on="Refª")
+           .merge(df_cst, how="left", left_on="Ref. Farmácia", right_on="Ref")
+    )
 
 # ========================== NORMALIZAÇÃO ======================
 def _norm(s):
@@ -186,20 +137,19 @@ def normalize_cell_for_json(v):
 
 # ========================== WRITE TABLE ========================
 def clear_and_write_table(drive_id, item_id, table, df):
-    sess = create_session(drive_id, item_id)
-    h = _session_headers(sess)
+    sess = get_sessions().get(drive_id, item_id)
 
     try:
         # headers
-        requests.patch(
+        graph.patch(
             f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table}/headerRowRange",
-            headers=h, json={"values":[list(df.columns)]}
+            session_id=sess, json={"values":[list(df.columns)]}
         ).raise_for_status()
 
         # clear
-        requests.post(
+        graph.post(
             f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table}/dataBodyRange/clear",
-            headers=h, json={"applyTo":"all"}
+            session_id=sess, json={"applyTo":"all"}
         ).raise_for_status()
 
         # add data
@@ -211,11 +161,11 @@ def clear_and_write_table(drive_id, item_id, table, df):
         url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table}/rows/add"
 
         for i in range(0, len(rows), 1000):
-            requests.post(url, headers=h, json={"values": rows[i:i+1000]}).raise_for_status()
-            time.sleep(0.2)
+            # ritmo/429 geridos pelo governador de throttling (sem sleep fixo entre chunks)
+            graph.post(url, session_id=sess, json={"values": rows[i:i+1000]}).raise_for_status()
 
     finally:
-        close_session(drive_id, item_id, sess)
+        get_sessions().close(drive_id, item_id)
 
 # ========================== CSV ================================
 def dataframe_to_csv_bytes(df, sep=","):
@@ -223,14 +173,16 @@ def dataframe_to_csv_bytes(df, sep=","):
     return ("\ufeff" + csv_str).encode("utf-8")
 
 def upload_csv_to_sharepoint(csv_bytes, dest_path):
-    site_id = get_site_id()
-    drive_id = get_drive_id(site_id)
+    _, drive_id, _ = resolve_ids(SITE_HOSTNAME, SITE_PATH)
     url = f"{GRAPH_BASE}/drives/{drive_id}/root:{dest_path}:/content"
-    h = dict(base_headers); h["Content-Type"] = "text/csv; charset=utf-8"
-    requests.put(url, headers=h, data=csv_bytes).raise_for_status()
+    graph.put(url, headers={"Content-Type": "text/csv; charset=utf-8"}, data=csv_bytes).raise_for_status()
 
 # ========================== PIPELINE FINAL =====================
 def build_and_write_to_dst():
+    get_sessions().open()   # fecha sessões em SIGTERM / saída
+    # Todos os IDs do job num só passo (cache em disco + $batch para os que faltarem)
+    resolve_ids(SITE_HOSTNAME, SITE_PATH, [AST_FILE_PATH, CST_FILE_PATH, DST_FILE_PATH])
+
     df = build_merged_dataframe()
     df = build_dataframe_for_dst(df)
     df = apply_empresa_wbrands_rule(df)
@@ -260,8 +212,7 @@ def build_and_write_to_dst():
     print(f"🔎 Filtro Empresas: Removidas {before-after} linhas. Total final: {after}")
 
     # ---- Escrever Excel ----
-    site_id = get_site_id()
-    dst_drive, dst_item = get_ids_for_path(site_id, DST_FILE_PATH)
+    dst_drive, dst_item = get_ids_for_path(DST_FILE_PATH)
     clear_and_write_table(dst_drive, dst_item, DST_TABLE, df)
 
     # ---- Exportar CSV ----
@@ -271,6 +222,9 @@ def build_and_write_to_dst():
     )
 
     print(f"✅ Concluído: {after} linhas processadas — Excel + CSV atualizados.")
+    get_sessions().close_all()
+    graph.print_stats()
+    report_peak_rss("run")
 
 # ========================== ENTRYPOINT =========================
 if __name__ == "__main__":
@@ -0,0 +1,214 @@
+"""
+Benchmark ponta-a-ponta do sync mensal Mensal → Historico contra o Graph emulado.
+
+Para cada job (BENCH_JOBS, nomes de sync_jobs.JOBS) e cada combinação de tamanho do histórico
+(BENCH_HISTORY_ROWS) × linhas do mês (BENCH_MONTH_ROWS):
+- arranca um graph_emulator com o workbook de origem (mês atual + algumas linhas do
+  mês anterior) e o de destino (histórico com o mês atual já presente no fim, como
+  depois de um run anterior), com os caminhos / tabelas / coluna de data do job;
+- corre o script do job num processo à parte apontado ao emulador (GRAPH_BASE,
+  GRAPH_STATIC_TOKEN, throttling local desligado);
+- lê o relatório do graph_metrics do job e confirma o resultado no emulador
+  (o mês no destino = o mês da origem, o resto do histórico intacto).
+
+Reporta por cenário: tempo de parede, nº de chamadas Graph, bytes, pico de RSS e,
+por fase (read / delete / insert / …), intervalo, chamadas, bytes e RSS máximo.
+Resultados em BENCH_OUT/bench_<data>.json e .md.
+
+Uso:
+    python bench_sync.py
+    BENCH_JOBS=Rutura_de_Stocks BENCH_HISTORY_ROWS=10000 BENCH_MONTH_ROWS=1000 python bench_sync.py
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from graph_emulator import EmulatorConfig, GraphEmulator
+from sync_jobs import JOBS
+
+# ========= CONFIG (ENV) =========
+BENCH_JOBS         = os.getenv("BENCH_JOBS") or "Rutura_de_Stocks,Historico_Sell_In"
+BENCH_HISTORY_ROWS = os.getenv("BENCH_HISTORY_ROWS") or "10000,100000,1000000"
+BENCH_MONTH_ROWS   = os.getenv("BENCH_MONTH_ROWS") or "1000,10000,50000"
+BENCH_COLUMNS      = int(os.getenv("BENCH_COLUMNS") or "12")
+BENCH_LATENCY_MS   = float(os.getenv("BENCH_LATENCY_MS") or "0")        # latência emulada por pedido
+BENCH_TIMEOUT      = float(os.getenv("BENCH_TIMEOUT") or "7200")        # segundos por cenário
+BENCH_OUT          = os.getenv("BENCH_OUT") or "bench_results"
+# ================================
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EXCEL_EPOCH = date(1899, 12, 30)
+
+
+def current_month():
+    """Mesmo mês que os scripts usam (ontem)."""
+    d = (datetime.today() - timedelta(days=1)).date()
+    start = d.replace(day=1)
+    end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return start, end
+
+def excel_serial(d):
+    return (d - EXCEL_EPOCH).days
+
+
+# ---- Dados sintéticos ----
+def build_tables(cfg, history_rows, month_rows, n_cols, rng):
+    """(src_headers, src_rows, dst_headers, dst_rows, n_src_month) com a data como nº de série Excel."""
+    month_start, month_end = current_month()
+    days_in_month = (month_end - month_start).days + 1
+    prev_start = month_start - timedelta(days=730)
+    prev_days = (month_start - prev_start).days
+
+    dst_headers = [cfg["date_column"]] + [f"Campo {i}" for i in range(1, n_cols)]
+    src_headers = list(reversed(dst_headers))   # ordem diferente → força o reorder do script
+    pool = [[f"c{c}v{v}" for v in range(64)] for c in range(n_cols)]   # strings partilhadas (memória do emulador)
+
+    def row(d, i):
+        vals = [excel_serial(d)] + [pool[c][(i + c) % 64] if c % 3 else i for c in range(1, n_cols)]
+        return vals
+
+    month_in_dst = min(month_rows, history_rows)
+    dst_rows = [row(prev_start + timedelta(days=rng.randrange(prev_days)), i)
+                for i in range(history_rows - month_in_dst)]
+    dst_rows.sort(key=lambda r: r[0])
+    dst_rows += [row(month_start + timedelta(days=rng.randrange(days_in_month)), i) for i in range(month_in_dst)]
+
+    src_month = [row(month_start + timedelta(days=rng.randrange(days_in_month)), i) for i in range(month_rows)]
+    src_prev = [row(month_start - timedelta(days=1 + rng.randrange(28)), i) for i in range(month_rows // 10)]
+    src_rows = [list(reversed(r)) for r in src_prev + src_month]
+    return src_headers, src_rows, dst_headers, dst_rows, len(src_month)
+
+
+# ---- Um cenário ----
+def run_scenario(job, history_rows, month_rows, workdir):
+    cfg = JOBS[job]
+    rng = random.Random(f"{job}:{history_rows}:{month_rows}")
+    src_headers, src_rows, dst_headers, dst_rows, n_src_month = build_tables(
+        cfg, history_rows, month_rows, BENCH_COLUMNS, rng)
+    kept_history = len(dst_rows) - min(month_rows, history_rows)
+
+    emu = GraphEmulator(EmulatorConfig(latency_ms=BENCH_LATENCY_MS, random_seed=1), seed_path="")
+    emu.add_workbook(cfg["src_file"], tables={cfg["src_table"]: {"sheet": "Origem", "headers": src_headers,
+                                                                       "rows": src_rows}})
+    emu.add_workbook(cfg["dst_file"], tables={cfg["dst_table"]: {"sheet": "Historico", "headers": dst_headers,
+                                                                       "rows": dst_rows}})
+    del src_rows, dst_rows
+
+    tag = f"{job}_{history_rows}_{month_rows}"
+    metrics_dir = os.path.join(workdir, tag)
+    env = dict(os.environ,
+               GRAPH_STATIC_TOKEN="bench",
+               SITE_HOSTNAME="bench.sharepoint.com",
+               SITE_PATH="sites/Bench",
+               GRAPH_ID_CACHE=os.path.join(workdir, f"{tag}_ids.json"),
+               GRAPH_INDEX_PATH=os.path.join(workdir, f"{tag}_index.sqlite"),
+               GRAPH_WATERMARKS=os.path.join(workdir, f"{tag}_watermarks.json"),
+               GRAPH_SCHEMA_CACHE=os.path.join(workdir, f"{tag}_schema.json"),
+               GRAPH_METRICS_DIR=metrics_dir,
+               GRAPH_METRICS_REPORT="1",
+               GRAPH_MAX_RPS="1000000", GRAPH_START_RPS="1000000", GRAPH_BURST="1000000",
+               PYTHONUNBUFFERED="1")
+    env.pop("GITHUB_STEP_SUMMARY", None)
+
+    with emu:
+        env["GRAPH_BASE"] = emu.base_url
+        log_path = os.path.join(workdir, f"{tag}.log")
+        t0 = time.monotonic()
+        with open(log_path, "w", encoding="utf-8") as log:
+            proc = subprocess.run([sys.executable, os.path.join(HERE, f"{job}.py")], env=env, cwd=HERE,
+                                  stdout=log, stderr=subprocess.STDOUT, timeout=BENCH_TIMEOUT)
+        wall = time.monotonic() - t0
+        final = emu.table_values(cfg["dst_file"], cfg["dst_table"])
+        emu_stats = emu.stats()
+
+    month_start, month_end = current_month()
+    lo, hi = excel_serial(month_start), excel_serial(month_end)
+    month_after = sum(1 for r in final if isinstance(r[0], (int, float)) and lo <= r[0] <= hi)
+    ok = proc.returncode == 0 and month_after == n_src_month and len(final) == kept_history + n_src_month
+
+    report = {}
+    report_path = os.path.join(metrics_dir, f"{job}.json")
+    if os.path.exists(report_path):
+        with open(report_path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+
+    result = {
+        "job": job,
+        "history_rows": history_rows,
+        "month_rows": month_rows,
+        "ok": ok,
+        "returncode": proc.returncode,
+        "wall_s": round(wall, 2),
+        "graph_calls": report.get("calls"),
+        "bytes": report.get("bytes"),
+        "peak_rss_mb": report.get("peak_rss_mb"),
+        "phases": {ph: {k: p.get(k) for k in ("span_s", "calls", "bytes", "rss_max_mb", "throttle_wait_s")}
+                   for ph, p in (report.get("phases") or {}).items()},
+        "emulator_requests": emu_stats["requests"],
+        "dst_rows_after": len(final),
+        "dst_month_rows_after": month_after,
+        "log": log_path,
+    }
+    status = "OK" if ok else f"FALHOU (rc={proc.returncode}, mês={month_after}/{n_src_month})"
+    print(f"[BENCH] {job} histórico={history_rows} mês={month_rows}: {wall:.1f}s "
+          f"chamadas={result['graph_calls']} RSS={result['peak_rss_mb']}MB → {status}")
+    return result
+
+
+# ---- Relatório ----
+def to_markdown(results):
+    lines = ["## Benchmark sync mensal (Graph emulado)", "",
+             "| Job | Histórico | Mês | OK | Parede (s) | Chamadas | MB | RSS pico (MB) | "
+             "read (s / MB RSS) | delete (s / MB RSS) | insert (s / MB RSS) |",
+             "|---|---:|---:|---|---:|---:|---:|---:|---:|---:|---:|"]
+    for r in results:
+        def phase(ph):
+            p = r["phases"].get(ph)
+            return f"{p['span_s']:.1f} / {p['rss_max_mb']:.0f}" if p else "—"
+        mb = (r["bytes"] or 0) / (1024 * 1024)
+        lines.append(f"| {r['job']} | {r['history_rows']} | {r['month_rows']} | {'✅' if r['ok'] else '❌'} | "
+                     f"{r['wall_s']:.1f} | {r['graph_calls']} | {mb:.1f} | {r['peak_rss_mb']} | "
+                     f"{phase('read')} | {phase('delete')} | {phase('insert')} |")
+    return "\n".join(lines) + "\n"
+
+def main():
+    jobs = [j.strip() for j in BENCH_JOBS.split(",") if j.strip()]
+    histories = [int(x) for x in BENCH_HISTORY_ROWS.split(",") if x.strip()]
+    months = [int(x) for x in BENCH_MONTH_ROWS.split(",") if x.strip()]
+
+    os.makedirs(BENCH_OUT, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix="bench_sync_")
+    results = []
+    for job in jobs:
+        for h in histories:
+            for m in months:
+                if m > h:
+                    continue   # o mês não cabe no histórico
+                try:
+                    results.append(run_scenario(job, h, m, workdir))
+                except subprocess.TimeoutExpired:
+                    print(f"[BENCH] {job} histórico={h} mês={m}: timeout ({BENCH_TIMEOUT:.0f}s)")
+                    results.append({"job": job, "history_rows": h, "month_rows": m, "ok": False,
+                                    "wall_s": BENCH_TIMEOUT, "graph_calls": None, "bytes": None,
+                                    "peak_rss_mb": None, "phases": {}})
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    out = {"started": stamp, "columns": BENCH_COLUMNS, "latency_ms": BENCH_LATENCY_MS, "results": results}
+    json_path = os.path.join(BENCH_OUT, f"bench_{stamp}.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(out, f, ensure_ascii=False, indent=2)
+    markdown = to_markdown(results)
+    with open(os.path.join(BENCH_OUT, f"bench_{stamp}.md"), "w", encoding="utf-8") as f:
+        f.write(markdown)
+    print(markdown)
+    print(f"[BENCH] Resultados: {json_path} (logs em {workdir})")
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
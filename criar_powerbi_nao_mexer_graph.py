@@ -1,16 +1,13 @@
 
 import os
-import json
 import urllib.parse
-import requests
-import msal
 
-GRAPH_BASE = "https://graph.microsoft.com/v1.0"
+from graph_client import GRAPH_BASE, get_client
+from graph_ids import resolve_ids
+from graph_sessions import get_sessions
+from graph_batch import BatchCoalescer
 
 # ========= CONFIG por variáveis de ambiente =========
-TENANT_ID     = os.getenv("TENANT_ID")
-CLIENT_ID     = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 
 # Ex.: SITE_HOSTNAME="braveperspective.sharepoint.com"
 SITE_HOSTNAME = os.getenv("SITE_HOSTNAME", "").strip()
@@ -38,32 +35,19 @@ PCT_COLS      = [f"{c}%" for c in VAL_COLS]
 EXTRA_COLS    = ["Farmácias", "GSI"]  # nomes das duas novas colunas
 
 # ========= AUTH (MSAL) =========
-# ---- Autenticação (mantida como tinhas) ----
-app = msal.ConfidentialClientApplication(
-    CLIENT_ID, authority=f"https://login.microsoftonline.com/{TENANT_ID}",
-    client_credential=CLIENT_SECRET
-)
-token_result = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-token = token_result["access_token"]
-base_headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+# Autenticação preguiçosa (1.ª chamada Graph) com renovação automática: ver graph_auth.
+graph = get_client()
 
 # ========= HELPERS Graph =========
 # (mantidas como tinhas)
-def get_site_id():
-    return requests.get(f"{GRAPH_BASE}/sites/{SITE_HOSTNAME}:/{SITE_PATH}", headers=base_headers).json()["id"]
-
-def get_drive_id(site_id):
-    return requests.get(f"{GRAPH_BASE}/sites/{site_id}/drive", headers=base_headers).json()["id"]
-
-def list_children_recursive(token: str, drive_id: str, drive_relative_folder: str) -> list[dict]:
+def list_children_recursive(drive_id: str, drive_relative_folder: str) -> list[dict]:
     """
     Devolve todos os ficheiros (.xlsx/.xlsm) dentro da pasta (e subpastas).
     drive_relative_folder: ex. "General/Teste - Daniel PowerAutomate/5. Planos Anuais/FMENEZES"
     """
-    h = {"Authorization": f"Bearer {token}"}
     enc = urllib.parse.quote(drive_relative_folder.strip("/"))
     url_item = f"{GRAPH_BASE}/drives/{drive_id}/root:/{enc}"
-    r = requests.get(url_item, headers=h); r.raise_for_status()
+    r = graph.get(url_item); r.raise_for_status()
     folder_id = r.json()["id"]
 
     files = []
@@ -72,7 +56,7 @@ def list_children_recursive(token: str, drive_id: str, drive_relative_folder: st
         url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/children"
         next_url = url
         while next_url:
-            resp = requests.get(next_url, headers=h); resp.raise_for_status()
+            resp = graph.get(next_url); resp.raise_for_status()
             data = resp.json()
             for it in data.get("value", []):
                 name = it.get("name", "")
@@ -87,69 +71,44 @@ def list_children_recursive(token: str, drive_id: str, drive_relative_folder: st
     return files
 
 # ========= Workbook APIs =========
-def create_session(token: str, drive_id: str, item_id: str, persist=True) -> str:
-    h = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/createSession"
-    body = {"persistChanges": bool(persist)}
-    r = requests.post(url, headers=h, data=json.dumps(body)); r.raise_for_status()
-    sid = r.json()["id"]
-    print(f"[DEBUG] Session criada: {sid}")
-    return sid
-
-def close_session(token: str, drive_id: str, item_id: str, session_id: str):
-    h = {"Authorization": f"Bearer {token}", "workbook-session-id": session_id}
-    r = requests.post(f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/closeSession", headers=h)
-    print(f"[DEBUG] Session fechada (status {r.status_code})")
-
-def get_worksheets(token: str, drive_id: str, item_id: str, session_id: str) -> list[dict]:
-    h = {"Authorization": f"Bearer {token}", "workbook-session-id": session_id}
-    url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets"
-    r = requests.get(url, headers=h); r.raise_for_status()
-    v = r.json().get("value", [])
+def worksheets_from(fut) -> list[dict]:
+    fut.raise_for_status()
+    v = fut.json().get("value", [])
     print(f"[DEBUG] Worksheets: {len(v)}")
     return v
 
-def get_worksheet_id_by_name(token: str, drive_id: str, item_id: str, session_id: str, sheet_name: str) -> str | None:
-    for s in get_worksheets(token, drive_id, item_id, session_id):
+def find_worksheet_id(worksheets: list[dict], sheet_name: str) -> str | None:
+    for s in worksheets:
         if s.get("name") == sheet_name:
             return s.get("id")
     return None
 
-def add_worksheet(token: str, drive_id: str, item_id: str, session_id: str, sheet_name: str) -> str:
-    h = {"Authorization": f"Bearer {token}", "workbook-session-id": session_id, "Content-Type":"application/json"}
-    url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets/add"
-    r = requests.post(url, headers=h, data=json.dumps({"name": sheet_name})); r.raise_for_status()
-    wsid = r.json()["id"]
-    print(f"[DEBUG] Worksheet adicionada: {sheet_name} (id={wsid})")
-    return wsid
-
-def delete_worksheet(token: str, drive_id: str, item_id: str, session_id: str, worksheet_id: str):
-    h = {"Authorization": f"Bearer {token}", "workbook-session-id": session_id}
-    url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets/{worksheet_id}"
-    r = requests.delete(url, headers=h)  # 204 esperado; ignoramos falhas leves
-    print(f"[DEBUG] DELETE worksheet id={worksheet_id} (status {r.status_code})")
-
-def get_range_values(token: str, drive_id: str, item_id: str, session_id: str, worksheet_id: str, address: str) -> list[list]:
-    h = {"Authorization": f"Bearer {token}", "workbook-session-id": session_id}
-    url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets/{worksheet_id}/range(address='{address}')"
-    print(f"[DEBUG] GET range {address} …")
-    r = requests.get(url, headers=h); 
-    if not r.ok:
-        raise RuntimeError(f"GET range {address} falhou: {r.status_code} {r.text}")
-    vals = r.json().get("values", [])
-    print(f"[DEBUG] Range {address}: {len(vals)} linhas")
-    return vals
+# ---- Sub-pedidos para $batch (folhas endereçadas por id OU nome, p/ não esperar pelo id) ----
+def worksheet_url(drive_id: str, item_id: str, sheet: str) -> str:
+    return f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets/{urllib.parse.quote(sheet, safe='')}"
+
+def batch_get_range(batch: BatchCoalescer, drive_id: str, item_id: str, session_id: str, sheet: str, address: str):
+    print(f"[DEBUG] GET range {sheet}!{address} (em $batch) …")
+    return batch.get(f"{worksheet_url(drive_id, item_id, sheet)}/range(address='{address}')", session_id=session_id)
 
-def patch_range_values(token: str, drive_id: str, item_id: str, session_id: str, worksheet_id: str, address: str, values_2d: list[list]):
-    h = {"Authorization": f"Bearer {token}", "workbook-session-id": session_id, "Content-Type":"application/json"}
-    url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets/{worksheet_id}/range(address='{address}')"
+def batch_patch_range(batch: BatchCoalescer, drive_id: str, item_id: str, session_id: str, sheet: str, address: str,
+                      values_2d: list[list], depends_on=None):
     rows = len(values_2d)
     cols = len(values_2d[0]) if rows > 0 else 0
-    print(f"[DEBUG] PATCH range {address} com {rows}x{cols} …")
-    body = {"values": values_2d}
-    r = requests.patch(url, headers=h, data=json.dumps(body))
-    if not r.ok:
-        raise RuntimeError(f"PATCH {address} falhou: {r.status_code} {r.text}")
+    print(f"[DEBUG] PATCH range {address} com {rows}x{cols} (em $batch) …")
+    return batch.patch(f"{worksheet_url(drive_id, item_id, sheet)}/range(address='{address}')",
+                       body={"values": values_2d}, session_id=session_id, depends_on=depends_on)
+
+def range_values(fut, address: str) -> list[list]:
+    if not fut.ok:
+        raise RuntimeError(f"GET range {address} falhou: {fut.status_code} {fut.text}")
+    vals = fut.json().get("values", [])
+    print(f"[DEBUG] Range {address}: {len(vals)} linhas")
+    return vals
+
+def check_write(fut, what: str):
+    if not fut.ok:
+        raise RuntimeError(f"{what} falhou: {fut.status_code} {fut.text}")
 
 # ========= Transformação =========
 def normalize_percent(v):
@@ -253,9 +212,8 @@ def main():
     print(f"[DEBUG] MAX_ROWS_READ={MAX_ROWS_READ}")
     print(f"[DEBUG] Pastas: {len(DRIVE_FOLDERS)} → {DRIVE_FOLDERS}")
 
-    token = token_result["access_token"]
-    site_id  = get_site_id()
-    drive_id = get_drive_id(site_id)
+    site_id, drive_id, _ = resolve_ids(SITE_HOSTNAME, SITE_PATH)
+    sessions = get_sessions().open()   # uma sessão por ficheiro, keep-alive e fecho em SIGTERM
 
     print(f"[DEBUG] site_id={site_id}")
     print(f"[DEBUG] drive_id={drive_id}")
@@ -267,7 +225,7 @@ def main():
     for folder in DRIVE_FOLDERS:
         print(f"\n[Pasta] {folder}")
         try:
-            items = list_children_recursive(token, drive_id, folder)
+            items = list_children_recursive(drive_id, folder)
             print(f"[DEBUG] {len(items)} ficheiros Excel encontrados na pasta.")
         except Exception as e:
             print(f"  [ERRO] A aceder à pasta: {e}")
@@ -282,22 +240,36 @@ def main():
             total_files += 1
             print(f"  [Processar] {name}")
 
-            sess_id = create_session(token, drive_id, item_id, persist=True)
+            # persistente: a folha destino é escrita no próprio ficheiro lido
+            sess_id = sessions.get(drive_id, item_id)
             try:
-                # 1) Worksheet origem: tenta alternativas
+                # 1) $batch de leitura: lista de folhas + B3 e B5:G5 de cada folha de origem
+                #    alternativa (endereçada por nome); o corpo só é lido da folha escolhida
+                with BatchCoalescer() as rb:
+                    f_ws = rb.get(f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets",
+                                  session_id=sess_id)
+                    f_src = {
+                        candidate: {addr: batch_get_range(rb, drive_id, item_id, sess_id, candidate, addr)
+                                    for addr in ("B3:B3", "B5:G5")}
+                        for candidate in SHEET_SOURCE_ALTS
+                    }
+                worksheets = worksheets_from(f_ws)
+
+                # Worksheet origem: primeira alternativa que existe
                 ws_src_id = None
                 sheet_used = None
                 for candidate in SHEET_SOURCE_ALTS:
-                    ws_src_id = get_worksheet_id_by_name(token, drive_id, item_id, sess_id, candidate)
+                    ws_src_id = find_worksheet_id(worksheets, candidate)
                     if ws_src_id:
                         sheet_used = candidate
                         break
                 if not ws_src_id:
                     raise RuntimeError(f"Folha de origem não encontrada (tentadas: {SHEET_SOURCE_ALTS}).")
                 print(f"[DEBUG] Folha de origem usada: '{sheet_used}' (id={ws_src_id})")
+                ranges = f_src[sheet_used]
 
-                # 2) Ler B3 (valor base)
-                b3_vals = get_range_values(token, drive_id, item_id, sess_id, ws_src_id, "B3:B3")
+                # 2) B3 (valor base)
+                b3_vals = range_values(ranges["B3:B3"], "B3:B3")
                 b3_value = None
                 if b3_vals and b3_vals[0]:
                     b3_value = b3_vals[0][0]
@@ -311,7 +283,7 @@ def main():
                 print(f"[DEBUG] Nome da pasta (extra coluna): {folder_name_simple!r}")
 
                 # 3) Ler cabeçalho B5:G5
-                header_vals = get_range_values(token, drive_id, item_id, sess_id, ws_src_id, "B5:G5")
+                header_vals = range_values(ranges["B5:G5"], "B5:G5")
                 header = [str(x).replace("\xa0"," ").strip() for x in (header_vals[0] if header_vals else [])]
                 expected = [COL_MARCAS] + VAL_COLS
                 expected_norm = [str(x).replace("\xa0"," ").strip() for x in expected]
@@ -320,10 +292,13 @@ def main():
                 if header != expected_norm:
                     raise RuntimeError(f"Header inesperado.\nEsperado: {expected_norm}\nEncontrado: {header}")
 
-                # 4) Ler corpo B6:G{fim}
+                # 4) Corpo B6:G{fim}, só da folha escolhida e com o cabeçalho validado
                 end_row = 6 + MAX_ROWS_READ - 1
                 body_addr = f"B6:G{end_row}"
-                body_vals = get_range_values(token, drive_id, item_id, sess_id, ws_src_id, body_addr)
+                print(f"[DEBUG] GET range {sheet_used}!{body_addr} …")
+                f_body = graph.get(f"{worksheet_url(drive_id, item_id, ws_src_id)}/range(address='{body_addr}')",
+                                   session_id=sess_id)
+                body_vals = range_values(f_body, body_addr)
 
                 # Limpar cauda vazia
                 clean_rows = [row for row in body_vals if any(c not in (None, "",) for c in row)]
@@ -340,24 +315,37 @@ def main():
                 if out_rows:
                     print(f"[DEBUG] Primeiro registo com extras (preview): {out_rows[0]}")
 
-                # 6) Preparar destino: recriar folha para evitar resíduos
-                ws_dst_id = get_worksheet_id_by_name(token, drive_id, item_id, sess_id, SHEET_TARGET)
-                if ws_dst_id:
-                    delete_worksheet(token, drive_id, item_id, sess_id, ws_dst_id)
-                ws_dst_id = add_worksheet(token, drive_id, item_id, sess_id, SHEET_TARGET)
-
-                # 7) Escrever cabeçalho + dados (A1:M...)
+                # 6+7) Recriar folha destino (evita resíduos) e escrever cabeçalho + dados (A1:M...)
+                #      num único $batch encadeado: DELETE → add → PATCH header → PATCH corpo
+                ws_dst_id = find_worksheet_id(worksheets, SHEET_TARGET)
                 header_out = [COL_MARCAS] + VAL_COLS + PCT_COLS + EXTRA_COLS
-                patch_range_values(token, drive_id, item_id, sess_id, ws_dst_id, "A1:M1", [pad_row(header_out, 13)])
-
-                if out_rows:
-                    # garantir 13 colunas (A..M)
-                    out_rows = [pad_row(r, 13) for r in out_rows]
-                    # corrigido off-by-one: última linha = 1 + len(out_rows)
-                    end_out = 1 + len(out_rows)
-                    addr_out = f"A2:M{end_out}"
-                    print(f"[DEBUG] Vou escrever {len(out_rows)} linhas x 13 colunas em {addr_out}")
-                    patch_range_values(token, drive_id, item_id, sess_id, ws_dst_id, addr_out, out_rows)
+                writes = []
+                with BatchCoalescer() as wb:
+                    prev = []
+                    if ws_dst_id:
+                        f_del = wb.delete(worksheet_url(drive_id, item_id, ws_dst_id), session_id=sess_id)
+                        writes.append((f_del, f"DELETE worksheet id={ws_dst_id}"))
+                        prev = [f_del]
+                    f_add = wb.post(f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets/add",
+                                    body={"name": SHEET_TARGET}, session_id=sess_id, depends_on=prev)
+                    writes.append((f_add, f"Adicionar worksheet {SHEET_TARGET}"))
+                    f_hdr = batch_patch_range(wb, drive_id, item_id, sess_id, SHEET_TARGET, "A1:M1",
+                                              [pad_row(header_out, 13)], depends_on=[f_add])
+                    writes.append((f_hdr, "PATCH A1:M1"))
+
+                    if out_rows:
+                        # garantir 13 colunas (A..M)
+                        out_rows = [pad_row(r, 13) for r in out_rows]
+                        # corrigido off-by-one: última linha = 1 + len(out_rows)
+                        end_out = 1 + len(out_rows)
+                        addr_out = f"A2:M{end_out}"
+                        print(f"[DEBUG] Vou escrever {len(out_rows)} linhas x 13 colunas em {addr_out}")
+                        f_body = batch_patch_range(wb, drive_id, item_id, sess_id, SHEET_TARGET, addr_out,
+                                                   out_rows, depends_on=[f_hdr])
+                        writes.append((f_body, f"PATCH {addr_out}"))
+                for fut, what in writes:
+                    print(f"[DEBUG] {what} (status {fut.status_code})")
+                    check_write(fut, what)
 
                 print(f"     [OK] {len(out_rows)} marcas → folha '{SHEET_TARGET}' escrita.")
                 ok_files += 1
@@ -366,7 +354,7 @@ def main():
                 print(f"     [ERRO] {e}")
                 errors.append((name, str(e)))
             finally:
-                close_session(token, drive_id, item_id, sess_id)
+                sessions.close(drive_id, item_id)
 
     print("\nResumo:")
     print(f"  Ficheiros encontrados: {total_files}")
@@ -375,6 +363,8 @@ def main():
         print("  Erros:")
         for fname, err in errors:
             print(f"    - {fname}: {err}")
+    sessions.close_all()
+    graph.print_stats()
 
 if __name__ == "__main__":
     main()
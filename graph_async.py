@@ -0,0 +1,237 @@
+"""
+Leitura concorrente de tabelas (asyncio).
+
+Dois modos, escolhidos com GRAPH_READ_MODE:
+- "paged" (omissão): descobre o nº de linhas da tabela (dataBodyRange.rowCount) e
+  pede as janelas $top/$skip de rows em paralelo.
+- "window": parte o endereço do dataBodyRange em blocos A1 de N linhas e lê-os com
+  range(address=...). Não sofre do $skip lento em offsets grandes nem do
+  'ResponsePayloadSizeLimitExceeded' dos rows sem paginação; N é calculado a partir
+  do nº de colunas (GRAPH_WINDOW_CELLS) e encolhe sozinho se o Graph recusar o bloco.
+
+Para ler só algumas rows (ex.: as do mês no destino), iter_table_rows_at pede
+blocos A1 apenas sobre os troços de índices seguidos.
+
+Em ambos há um limite de pedidos em voo e as linhas são entregues ao chamador pela
+ordem do índice, como dicts {"index", "values"} (iguais aos de tables/{t}/rows).
+
+Os pedidos correm em threads sobre o GraphClient partilhado (asyncio.to_thread):
+o pool keep-alive, o token e os restantes comportamentos do cliente aplicam-se
+a todas as páginas.
+"""
+import asyncio
+import math
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from graph_client import get_client
+from graph_tables import get_table_body_info, parse_a1_range, rows_url, table_url, worksheet_range_url
+
+# ========= CONFIG (ENV) =========
+READ_CONCURRENCY = int(os.getenv("GRAPH_READ_CONCURRENCY") or "4")        # pedidos em voo (1 = sequencial)
+READ_MODE        = (os.getenv("GRAPH_READ_MODE") or "paged").lower()      # "paged" | "window"
+WINDOW_CELLS     = int(os.getenv("GRAPH_WINDOW_CELLS") or "200000")       # células por bloco A1 (auto)
+WINDOW_ROWS      = int(os.getenv("GRAPH_WINDOW_ROWS") or "0")             # força N linhas por bloco (0 = auto)
+# ================================
+
+PAYLOAD_LIMIT_CODES = ("ResponsePayloadSizeLimitExceeded", "PayloadTooLarge")
+
+
+def get_table_row_count(drive_id, item_id, table_name, session_id, client=None):
+    """Nº de linhas do corpo da tabela (None se o Graph não o devolver)."""
+    client = client or get_client()
+    r = client.get(f"{table_url(drive_id, item_id, table_name)}/dataBodyRange?$select=rowCount",
+                   session_id=session_id)
+    if not r.ok:
+        print("[DEBUG][rowCount] STATUS:", r.status_code)
+        return None
+    return r.json().get("rowCount")
+
+def _is_payload_limit(r):
+    if r.status_code == 413:
+        return True
+    try:
+        return (r.json().get("error") or {}).get("code") in PAYLOAD_LIMIT_CODES
+    except Exception:
+        return False
+
+
+class AsyncTableReader:
+    """Lê páginas / blocos de uma tabela com no máximo `concurrency` pedidos em voo."""
+
+    def __init__(self, client=None, concurrency=READ_CONCURRENCY):
+        self.client = client or get_client()
+        self.concurrency = max(1, int(concurrency))
+
+    async def _ordered(self, factories):
+        """Corre as coroutines (fábricas sem argumentos) com janela limitada; resultados por ordem."""
+        window = deque()
+        pending = iter(factories)
+        try:
+            for factory in pending:
+                window.append(asyncio.ensure_future(factory()))
+                if len(window) >= self.concurrency:
+                    break
+            while window:
+                result = await window.popleft()
+                factory = next(pending, None)
+                if factory is not None:
+                    window.append(asyncio.ensure_future(factory()))
+                yield result
+        finally:
+            for t in window:
+                t.cancel()
+
+    # ---- Modo "paged": rows $top/$skip ----
+    def _get_page_sync(self, url, session_id):
+        r = self.client.get(url, session_id=session_id)
+        if not r.ok:
+            print("[DEBUG][async-paged] URL:", url)
+            print("[DEBUG][async-paged] STATUS:", r.status_code)
+            try: print("[DEBUG][async-paged] JSON:", r.json())
+            except Exception: print("[DEBUG][async-paged] TEXT:", r.text)
+            r.raise_for_status()
+        return r.json().get("value", [])
+
+    async def _get_page(self, base_url, session_id, top, skip):
+        return await asyncio.to_thread(self._get_page_sync, f"{base_url}&$top={top}&$skip={skip}", session_id)
+
+    async def iter_pages(self, drive_id, item_id, table_name, session_id, top, row_count=None):
+        """Async generator de páginas (listas de rows), por ordem de índice."""
+        base_url = rows_url(drive_id, item_id, table_name)   # só index + values
+        if row_count is None:
+            row_count = await asyncio.to_thread(get_table_row_count, drive_id, item_id, table_name,
+                                                session_id, self.client)
+        n_pages = math.ceil(row_count / top) if row_count else 0
+        print(f"[DEBUG][async-paged] rowCount={row_count} páginas={n_pages} top={top} concorrência={self.concurrency}")
+
+        factories = [lambda skip=p * top: self._get_page(base_url, session_id, top, skip) for p in range(n_pages)]
+        page = 0
+        last_len = None
+        async for batch in self._ordered(factories):
+            page += 1
+            last_len = len(batch)
+            print(f"[DEBUG][async-paged] page={page} skip={(page - 1) * top} count={len(batch)}")
+            yield batch
+
+        # Cauda: rowCount desconhecido ou a tabela cresceu entretanto → continua sequencial até página vazia
+        skip = n_pages * top
+        while last_len is None or last_len >= top:
+            batch = await self._get_page(base_url, session_id, top, skip)
+            last_len = len(batch)
+            if not batch:
+                break
+            print(f"[DEBUG][async-paged] cauda skip={skip} count={len(batch)}")
+            yield batch
+            skip += top
+
+    # ---- Modo "window": blocos A1 do dataBodyRange ----
+    def _get_window_sync(self, drive_id, item_id, session_id, sheet, col0, col1, row0, row1, first_index):
+        """Linhas row0..row1 (A1) como rows {"index", "values"}; parte o bloco ao meio se for grande demais."""
+        r = self.client.get(worksheet_range_url(drive_id, item_id, sheet, f"{col0}{row0}:{col1}{row1}"),
+                            session_id=session_id)
+        if not r.ok and _is_payload_limit(r) and row1 > row0:
+            mid = (row0 + row1) // 2
+            print(f"[DEBUG][async-window] bloco {row0}:{row1} grande demais → {row0}:{mid} + {mid + 1}:{row1}")
+            return (self._get_window_sync(drive_id, item_id, session_id, sheet, col0, col1, row0, mid, first_index)
+                    + self._get_window_sync(drive_id, item_id, session_id, sheet, col0, col1, mid + 1, row1,
+                                            first_index + (mid + 1 - row0)))
+        if not r.ok:
+            print(f"[DEBUG][async-window] {sheet}!{col0}{row0}:{col1}{row1} STATUS:", r.status_code)
+            try: print("[DEBUG][async-window] JSON:", r.json())
+            except Exception: print("[DEBUG][async-window] TEXT:", r.text)
+            r.raise_for_status()
+        values = r.json().get("values", [])
+        return [{"index": first_index + i, "values": [v]} for i, v in enumerate(values)]
+
+    async def iter_windows(self, drive_id, item_id, table_name, session_id, window_rows=WINDOW_ROWS):
+        """Async generator de blocos (listas de rows), por ordem de índice."""
+        info = await asyncio.to_thread(get_table_body_info, drive_id, item_id, table_name, session_id, self.client)
+        sheet, col0, row0, col1, row1 = parse_a1_range(info["address"])
+        n_cols = max(1, int(info.get("columnCount") or 1))
+        n_rows = int(info["rowCount"]) if info.get("rowCount") is not None else row1 - row0 + 1
+        size = window_rows or max(1, WINDOW_CELLS // n_cols)
+        n_windows = math.ceil(n_rows / size) if n_rows else 0
+        print(f"[DEBUG][async-window] {info['address']} linhas={n_rows} colunas={n_cols} "
+              f"bloco={size} blocos={n_windows} concorrência={self.concurrency}")
+
+        def factory(w):
+            start = row0 + w * size
+            end = min(row0 + n_rows - 1, start + size - 1)
+            return lambda: asyncio.to_thread(self._get_window_sync, drive_id, item_id, session_id,
+                                             sheet, col0, col1, start, end, w * size)
+
+        done = 0
+        async for batch in self._ordered([factory(w) for w in range(n_windows)]):
+            done += 1
+            print(f"[DEBUG][async-window] bloco={done}/{n_windows} count={len(batch)}")
+            yield batch
+
+    async def iter_index_windows(self, drive_id, item_id, table_name, session_id, indices, window_rows=WINDOW_ROWS):
+        """Só as rows `indices` (0-based): blocos A1 sobre cada troço de índices seguidos, por ordem."""
+        info = await asyncio.to_thread(get_table_body_info, drive_id, item_id, table_name, session_id, self.client)
+        sheet, col0, row0, col1, _ = parse_a1_range(info["address"])
+        n_cols = max(1, int(info.get("columnCount") or 1))
+        size = window_rows or max(1, WINDOW_CELLS // n_cols)
+
+        spans = []   # (primeiro, último) índice de cada bloco
+        run_start = prev = None
+        for idx in sorted(set(indices)) + [None]:
+            if idx is not None and prev is not None and idx == prev + 1:
+                prev = idx
+                continue
+            if run_start is not None:
+                spans += [(a, min(prev, a + size - 1)) for a in range(run_start, prev + 1, size)]
+            run_start = prev = idx
+        print(f"[DEBUG][async-window] {table_name}: {len(set(indices))} rows em {len(spans)} blocos "
+              f"(bloco={size}, concorrência={self.concurrency})")
+
+        factories = [lambda a=a, b=b: asyncio.to_thread(self._get_window_sync, drive_id, item_id, session_id,
+                                                        sheet, col0, col1, row0 + a, row0 + b, a)
+                     for a, b in spans]
+        async for batch in self._ordered(factories):
+            yield batch
+
+
+def _iter_sync(reader, agen, label):
+    """Consome um async generator de listas de rows num event loop privado (drop-in síncrono)."""
+    loop = asyncio.new_event_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=reader.concurrency))
+    total = 0
+    try:
+        while True:
+            try:
+                batch = loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+            total += len(batch)
+            yield from batch
+        print(f"[DEBUG][{label}] Fim leitura. total={total}")
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
+
+def iter_table_rows_concurrent(drive_id, item_id, table_name, session_id, top,
+                               concurrency=READ_CONCURRENCY, client=None):
+    """
+    Drop-in síncrono para list_table_rows_paged: gerador de rows (com 'index' e 'values'),
+    por ordem, enquanto as páginas seguintes já estão a ser pedidas em paralelo.
+    """
+    reader = AsyncTableReader(client, concurrency)
+    yield from _iter_sync(reader, reader.iter_pages(drive_id, item_id, table_name, session_id, top), "async-paged")
+
+def iter_table_rows_windows(drive_id, item_id, table_name, session_id, window_rows=WINDOW_ROWS,
+                            concurrency=READ_CONCURRENCY, client=None):
+    """Como iter_table_rows_concurrent, mas por blocos A1 do dataBodyRange (GRAPH_READ_MODE=window)."""
+    reader = AsyncTableReader(client, concurrency)
+    yield from _iter_sync(reader, reader.iter_windows(drive_id, item_id, table_name, session_id, window_rows),
+                          "async-window")
+
+def iter_table_rows_at(drive_id, item_id, table_name, session_id, indices, window_rows=WINDOW_ROWS,
+                       concurrency=READ_CONCURRENCY, client=None):
+    """Rows ({"index", "values"}) só dos índices pedidos, lidas por blocos A1 dos troços seguidos."""
+    reader = AsyncTableReader(client, concurrency)
+    yield from _iter_sync(reader, reader.iter_index_windows(drive_id, item_id, table_name, session_id, indices,
+                                                            window_rows), "async-window")
@@ -0,0 +1,124 @@
+"""
+Autenticação partilhada (MSAL client credentials) para o GraphClient.
+
+- Preguiçosa: nada é pedido ao Entra ID até à primeira chamada Graph.
+- Cache persistente: o SerializableTokenCache do MSAL é lido/gravado em
+  GRAPH_TOKEN_CACHE (se definido), para os passos seguintes do mesmo workflow
+  (ex.: GreenTape.py → PhrOrd_GreenTape.py → GreenTapeFinal.py) reutilizarem o token
+  em vez de autenticarem de novo.
+- Renovação automática: o token é renovado GRAPH_TOKEN_REFRESH_MARGIN segundos
+  antes de expirar, por isso runs longos (backfills de horas) não falham a meio.
+- GRAPH_STATIC_TOKEN: token fixo, sem MSAL (ex.: contra o graph_emulator local).
+"""
+import os
+import threading
+import time
+
+import msal
+
+# ========= CONFIG (ENV) =========
+TENANT_ID      = os.getenv("TENANT_ID")
+CLIENT_ID      = os.getenv("CLIENT_ID")
+CLIENT_SECRET  = os.getenv("CLIENT_SECRET")
+TOKEN_CACHE    = os.getenv("GRAPH_TOKEN_CACHE") or ""                           # ficheiro da cache ("" = só memória)
+REFRESH_MARGIN = float(os.getenv("GRAPH_TOKEN_REFRESH_MARGIN") or "300")        # segundos antes de expirar
+STATIC_TOKEN   = os.getenv("GRAPH_STATIC_TOKEN") or ""                          # "" = autenticar com MSAL
+# ================================
+
+GRAPH_SCOPES = ["https://graph.microsoft.com/.default"]
+
+
+class TokenProvider:
+    """Callable que devolve um bearer token válido (usado como token_provider do GraphClient)."""
+
+    def __init__(self, tenant_id=None, client_id=None, client_secret=None,
+                 cache_path=TOKEN_CACHE, scopes=GRAPH_SCOPES, refresh_margin=REFRESH_MARGIN,
+                 static_token=STATIC_TOKEN):
+        self.tenant_id = tenant_id or TENANT_ID
+        self.client_id = client_id or CLIENT_ID
+        self.client_secret = client_secret or CLIENT_SECRET
+        self.cache_path = cache_path
+        self.scopes = list(scopes)
+        self.refresh_margin = refresh_margin
+        self.static_token = static_token
+        self._cache = msal.SerializableTokenCache()
+        self._app = None
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self.acquired = 0   # nº de tokens obtidos (cache MSAL ou Entra ID)
+
+    # ---- Cache em disco ----
+    def _load_cache(self):
+        if self.cache_path and os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, "r", encoding="utf-8") as f:
+                    self._cache.deserialize(f.read())
+                print(f"[DEBUG][AUTH] Cache de tokens carregada: {self.cache_path}")
+            except Exception as e:
+                print(f"[DEBUG][AUTH] Cache de tokens ignorada ({e})")
+
+    def _save_cache(self):
+        if not self.cache_path or not self._cache.has_state_changed:
+            return
+        tmp = f"{self.cache_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self._cache.serialize())
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, self.cache_path)
+        self._cache.has_state_changed = False
+
+    def _drop_cached_access_tokens(self):
+        for at in list(self._cache.search(msal.TokenCache.CredentialType.ACCESS_TOKEN)):
+            self._cache.remove_at(at)
+
+    # ---- MSAL ----
+    def _get_app(self):
+        if self._app is None:
+            if not (self.tenant_id and self.client_id and self.client_secret):
+                raise RuntimeError("Faltam TENANT_ID / CLIENT_ID / CLIENT_SECRET para autenticar no Graph.")
+            self._load_cache()
+            self._app = msal.ConfidentialClientApplication(
+                self.client_id,
+                authority=f"https://login.microsoftonline.com/{self.tenant_id}",
+                client_credential=self.client_secret,
+                token_cache=self._cache,
+            )
+        return self._app
+
+    def _acquire(self):
+        app = self._get_app()
+        result = app.acquire_token_for_client(scopes=self.scopes)
+        if "access_token" in result and result.get("expires_in", 0) <= self.refresh_margin:
+            # token da cache a menos de `refresh_margin` de expirar → forçar um novo
+            self._drop_cached_access_tokens()
+            result = app.acquire_token_for_client(scopes=self.scopes)
+        if "access_token" not in result:
+            raise RuntimeError(f"Falha a obter token: {result.get('error')} - {result.get('error_description')}")
+        self._save_cache()
+        self._token = result["access_token"]
+        self._expires_at = time.time() + float(result.get("expires_in", 0))
+        self.acquired += 1
+        source = result.get("token_source", "identity_provider")
+        print(f"[DEBUG][AUTH] Token obtido ({source}), expira em {int(result.get('expires_in', 0))}s")
+        return self._token
+
+    def __call__(self):
+        if self.static_token:
+            return self.static_token
+        with self._lock:
+            if self._token and time.time() < self._expires_at - self.refresh_margin:
+                return self._token
+            return self._acquire()
+
+
+# ---- Provider por processo ----
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_token_provider():
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = TokenProvider()
+        return _provider
@@ -0,0 +1,164 @@
+"""
+Coalescer genérico de JSON $batch.
+
+Os chamadores enfileiram sub-pedidos Graph arbitrários (GET headers, GET worksheets,
+PATCH ranges, DELETE rows, ...) e recebem um BatchFuture para o SEU sub-pedido.
+Os pedidos são enviados em grupos de até 20 por $batch, com cadeias `dependsOn`
+opcionais (passa-se o future de que se depende). Throttling/Retry-After das
+sub-respostas é tratado pelo GraphClient.batch().
+
+Uso típico:
+    with BatchCoalescer() as b:
+        f_hdr = b.get(f"/drives/{d}/items/{i}/workbook/tables/{t}/headerRowRange", session_id=sid)
+        f_ws  = b.get(f"/drives/{d}/items/{i}/workbook/worksheets", session_id=sid)
+    headers = f_hdr.json()["values"][0]
+"""
+import requests
+
+from graph_client import GRAPH_BASE, get_client
+
+MAX_BATCH_SIZE = 20   # limite do Graph por $batch
+
+
+class BatchFuture:
+    """Resultado de um sub-pedido; resolve (faz flush) quando é consultado."""
+
+    def __init__(self, coalescer, req_id, method, url):
+        self._coalescer = coalescer
+        self.id = req_id
+        self.method = method
+        self.url = url
+        self._response = None
+
+    def _set(self, response):
+        self._response = response or {}
+
+    def done(self):
+        return self._response is not None
+
+    def result(self):
+        """Sub-resposta crua: {"id", "status", "headers", "body"}."""
+        if self._response is None:
+            self._coalescer.flush()
+        return self._response
+
+    @property
+    def status_code(self):
+        return self.result().get("status")
+
+    @property
+    def ok(self):
+        status = self.status_code
+        return status is not None and 200 <= status < 300
+
+    def json(self):
+        return self.result().get("body") or {}
+
+    @property
+    def text(self):
+        return str(self.json())
+
+    def raise_for_status(self):
+        if not self.ok:
+            err = requests.HTTPError(f"{self.status_code} em {self.method} {self.url}: {self.json()}")
+            err.status_code = self.status_code
+            raise err
+        return self
+
+
+def failed_dependency(fut, dep):
+    """Sub-resposta 424 para um sub-pedido cuja dependência (de um $batch anterior) falhou."""
+    return {"id": fut.id, "status": 424, "headers": {},
+            "body": {"error": {"code": "FailedDependency",
+                               "message": f"Dependência {dep.method} {dep.url} falhou (status {dep.status_code})"}}}
+
+
+class BatchCoalescer:
+    """
+    Enfileira sub-pedidos e envia-os em $batch de até `max_size`.
+
+    - Faz flush automático quando a fila enche, e no fim do `with`.
+    - `depends_on=[future, ...]` gera `dependsOn`; se a dependência já foi enviada
+      num $batch anterior, o sub-pedido só segue se ela teve sucesso; senão não é
+      enviado e resolve com um 424 (FailedDependency) sintético, como no Graph.
+    """
+
+    def __init__(self, client=None, max_size=MAX_BATCH_SIZE):
+        self.client = client or get_client()
+        self.max_size = max(1, min(MAX_BATCH_SIZE, int(max_size)))
+        self._pending = []   # [(future, request_dict, [futures de que depende])]
+        self._next_id = 1
+        self.round_trips = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
+
+    # ---- Enfileirar ----
+    def add(self, method, url, body=None, session_id=None, headers=None, depends_on=None):
+        rel_url = url[len(GRAPH_BASE):] if url.startswith(GRAPH_BASE) else url
+        fut = BatchFuture(self, str(self._next_id), method, rel_url)
+        self._next_id += 1
+
+        req = {"id": fut.id, "method": method, "url": rel_url}
+        h = dict(headers or {})
+        if session_id:
+            h["workbook-session-id"] = session_id
+        if body is not None:
+            req["body"] = body
+            h.setdefault("Content-Type", "application/json")
+        if h:
+            req["headers"] = h
+
+        self._pending.append((fut, req, list(depends_on or [])))
+        if len(self._pending) >= self.max_size:
+            self.flush()
+        return fut
+
+    def get(self, url, **kwargs):
+        return self.add("GET", url, **kwargs)
+
+    def post(self, url, body=None, **kwargs):
+        return self.add("POST", url, body=body, **kwargs)
+
+    def patch(self, url, body=None, **kwargs):
+        return self.add("PATCH", url, body=body, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.add("DELETE", url, **kwargs)
+
+    # ---- Envio ----
+    def flush(self):
+        while self._pending:
+            group = self._pending[:self.max_size]
+            self._pending = self._pending[self.max_size:]
+            in_group = {fut.id for fut, _, _ in group}
+
+            requests_list = []
+            sent = []
+            failed = set()   # ids deste grupo que não seguem (dependência falhada)
+            for fut, req, deps in group:
+                bad = [d for d in deps if d.id in failed or (d.id not in in_group and not d.ok)]
+                if bad:
+                    failed.add(fut.id)
+                    fut._set(failed_dependency(fut, bad[0]))
+                    continue
+                dep_ids = [d.id for d in deps if d.id in in_group]
+                if dep_ids:
+                    req = dict(req, dependsOn=dep_ids)
+                requests_list.append(req)
+                sent.append(fut)
+            if failed:
+                print(f"[DEBUG][BATCH] {len(failed)} subpedidos não enviados (dependência falhada → 424)")
+            if not requests_list:
+                continue
+
+            print(f"[DEBUG][BATCH] POST $batch subpedidos={len(requests_list)}")
+            self.round_trips += 1
+            responses = self.client.batch(requests_list)
+            for fut, resp in zip(sent, responses):
+                fut._set(resp)
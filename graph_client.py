@@ -0,0 +1,316 @@
+"""
+Cliente HTTP partilhado para o Microsoft Graph.
+
+Todos os scripts passam por aqui em vez de chamarem requests.get/post/delete
+diretamente: um único requests.Session com pool de ligações keep-alive (evita um
+handshake TLS por pedido), Authorization / workbook-session-id injetados por
+chamada e timeouts por omissão. Cada pedido passa também pelo governador de
+throttling do processo (graph_throttle) e pelas repetições / circuit breaker de
+falhas transitórias (graph_retry), e fica registado nas métricas por endpoint
+(graph_metrics).
+"""
+import json
+import os
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+from graph_auth import get_token_provider
+from graph_metrics import body_size, classify, classify_batch, get_metrics, response_size
+from graph_retry import (RETRY_STATUSES, get_retry_controller, is_idempotent, is_positional,
+                         is_retryable_error)
+from graph_throttle import (THROTTLE_MAX_RETRIES, THROTTLE_STATUSES, get_governor,
+                            header_value, parse_retry_after)
+
+GRAPH_BASE = (os.getenv("GRAPH_BASE") or "https://graph.microsoft.com/v1.0").rstrip("/")   # ex.: emulador local (graph_emulator)
+
+# ========= CONFIG (ENV) =========
+POOL_SIZE       = int(os.getenv("GRAPH_POOL_SIZE") or "16")           # ligações keep-alive por host
+CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT") or "10")   # segundos
+READ_TIMEOUT    = float(os.getenv("GRAPH_READ_TIMEOUT") or "300")     # segundos (rows/add grandes são lentos)
+# ================================
+
+
+class GraphClient:
+    """
+    Transporte pooled para o Graph.
+
+    - `token_provider`: callable que devolve o bearer token, chamado a cada pedido (ou usar
+      set_token()). O cliente do processo (get_client) usa o graph_auth: autenticação só no
+      1.º pedido, cache de tokens persistente e renovação antes de expirar.
+    - URLs relativas ("/sites/...") são prefixadas com GRAPH_BASE; absolutas passam tal e qual.
+    - `session_id=` acrescenta o header workbook-session-id só a essa chamada.
+    - Headers explícitos do chamador (ex.: Authorization, Content-Type) têm prioridade.
+    - 429/503 (com Retry-After) são tratados aqui: o governador pausa o processo todo
+      e o pedido é repetido até `max_throttle_retries` vezes.
+    - 500/502/504 e erros de rede são repetidos com back-off (até `max_retries`), dentro do
+      orçamento do endpoint e do circuit breaker do workbook (graph_retry).
+    """
+
+    def __init__(self, token_provider=None, pool_size=POOL_SIZE,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), base_url=GRAPH_BASE, governor=None, retrier=None,
+                 metrics=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._token_provider = token_provider
+        self.governor = governor or get_governor()
+        self.retrier = retrier or get_retry_controller()
+        self.metrics = metrics or get_metrics()
+        self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self.session.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
+        self.requests_sent = 0
+
+    # ---- Auth ----
+    def set_token(self, token):
+        self._token_provider = lambda: token
+
+    def auth_header(self):
+        if self._token_provider is None:
+            raise RuntimeError("GraphClient sem token: chama set_token() ou passa token_provider.")
+        return {"Authorization": f"Bearer {self._token_provider()}"}
+
+    # ---- Pedidos ----
+    def url(self, path):
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}{path}"
+
+    def build_headers(self, session_id=None, headers=None):
+        h = {}
+        if not headers or "Authorization" not in headers:
+            h.update(self.auth_header())
+        if session_id:
+            h["workbook-session-id"] = session_id
+        if headers:
+            h.update(headers)
+        return h
+
+    def request(self, method, url, session_id=None, headers=None, timeout=None,
+                max_throttle_retries=THROTTLE_MAX_RETRIES, max_retries=None, cost=1, endpoint=None,
+                idempotent=None, **kwargs):
+        """
+        `cost` = nº de pedidos que o Graph contabiliza (um $batch de 20 conta 20).
+        `max_retries` = repetições de 5xx/rede deste pedido (None = GRAPH_RETRY_MAX).
+        `endpoint` = (nome lógico, fase) para as métricas (None = graph_metrics.classify).
+        `idempotent` = se um 5xx / ligação cortada pode ser repetido (None = graph_retry.is_idempotent).
+        """
+        h = self.build_headers(session_id, headers)
+        full_url = self.url(url)
+        if idempotent is None:
+            idempotent = is_idempotent(method, full_url)
+        name, phase = endpoint or classify(method, full_url)
+        bytes_out = body_size(kwargs)
+        self.retrier.count_request(method, full_url)
+        attempt = 0
+        retries = 0
+        delay = 0.0
+        while True:
+            self.retrier.before_request(full_url)
+            waited = self.governor.acquire(cost)
+            if waited:
+                self.metrics.record_wait(name, phase, throttle=waited)
+            self.requests_sent += 1
+            t0 = time.monotonic()
+            try:
+                r = self.session.request(method, full_url, headers=h,
+                                         timeout=timeout or self.timeout, **kwargs)
+            except requests.RequestException as e:
+                self.metrics.record(name, phase, None, time.monotonic() - t0, bytes_out)
+                if not is_retryable_error(method, e, idempotent):
+                    raise
+                self.retrier.on_failure(method, full_url)
+                delay = self.retrier.next_delay(method, full_url, retries, delay, max_retries)
+                if delay is None:
+                    raise
+                print(f"[DEBUG][RETRY] {method} {type(e).__name__}; a repetir em {delay:.1f}s")
+                self.retrier.wait(delay)
+                self.metrics.record_wait(name, phase, retry=delay, retried=True)
+                retries += 1
+                continue
+            self.metrics.record(name, phase, r.status_code, time.monotonic() - t0, bytes_out,
+                                response_size(r, kwargs.get("stream", False)))
+
+            if r.status_code in RETRY_STATUSES:
+                self.retrier.on_failure(method, full_url)
+                if not idempotent:
+                    return r   # a escrita pode já ter sido aplicada: decide o chamador
+                delay = self.retrier.next_delay(method, full_url, retries, delay, max_retries)
+                if delay is None:
+                    return r
+                print(f"[DEBUG][RETRY] {method} {r.status_code}; a repetir em {delay:.1f}s")
+                r.close()
+                self.retrier.wait(delay)
+                self.metrics.record_wait(name, phase, retry=delay, retried=True)
+                retries += 1
+                continue
+            if r.status_code not in THROTTLE_STATUSES:
+                self.retrier.on_success(full_url)
+                self.governor.on_success()
+                return r
+            if r.status_code == 503:
+                self.retrier.on_failure(method, full_url)   # 503 em rajada também conta para o breaker
+            self.governor.on_throttle(parse_retry_after(r.headers.get("Retry-After")))
+            if attempt >= max_throttle_retries:
+                return r
+            r.close()   # liberta a ligação (respostas em stream=True ficam presas ao socket)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    # ---- JSON $batch ----
+    def batch(self, requests_list, max_throttle_retries=THROTTLE_MAX_RETRIES):
+        """
+        POST /$batch (até 20 sub-pedidos) e devolve as sub-respostas pela ordem dos pedidos.
+
+        Sub-respostas 429/503 alimentam o governador (Retry-After da sub-resposta) e só
+        esses sub-pedidos são re-enviados, juntamente com os que falharam com 424 por
+        dependerem deles (dependsOn). Sub-respostas 500/502/504 são repetidas com o
+        back-off / orçamento do graph_retry, só se forem idempotentes; o $batch em si só
+        se repete após um 5xx se todos os sub-pedidos o forem. Se o próprio $batch falhar
+        → requests.HTTPError.
+
+        Sub-pedidos que endereçam rows por posição (ItemAt, rows/{n}, range delete) só
+        são re-enviados se o lote estiver encadeado com dependsOn: sem ordem garantida,
+        os outros deletes do lote já correram e o mesmo índice aponta para outra row.
+        Nesse caso a falha fica na sub-resposta, para o chamador (sweep) reler a tabela.
+        """
+        pending = {str(req["id"]): req for req in requests_list}
+        results = {}
+        attempt = 0
+        retries = 0
+        delay = 0.0
+        endpoint = classify_batch(requests_list)
+        chained = all(req.get("dependsOn") for req in requests_list[1:])
+        while pending:
+            body = {"requests": [_strip_done_dependencies(req, pending) for req in pending.values()]}
+            r = self.post("/$batch", data=json.dumps(body), cost=len(pending),
+                          max_throttle_retries=max_throttle_retries, endpoint=endpoint,
+                          idempotent=all(is_idempotent(req.get("method", "GET"), req.get("url", ""))
+                                         for req in pending.values()))
+            if not r.ok:
+                r.raise_for_status()
+
+            responses = {str(e.get("id")): e for e in r.json().get("responses", [])}
+            resend = {rid for rid in responses if rid in pending
+                      and (chained or not is_positional(pending[rid].get("url", "")))}
+            retry_ids = set()
+            retry_after = 0.0
+            throttled = 0
+            for rid, e in responses.items():
+                if e.get("status") in THROTTLE_STATUSES:
+                    throttled += 1
+                    retry_after = max(retry_after, parse_retry_after(header_value(e.get("headers"), "Retry-After")))
+                    if attempt < max_throttle_retries and rid in resend:
+                        retry_ids.add(rid)
+            transient = [rid for rid, e in responses.items() if e.get("status") in RETRY_STATUSES and rid in resend
+                         and is_idempotent(pending[rid].get("method", "GET"), pending[rid].get("url", ""))]
+            wait = None
+            if transient:
+                sub = pending[transient[0]]
+                sub_url = self.url(sub.get("url", ""))
+                self.retrier.on_failure(sub.get("method", "GET"), sub_url)
+                wait = self.retrier.next_delay(sub.get("method", "GET"), sub_url, retries, delay)
+                if wait is not None:
+                    retry_ids.update(transient)
+            if retry_ids:
+                # 424 (FailedDependency) de quem dependia de um sub-pedido throttled → repetir também
+                changed = bool(retry_ids)
+                while changed:
+                    changed = False
+                    for rid, e in responses.items():
+                        deps = pending.get(rid, {}).get("dependsOn") or []
+                        if rid not in retry_ids and e.get("status") == 424 and retry_ids.intersection(map(str, deps)):
+                            retry_ids.add(rid)
+                            changed = True
+
+            for rid, e in responses.items():
+                if rid not in retry_ids:
+                    results[rid] = e
+            if throttled:
+                print(f"[DEBUG][BATCH] {throttled} sub-pedidos throttled; {len(retry_ids)} a repetir após {retry_after:.1f}s")
+                self.governor.on_throttle(retry_after)
+                attempt += 1
+            if wait is not None:
+                print(f"[DEBUG][BATCH] {len(transient)} sub-pedidos com 5xx; a repetir em {wait:.1f}s")
+                self.retrier.wait(wait)
+                self.metrics.record_wait(*endpoint, retry=wait, retried=True)
+                delay = wait
+                retries += 1
+            pending = {rid: pending[rid] for rid in pending if rid in retry_ids}
+
+        return [results.get(str(req["id"]), {"id": str(req["id"]), "status": None, "body": {}})
+                for req in requests_list]
+
+    # ---- Estatísticas do pool ----
+    def connection_stats(self):
+        """
+        Pedidos enviados vs. ligações TCP/TLS abertas (contadores do urllib3 por pool).
+        reused = pedidos que aproveitaram uma ligação keep-alive já aberta.
+        """
+        pools = self._adapter.poolmanager.pools
+        opened = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+        return {
+            "requests": self.requests_sent,
+            "connections_opened": opened,
+            "connections_reused": max(0, self.requests_sent - opened),
+        }
+
+    def print_stats(self):
+        s = self.connection_stats()
+        print(f"[DEBUG][POOL] pedidos={s['requests']} ligações_abertas={s['connections_opened']} "
+              f"reutilizadas={s['connections_reused']}")
+        t = self.governor.stats()
+        print(f"[DEBUG][THROTTLE] throttled={t['throttled']} espera_total={t['wait_seconds']}s "
+              f"ritmo_final={t['rate']} req/s")
+        x = self.retrier.stats()
+        print(f"[DEBUG][RETRY] repetições={x['retries']} falhas={x['failures']} espera={x['retry_wait_seconds']}s "
+              f"breaker={x['breaker_trips']} ({x['breaker_wait_seconds']}s) orçamento_esgotado={x['budget_exhausted']}")
+        for ep, c in list(x["by_endpoint"].items())[:5]:
+            print(f"[DEBUG][RETRY]   {ep}: pedidos={c['requests']} repetições={c['retries']} falhas={c['failures']}")
+
+    def close(self):
+        self.session.close()
+
+
+def _strip_done_dependencies(req, pending):
+    """Um sub-pedido re-enviado não pode depender de ids que já não vão no mesmo $batch."""
+    deps = req.get("dependsOn")
+    if not deps:
+        return req
+    req = dict(req)
+    kept = [d for d in deps if str(d) in pending]
+    if kept:
+        req["dependsOn"] = kept
+    else:
+        req.pop("dependsOn")
+    return req
+
+
+# ---- Cliente por processo (partilhado por todas as helpers) ----
+_client = None
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = GraphClient(token_provider=get_token_provider())
+    return _client
@@ -0,0 +1,103 @@
+"""
+Representação colunar (NumPy) das rows no caminho ler → filtrar → reordenar → escrever.
+
+Com milhares de rows, manter listas de linhas e reordenar célula a célula
+(reorder_values_by_headers) custa tempo e memória. Aqui as rows lidas vão, página a
+página, para um array por coluna (dtype object: os valores ficam os mesmos objetos
+que o Graph devolveu), com os cabeçalhos como esquema:
+- a coluna de data passa a um array float64 de nºs de série Excel (NaN sem data),
+  com um graph_dates.DateParser;
+- filtrar é uma máscara booleana (aplicada por bloco, antes de transpor para
+  colunas, ou depois sobre as colunas), reordenar é escolher colunas;
+- o payload de rows/add sai de fatias das colunas (table[a:b] → lista de rows),
+  sem nunca existir a lista completa de rows reordenadas.
+
+Uma ColumnTable comporta-se como uma lista de rows só de leitura (len, [i], [a:b],
+iteração), por isso serve diretamente aos inserts em chunks, ao diff e ao índice local.
+
+Uso:
+    def in_range(block):
+        s = EXCEL_DATES.serials([r[date_idx] for r in block], column=(item_id, table, date_idx))
+        return (s >= lo) & (s < hi)
+    table = ColumnTable.from_rows(rows_values, src_headers, keep=in_range)
+    to_import = table.select(dst_headers)
+"""
+import os
+
+import numpy as np
+
+from graph_dates import day_ordinals, object_array
+
+# ========= CONFIG (ENV) =========
+COLUMNAR   = (os.getenv("SYNC_COLUMNAR") or "0") == "1"    # "1" = caminho colunar (NumPy) nos syncs
+ROW_BLOCK  = int(os.getenv("COLUMNAR_ROW_BLOCK") or "5000")  # rows por bloco ao converter para colunas
+# ================================
+
+
+class ColumnTable:
+    """Cabeçalhos + um array (dtype object) por coluna, todos com o mesmo nº de rows."""
+
+    def __init__(self, headers, columns):
+        self.headers = list(headers)
+        self.columns = list(columns)
+        self._len = len(self.columns[0]) if self.columns else 0
+
+    @classmethod
+    def from_rows(cls, rows, headers, keep=None, block=ROW_BLOCK):
+        """
+        `rows`: iterável de listas de valores (ordem de `headers`); rows curtas levam None.
+        `keep`: bloco de rows → máscara booleana; só as rows marcadas passam a colunas
+        (filtrar antes de transpor: numa origem com vários meses fica só o intervalo).
+        """
+        n = len(headers)
+        cols = [[] for _ in range(n)]
+        buf = []
+
+        def flush():
+            kept = buf if keep is None else [buf[i] for i in np.flatnonzero(keep(buf))]
+            for lst, col in zip(cols, zip(*kept)):
+                lst.extend(col)
+            buf.clear()
+
+        for vals in rows:
+            buf.append(vals if len(vals) == n else (list(vals) + [None] * n)[:n])
+            if len(buf) >= block:
+                flush()
+        if buf:
+            flush()
+        return cls(headers, [object_array(c) for c in cols])
+
+    # ---- Lista de rows (só leitura) ----
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [list(r) for r in zip(*(c[key].tolist() for c in self.columns))]
+        return [c[key] for c in self.columns]
+
+    def __iter__(self):
+        for start in range(0, self._len, ROW_BLOCK):
+            yield from self[start:start + ROW_BLOCK]
+
+    # ---- Operações por coluna ----
+    def take(self, mask_or_indices):
+        """Rows selecionadas (máscara booleana ou índices), pela mesma ordem."""
+        return ColumnTable(self.headers, [c[mask_or_indices] for c in self.columns])
+
+    def select(self, headers):
+        """Colunas pela ordem de `headers` (match exato; as que faltarem ficam a None)."""
+        pos = {name: i for i, name in enumerate(self.headers)}
+        cols = []
+        for name in headers:
+            i = pos.get(name)
+            cols.append(self.columns[i] if i is not None else object_array([None] * self._len))
+        return ColumnTable(headers, cols)
+
+    def date_serials(self, col_idx, parser, column=None):
+        """Nºs de série (float64, NaN sem data) da coluna, com um graph_dates.DateParser (`column`: chave da coluna)."""
+        return parser.serials(self.columns[col_idx], column=column)
+
+    def day_ordinals(self, col_idx, parser, column=None):
+        """Dia (date.toordinal) de cada célula, ou None sem data."""
+        return day_ordinals(self.date_serials(col_idx, parser, column=column))
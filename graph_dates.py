@@ -0,0 +1,160 @@
+"""
+Datas do Excel por coluna: formato inferido uma vez, conversão da coluna inteira.
+
+excel_value_to_date / parse_date_any tratam célula a célula e, em cada texto, tentam
+os formatos strptime um a um dentro de try/except. Em 24 meses de histórico isso pesa.
+Aqui uma coluna (lista de valores) é convertida de uma vez para nºs de série Excel:
+- números (nºs de série) passam a float64 numa única conversão do array;
+- textos: o formato é escolhido, por coluna, numa amostra dos textos distintos (o da
+  lista que interpreta mais, por ordem) e cada texto distinto é interpretado uma única
+  vez, com memo por coluna entre chamadas (numa coluna de datas repetem-se muito);
+  colunas com formatos diferentes não partilham formato nem memo;
+- o que o formato escolhido não interpretar vai para o parser célula a célula do
+  script (fallback), também memorizado. Com formatos que não se sobrepõem (caso das
+  listas dos scripts) o resultado é o mesmo do fallback.
+
+O resultado é um array float64 (NaN sem data): filtrar por corte / janela é comparar
+o array com date_to_serial(limite).
+
+Uso:
+    EXCEL_DATES = DateParser(("%Y-%m-%d", "%d/%m/%Y"), fallback=excel_value_to_date)
+    serials = EXCEL_DATES.serials(column_values, column=(item_id, "Historico", date_idx))
+    old = serials < date_to_serial(cutoff)
+    EXCEL_DATES.release((item_id, "Historico", date_idx))    # fim do job
+"""
+import os
+import threading
+from datetime import date, datetime
+
+import numpy as np
+
+# ========= CONFIG (ENV) =========
+DATE_SAMPLE_SIZE = int(os.getenv("DATE_SAMPLE_SIZE") or "200")       # textos distintos para inferir o formato
+DATE_MEMO_MAX    = int(os.getenv("DATE_MEMO_MAX") or "200000")       # textos memorizados por coluna
+# ================================
+
+EXCEL_EPOCH = datetime(1899, 12, 30)
+EXCEL_EPOCH_ORDINAL = EXCEL_EPOCH.toordinal()
+NUMBER_TYPES = (int, float, bool)
+
+
+def date_to_serial(d):
+    """date / datetime (naive ou com fuso) → nº de série Excel (dias desde 1899-12-30, com fração)."""
+    if isinstance(d, datetime):
+        epoch = EXCEL_EPOCH.replace(tzinfo=d.tzinfo)
+        return (d - epoch).total_seconds() / 86400.0
+    return float(d.toordinal() - EXCEL_EPOCH_ORDINAL)
+
+def serial_to_date(serial):
+    return date.fromordinal(EXCEL_EPOCH_ORDINAL + int(np.floor(serial)))
+
+def day_ordinals(serials):
+    """Dia (date.toordinal) de cada nº de série, ou None sem data."""
+    days = np.floor(serials) + EXCEL_EPOCH_ORDINAL
+    return [None if d != d else int(d) for d in days.tolist()]
+
+def object_array(values):
+    """Array 1-D dtype object (np.array de strings daria dtype '<U', de listas um 2-D)."""
+    a = np.empty(len(values), dtype=object)
+    a[:] = values
+    return a
+
+def _strptime(s, fmt):
+    try:
+        return datetime.strptime(s, fmt)
+    except (TypeError, ValueError):
+        return None
+
+
+class DateColumn:
+    """Formato inferido e memo de UMA coluna de datas (texto distinto → nº de série)."""
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.format = None                # escolhido na primeira amostra com textos desta coluna
+        self.memo = {}
+        self.lock = threading.Lock()
+
+    def infer(self, texts):
+        """Escolhe o formato que interpreta mais textos da amostra (empate → o primeiro da lista)."""
+        sample = [t for t in texts if isinstance(t, str)][:self.parser.sample_size]
+        best, best_n = None, 0
+        for fmt in self.parser.formats:
+            n = sum(1 for t in sample if _strptime(t, fmt) is not None)
+            if n > best_n:
+                best, best_n = fmt, n
+            if n == len(sample):
+                break
+        self.format = best
+        print(f"[DEBUG][DATES] Formato inferido: {best!r} ({best_n}/{len(sample)} textos da amostra)")
+        return best
+
+    def parse_text(self, v):
+        d = _strptime(v, self.format) if self.format and isinstance(v, str) else None
+        if d is None and self.parser.fallback is not None and v is not None:
+            self.parser.fallbacks += 1
+            d = self.parser.fallback(v)
+        return date_to_serial(d) if d is not None else np.nan
+
+    def serials(self, texts):
+        """float64 com o nº de série de cada valor não numérico (lista)."""
+        with self.lock:
+            memo = self.memo
+            distinct = dict.fromkeys(texts)
+            new = [v for v in distinct if v not in memo]
+            if new:
+                if self.format is None and any(isinstance(v, str) for v in new):
+                    self.infer(new)
+                if len(memo) + len(new) > self.parser.memo_max:
+                    memo.clear()
+                    new = list(distinct)
+                for v in new:
+                    memo[v] = self.parse_text(v)
+            return np.fromiter((memo[v] for v in texts), dtype=np.float64, count=len(texts))
+
+
+class DateParser:
+    """
+    Conversor de colunas de datas: formatos candidatos + fallback célula a célula.
+    O formato e o memo são de cada coluna: `column` (ex. (item, tabela, coluna)) guarda-os
+    entre chamadas até release(column); sem `column`, valem só para essa chamada.
+    """
+
+    def __init__(self, formats, fallback=None, sample_size=DATE_SAMPLE_SIZE, memo_max=DATE_MEMO_MAX):
+        self.formats = tuple(formats)
+        self.fallback = fallback          # valor → date / datetime ou None (o parser célula a célula)
+        self.sample_size = sample_size
+        self.memo_max = memo_max          # textos memorizados por coluna
+        self._columns = {}
+        self._lock = threading.Lock()
+        self.fallbacks = 0
+
+    def column(self, key):
+        with self._lock:
+            col = self._columns.get(key)
+            if col is None:
+                col = self._columns[key] = DateColumn(self)
+            return col
+
+    def keys(self):
+        with self._lock:
+            return list(self._columns)
+
+    def release(self, *keys):
+        """Esquece formato e memo destas colunas (ex. no fim de um job)."""
+        with self._lock:
+            for key in keys:
+                self._columns.pop(key, None)
+
+    def serials(self, values, column=None):
+        """float64 com o nº de série de cada valor (NaN sem data)."""
+        col = values if isinstance(values, np.ndarray) else object_array(values)
+        if set(map(type, col)) <= set(NUMBER_TYPES):
+            return col.astype(np.float64)   # caso normal: só nºs de série
+        is_num = np.fromiter((isinstance(v, NUMBER_TYPES) for v in col), dtype=bool, count=len(col))
+        out = np.full(len(col), np.nan)
+        out[is_num] = col[is_num].astype(np.float64)
+        other = np.flatnonzero(~is_num)
+        state = self.column(column) if column is not None else DateColumn(self)
+        out[other] = state.serials(col[other].tolist())
+        return out
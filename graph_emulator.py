@@ -0,0 +1,825 @@
+"""
+Emulador local do subconjunto do Microsoft Graph usado pelos scripts (benchmarks e
+testes de regressão sem tenant).
+
+Cobre:
+- sites / drives / items por caminho (root:/…), children e upload /content; cada item
+  tem eTag / cTag / lastModifiedDateTime, que mudam a cada escrita no ficheiro;
+- workbook: createSession / refreshSession / closeSession;
+- tabelas: headerRowRange (GET/PATCH), rows ($top/$skip), rows/add,
+  rows/$/ItemAt(index=n) DELETE, columns, columns/itemAt(index=n)/dataBodyRange,
+  dataBodyRange (+ /clear), range (+ /clear), sort/apply;
+- folhas: worksheets (list / add / delete), range(address=…) GET/PATCH/delete/clear,
+  usedRange;
+- JSON $batch (até 20 sub-pedidos, dependsOn → 424).
+
+Configurável (env ou EmulatorConfig): latência por pedido e por KB, limites de payload
+(pedido / resposta, como o Excel Online), 429 com Retry-After e 504 injetados com uma
+probabilidade — antes de executar, ou (GRAPH_EMULATOR_APPLIED_ERROR_RATE) depois de
+aplicar um delete, como um timeout do gateway com a escrita já feita. Tudo em memória:
+as "células" são valores JSON, não há fórmulas.
+
+Uso:
+    python graph_emulator.py                       # serve em GRAPH_EMULATOR_PORT
+    GRAPH_BASE=http://127.0.0.1:8765/v1.0 GRAPH_STATIC_TOKEN=emulador python Rutura_de_Stocks.py
+
+    emu = GraphEmulator()
+    emu.add_workbook("/General/x.xlsx", tables={"T": {"headers": [...], "rows": [...]}})
+    with emu:                                      # servidor numa thread, porta livre
+        os.environ["GRAPH_BASE"] = emu.base_url
+
+O ficheiro GRAPH_EMULATOR_SEED (JSON) pré-carrega ficheiros:
+    {"files": {"/General/x.xlsx": {"tables": {"T": {"sheet": "Folha1", "origin": "A1",
+                                                    "headers": [...], "rows": [[...]]}},
+                                   "sheets": {"Resumo": [[...], ...]}}}}
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ========= CONFIG (ENV) =========
+EMULATOR_HOST          = os.getenv("GRAPH_EMULATOR_HOST") or "127.0.0.1"
+EMULATOR_PORT          = int(os.getenv("GRAPH_EMULATOR_PORT") or "8765")
+EMULATOR_SEED          = os.getenv("GRAPH_EMULATOR_SEED") or ""                              # JSON com ficheiros iniciais
+LATENCY_MS             = float(os.getenv("GRAPH_EMULATOR_LATENCY_MS") or "0")               # por pedido
+LATENCY_PER_KB_MS      = float(os.getenv("GRAPH_EMULATOR_LATENCY_PER_KB_MS") or "0")        # por KB pedido + resposta
+MAX_REQUEST_BYTES      = int(os.getenv("GRAPH_EMULATOR_MAX_REQUEST_BYTES") or str(4 * 1024 * 1024))
+MAX_RESPONSE_BYTES     = int(os.getenv("GRAPH_EMULATOR_MAX_RESPONSE_BYTES") or str(5 * 1024 * 1024))
+THROTTLE_RATE          = float(os.getenv("GRAPH_EMULATOR_THROTTLE_RATE") or "0")            # prob. de 429
+RETRY_AFTER            = float(os.getenv("GRAPH_EMULATOR_RETRY_AFTER") or "1")              # segundos
+ERROR_RATE             = float(os.getenv("GRAPH_EMULATOR_ERROR_RATE") or "0")               # prob. de 504
+APPLIED_ERROR_RATE     = float(os.getenv("GRAPH_EMULATOR_APPLIED_ERROR_RATE") or "0")       # prob. de 504 após um delete
+RANDOM_SEED            = os.getenv("GRAPH_EMULATOR_RANDOM_SEED") or None
+# ================================
+
+BATCH_LIMIT = 20
+
+
+class GraphError(Exception):
+    def __init__(self, status, code, message=""):
+        super().__init__(message or code)
+        self.status = status
+        self.code = code
+        self.message = message or code
+
+    def body(self):
+        return {"error": {"code": self.code, "message": self.message}}
+
+
+class EmulatorConfig:
+    def __init__(self, latency_ms=LATENCY_MS, latency_per_kb_ms=LATENCY_PER_KB_MS,
+                 max_request_bytes=MAX_REQUEST_BYTES, max_response_bytes=MAX_RESPONSE_BYTES,
+                 throttle_rate=THROTTLE_RATE, retry_after=RETRY_AFTER, error_rate=ERROR_RATE,
+                 applied_error_rate=APPLIED_ERROR_RATE, random_seed=RANDOM_SEED):
+        self.latency_ms = latency_ms
+        self.latency_per_kb_ms = latency_per_kb_ms
+        self.max_request_bytes = max_request_bytes
+        self.max_response_bytes = max_response_bytes
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.applied_error_rate = applied_error_rate
+        self.random_seed = random_seed
+
+
+# ---- A1 ----
+def col_letter(c):
+    """0 → "A", 26 → "AA"."""
+    s = ""
+    c += 1
+    while c:
+        c, rem = divmod(c - 1, 26)
+        s = chr(65 + rem) + s
+    return s
+
+def col_index(letters):
+    n = 0
+    for ch in letters.upper():
+        n = n * 26 + (ord(ch) - 64)
+    return n - 1
+
+def parse_address(address):
+    """"Folha!A2:C10" / "A2:C10" / "B3" → (folha ou None, r0, c0, r1, c1) com linhas 1-based e colunas 0-based."""
+    sheet = None
+    if "!" in address:
+        sheet, address = address.rsplit("!", 1)
+        sheet = sheet[1:-1].replace("''", "'") if sheet.startswith("'") else sheet
+    start, end = (address.split(":") + [address])[:2]
+    m1 = re.fullmatch(r"\$?([A-Za-z]+)\$?(\d+)", start.strip())
+    m2 = re.fullmatch(r"\$?([A-Za-z]+)\$?(\d+)", end.strip())
+    if not (m1 and m2):
+        raise GraphError(400, "InvalidArgument", f"Endereço inválido: {address}")
+    r0, r1 = sorted((int(m1.group(2)), int(m2.group(2))))
+    c0, c1 = sorted((col_index(m1.group(1)), col_index(m2.group(1))))
+    return sheet, r0, c0, r1, c1
+
+def sheet_ref(name):
+    return name if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_.]*", name) else "'" + name.replace("'", "''") + "'"
+
+def format_address(sheet, r0, c0, r1, c1):
+    return f"{sheet_ref(sheet)}!{col_letter(c0)}{r0}:{col_letter(c1)}{r1}"
+
+def _sort_key(v):
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return (0, v)
+    return (1, str(v).lower())
+
+def _is_blank(v):
+    return v is None or v == ""
+
+
+# ---- Modelo do workbook ----
+class Table:
+    def __init__(self, name, sheet, headers, rows=(), origin_row=1, origin_col=0):
+        self.id = "{" + str(uuid.uuid4()).upper() + "}"
+        self.name = name
+        self.sheet = sheet
+        self.headers = list(headers)
+        self.rows = [self._fit(r) for r in rows]
+        self.origin_row = origin_row
+        self.origin_col = origin_col
+
+    def _fit(self, row):
+        row = list(row)
+        if len(row) != len(self.headers):
+            raise GraphError(400, "InvalidArgument",
+                             f"A linha tem {len(row)} valores; a tabela {self.name} tem {len(self.headers)} colunas.")
+        return row
+
+    @property
+    def n_cols(self):
+        return len(self.headers)
+
+    def last_col(self):
+        return self.origin_col + self.n_cols - 1
+
+    def body_bounds(self):
+        """(r0, c0, r1, c1) do corpo; uma tabela vazia mantém uma linha de corpo (como no Excel)."""
+        r0 = self.origin_row + 1
+        return r0, self.origin_col, r0 + max(1, len(self.rows)) - 1, self.last_col()
+
+    def contains(self, r, c):
+        _, _, r1, c1 = self.body_bounds()
+        return self.origin_row <= r <= r1 and self.origin_col <= c <= c1
+
+    def get(self, r, c):
+        c -= self.origin_col
+        if r == self.origin_row:
+            return self.headers[c]
+        i = r - self.origin_row - 1
+        return self.rows[i][c] if i < len(self.rows) else ""
+
+    def set(self, r, c, v):
+        c -= self.origin_col
+        if r == self.origin_row:
+            self.headers[c] = "" if v is None else v
+            return
+        i = r - self.origin_row - 1
+        if i >= len(self.rows):
+            self.rows.append([""] * self.n_cols)
+        self.rows[i][c] = v
+
+
+class Worksheet:
+    def __init__(self, name, position):
+        self.id = "{" + str(uuid.uuid4()).upper() + "}"
+        self.name = name
+        self.position = position
+        self.cells = {}     # (linha 1-based, coluna 0-based) -> valor
+        self.tables = []
+
+    def as_dict(self):
+        return {"id": self.id, "name": self.name, "position": self.position, "visibility": "Visible"}
+
+    def _table_at(self, r, c):
+        for t in self.tables:
+            if t.contains(r, c):
+                return t
+        return None
+
+    def get(self, r, c):
+        t = self._table_at(r, c)
+        return t.get(r, c) if t else self.cells.get((r, c), "")
+
+    def set(self, r, c, v):
+        t = self._table_at(r, c)
+        if t:
+            t.set(r, c, v)
+        elif _is_blank(v):
+            self.cells.pop((r, c), None)
+        else:
+            self.cells[(r, c)] = v
+
+    def values(self, r0, c0, r1, c1):
+        return [[self.get(r, c) for c in range(c0, c1 + 1)] for r in range(r0, r1 + 1)]
+
+    def used_bounds(self):
+        coords = [k for k, v in self.cells.items() if not _is_blank(v)]
+        for t in self.tables:
+            _, _, r1, c1 = t.body_bounds()
+            coords += [(t.origin_row, t.origin_col), (r1, c1)]
+        if not coords:
+            return None
+        rows = [r for r, _ in coords]
+        cols = [c for _, c in coords]
+        return min(rows), min(cols), max(rows), max(cols)
+
+    def delete_shift_up(self, r0, c0, r1, c1):
+        n = r1 - r0 + 1
+        for t in self.tables:
+            br0, bc0, br1, bc1 = t.body_bounds()
+            if c0 <= bc0 and c1 >= bc1 and br0 <= r0 <= br1:
+                # linhas inteiras do corpo da tabela → apagar rows
+                first = r0 - br0
+                del t.rows[first:first + n]
+        moved = {}
+        for (r, c), v in self.cells.items():
+            if c0 <= c <= c1 and r >= r0:
+                if r > r1:
+                    moved[(r - n, c)] = v
+            else:
+                moved[(r, c)] = v
+        self.cells = moved
+
+
+class Workbook:
+    def __init__(self):
+        self.worksheets = []
+        self.tables = []
+        self.sessions = {}   # id -> persistChanges
+
+    def add_worksheet(self, name):
+        if self.find_worksheet(name, by_name_only=True):
+            raise GraphError(409, "ItemAlreadyExists", f"Já existe uma folha '{name}'.")
+        ws = Worksheet(name, len(self.worksheets))
+        self.worksheets.append(ws)
+        return ws
+
+    def find_worksheet(self, key, by_name_only=False):
+        for ws in self.worksheets:
+            if ws.name == key or (not by_name_only and ws.id == key):
+                return ws
+        return None
+
+    def worksheet(self, key):
+        ws = self.find_worksheet(key)
+        if ws is None:
+            raise GraphError(404, "ItemNotFound", f"Folha '{key}' não existe.")
+        return ws
+
+    def delete_worksheet(self, key):
+        ws = self.worksheet(key)
+        self.worksheets.remove(ws)
+        self.tables = [t for t in self.tables if t.sheet is not ws]
+        for i, w in enumerate(self.worksheets):
+            w.position = i
+
+    def add_table(self, name, sheet_name, headers, rows=(), origin="A1"):
+        ws = self.find_worksheet(sheet_name, by_name_only=True) or self.add_worksheet(sheet_name)
+        _, r0, c0, _, _ = parse_address(origin)
+        t = Table(name, ws, headers, rows, r0, c0)
+        self.tables.append(t)
+        ws.tables.append(t)
+        return t
+
+    def table(self, key):
+        for t in self.tables:
+            if t.name == key or t.id == key:
+                return t
+        raise GraphError(404, "ItemNotFound", f"Tabela '{key}' não existe.")
+
+
+class DriveItem:
+    def __init__(self, item_id, name, path, folder=False):
+        self.id = item_id
+        self.name = name
+        self.path = path
+        self.folder = folder
+        self.content = b""
+        self.workbook = None
+        self.children = []
+        self.version = 1
+        self.modified = time.time()
+
+    def touch(self):
+        """Conteúdo alterado → nova versão (eTag / cTag / lastModifiedDateTime)."""
+        self.version += 1
+        self.modified = time.time()
+
+    def as_dict(self):
+        d = {"id": self.id, "name": self.name,
+             "eTag": f'"{{{self.id}}},{self.version}"', "cTag": f'"c:{{{self.id}}},{self.version}"',
+             "lastModifiedDateTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.modified))}
+        if self.folder:
+            d["folder"] = {"childCount": len(self.children)}
+        else:
+            d["file"] = {"mimeType": "application/octet-stream"}
+            d["size"] = len(self.content)
+        return d
+
+
+def _range_body(sheet, r0, c0, r1, c1):
+    return {
+        "address": format_address(sheet.name, r0, c0, r1, c1),
+        "rowCount": r1 - r0 + 1,
+        "columnCount": c1 - c0 + 1,
+        "values": sheet.values(r0, c0, r1, c1),
+    }
+
+def _select(obj, query):
+    """Aplica $select a um objeto ou a cada elemento de {"value": [...]}."""
+    fields = query.get("$select")
+    if not fields or not isinstance(obj, dict):
+        return obj
+    keep = {f.strip() for f in fields.split(",")}
+
+    def pick(d):
+        return {k: v for k, v in d.items() if k in keep or k.startswith("@odata")}
+    if isinstance(obj.get("value"), list):
+        return {**obj, "value": [pick(x) if isinstance(x, dict) else x for x in obj["value"]]}
+    return pick(obj)
+
+
+# ---- Emulador ----
+class GraphEmulator:
+    def __init__(self, config=None, seed_path=EMULATOR_SEED):
+        self.config = config or EmulatorConfig()
+        self.random = random.Random(self.config.random_seed)
+        self.drive_id = "b!emulador-drive"
+        self._items = {}                # id -> DriveItem
+        self._paths = {}                # caminho normalizado -> DriveItem
+        self._next_id = 0
+        self._lock = threading.RLock()
+        self._server = None
+        self._thread = None
+        self.root = self._new_item("root", "/", folder=True)
+        # contadores
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.by_route = {}
+        if seed_path:
+            self.load_seed(seed_path)
+
+    # ---- Drive ----
+    @staticmethod
+    def _norm(path):
+        return "/" + urllib.parse.unquote(path).strip("/")
+
+    def _new_item(self, name, path, folder=False):
+        self._next_id += 1
+        item = DriveItem(f"EMU{self._next_id:08d}", name, path, folder)
+        self._items[item.id] = item
+        self._paths[path] = item
+        return item
+
+    def _ensure_path(self, path, folder=False):
+        path = self._norm(path)
+        if path in self._paths:
+            return self._paths[path]
+        parent_path, _, name = path.rpartition("/")
+        parent = self._ensure_path(parent_path or "/", folder=True)
+        item = self._new_item(name, path, folder)
+        parent.children.append(item)
+        return item
+
+    def add_file(self, path, content=b""):
+        with self._lock:
+            item = self._ensure_path(path)
+            item.content = content
+            item.touch()
+            return item
+
+    def remove_file(self, path):
+        """Apaga o ficheiro; voltar a criá-lo no mesmo caminho dá-lhe outro id (como no SharePoint)."""
+        with self._lock:
+            item = self._paths.pop(self._norm(path))
+            del self._items[item.id]
+            parent = self._paths[self._norm(path).rpartition("/")[0] or "/"]
+            parent.children.remove(item)
+
+    def add_workbook(self, path, tables=None, sheets=None):
+        """tables = {nome: {"headers", "rows", "sheet"?, "origin"?}}; sheets = {nome: valores 2D a partir de A1}."""
+        with self._lock:
+            item = self._ensure_path(path)
+            wb = item.workbook = item.workbook or Workbook()
+            for name, values in (sheets or {}).items():
+                ws = wb.find_worksheet(name, by_name_only=True) or wb.add_worksheet(name)
+                for r, row in enumerate(values, start=1):
+                    for c, v in enumerate(row):
+                        ws.set(r, c, v)
+            for name, spec in (tables or {}).items():
+                wb.add_table(name, spec.get("sheet") or f"Folha{len(wb.worksheets) + 1}",
+                             spec["headers"], spec.get("rows", ()), spec.get("origin", "A1"))
+            item.touch()
+            return item
+
+    def load_seed(self, seed_path):
+        with open(seed_path, "r", encoding="utf-8") as f:
+            seed = json.load(f)
+        for path, spec in (seed.get("files") or {}).items():
+            self.add_workbook(path, spec.get("tables"), spec.get("sheets"))
+        print(f"[DEBUG][EMU] Seed carregada: {seed_path} ({len(seed.get('files') or {})} ficheiros)")
+
+    def workbook(self, path):
+        item = self._paths.get(self._norm(path))
+        return item.workbook if item else None
+
+    def table_values(self, path, table):
+        """Cópia das linhas de uma tabela (para verificar resultados)."""
+        with self._lock:
+            return [list(r) for r in self.workbook(path).table(table).rows]
+
+    def _item(self, item_id):
+        item = self._items.get(item_id)
+        if item is None:
+            raise GraphError(404, "itemNotFound", f"Item {item_id} não existe.")
+        return item
+
+    def _item_by_path(self, path):
+        item = self._paths.get(self._norm(path))
+        if item is None:
+            raise GraphError(404, "itemNotFound", f"Caminho {path} não existe.")
+        return item
+
+    def _workbook(self, item_id):
+        item = self._item(item_id)
+        if item.workbook is None:
+            if not item.name.lower().endswith((".xlsx", ".xlsm")):
+                raise GraphError(400, "InvalidRequest", f"{item.name} não é um workbook.")
+            item.workbook = Workbook()
+            item.workbook.add_worksheet("Folha1")
+        return item.workbook
+
+    # ---- Pedidos ----
+    def handle(self, method, raw_path, body=None, headers=None, top_level=True):
+        """Devolve (status, headers, corpo JSON ou bytes). Usado pelo servidor e pelo $batch."""
+        headers = headers or {}
+        with self._lock:
+            self.requests += 1
+        if self.config.throttle_rate and self.random.random() < self.config.throttle_rate:
+            with self._lock:
+                self.throttled += 1
+            return 429, {"Retry-After": str(self.config.retry_after)}, \
+                {"error": {"code": "TooManyRequests", "message": "Emulador: throttled."}}
+        if top_level and self.config.error_rate and self.random.random() < self.config.error_rate:
+            with self._lock:
+                self.errors += 1
+            return 504, {}, {"error": {"code": "GatewayTimeout", "message": "Emulador: 504 injetado."}}
+
+        path, _, qs = raw_path.partition("?")
+        path = re.sub(r"^/(v1\.0|beta)", "", path)
+        query = {k: v[-1] for k, v in urllib.parse.parse_qs(qs, keep_blank_values=True).items()}
+        try:
+            with self._lock:
+                status, out_headers, result = self._route(method.upper(), urllib.parse.unquote(path), query,
+                                                          body, headers)
+        except GraphError as e:
+            return e.status, {}, e.body()
+        if (self.config.applied_error_rate and status < 300 and (method.upper() == "DELETE" or path.endswith("/delete"))
+                and self.random.random() < self.config.applied_error_rate):
+            with self._lock:
+                self.errors += 1
+            return 504, {}, {"error": {"code": "GatewayTimeout", "message": "Emulador: 504 depois do delete."}}
+        if isinstance(result, dict):
+            result = _select(result, query)
+            if method.upper() == "GET" and len(json.dumps(result)) > self.config.max_response_bytes:
+                return 413, {}, {"error": {"code": "ResponsePayloadSizeLimitExceeded",
+                                           "message": "Emulador: resposta acima do limite."}}
+        return status, out_headers, result
+
+    def _count(self, route):
+        self.by_route[route] = self.by_route.get(route, 0) + 1
+
+    def _route(self, method, path, query, body, headers):
+        if method == "POST" and path == "/$batch":
+            self._count("$batch")
+            return self._batch(body)
+
+        m = re.fullmatch(r"/sites/([^/]+):/(.+)", path)
+        if m and method == "GET":
+            self._count("site")
+            return 200, {}, {"id": f"{m.group(1)},{uuid.uuid5(uuid.NAMESPACE_URL, path)}", "name": m.group(2)}
+        m = re.fullmatch(r"/sites/([^/]+)/drive(?:/root:(.*?))?:?", path)
+        if m and method == "GET":
+            self._count("drive" if m.group(2) is None else "item by path")
+            if m.group(2) is None:
+                return 200, {}, {"id": self.drive_id, "driveType": "documentLibrary"}
+            return 200, {}, self._item_by_path(m.group(2)).as_dict()
+
+        m = re.fullmatch(r"/drives/([^/]+)/root:(.*?):/content", path)
+        if m and method == "PUT":
+            self._count("upload")
+            existed = self._norm(m.group(2)) in self._paths
+            item = self._ensure_path(m.group(2))
+            item.content = body if isinstance(body, (bytes, bytearray)) else json.dumps(body).encode("utf-8")
+            item.touch()
+            return (200 if existed else 201), {}, item.as_dict()
+        m = re.fullmatch(r"/drives/([^/]+)/root:(.*?):?", path)
+        if m and method == "GET":
+            self._count("item by path")
+            return 200, {}, self._item_by_path(m.group(2)).as_dict()
+        m = re.fullmatch(r"/drives/([^/]+)/items/([^/]+)(/children)?", path)
+        if m and method == "GET":
+            item = self._item(m.group(2))
+            if m.group(3):
+                self._count("children")
+                return 200, {}, {"value": [c.as_dict() for c in item.children]}
+            self._count("item")
+            return 200, {}, item.as_dict()
+
+        m = re.fullmatch(r"/drives/([^/]+)/items/([^/]+)/workbook(/.*)?", path)
+        if m:
+            return self._workbook_route(method, m.group(2), m.group(3) or "", query, body, headers)
+        raise GraphError(400, "BadRequest", f"Emulador: rota não suportada {method} {path}")
+
+    # ---- Workbook ----
+    def _workbook_route(self, method, item_id, rest, query, body, headers):
+        wb = self._workbook(item_id)
+        body = body if isinstance(body, dict) else {}
+        if method != "GET" and rest not in ("/createSession", "/refreshSession", "/closeSession"):
+            self._item(item_id).touch()   # escrita no workbook → nova versão do ficheiro
+
+        if rest in ("/createSession", "/refreshSession", "/closeSession") and method == "POST":
+            self._count(rest[1:])
+            if rest == "/createSession":
+                sid = "emu-session-" + uuid.uuid4().hex
+                wb.sessions[sid] = bool(body.get("persistChanges", True))
+                return 201, {}, {"id": sid, "persistChanges": wb.sessions[sid]}
+            sid = {k.lower(): v for k, v in headers.items()}.get("workbook-session-id")
+            if rest == "/closeSession":
+                wb.sessions.pop(sid, None)
+            return 204, {}, None
+
+        if rest == "/tables" and method == "GET":
+            self._count("tables")
+            return 200, {}, {"value": [{"id": t.id, "name": t.name, "showHeaders": True} for t in wb.tables]}
+        m = re.fullmatch(r"/tables/([^/]+)(/.*)?", rest)
+        if m:
+            return self._table_route(method, wb.table(m.group(1)), m.group(2) or "", query, body)
+
+        if rest == "/worksheets" and method == "GET":
+            self._count("worksheets")
+            return 200, {}, {"value": [ws.as_dict() for ws in wb.worksheets]}
+        if rest == "/worksheets/add" and method == "POST":
+            self._count("worksheet add")
+            return 201, {}, wb.add_worksheet(body.get("name") or f"Folha{len(wb.worksheets) + 1}").as_dict()
+        m = re.fullmatch(r"/worksheets/([^/]+)(/.*)?", rest)
+        if m:
+            return self._worksheet_route(method, wb, m.group(1), m.group(2) or "", body)
+        raise GraphError(400, "BadRequest", f"Emulador: rota de workbook não suportada {method} {rest}")
+
+    def _table_route(self, method, t, rest, query, body):
+        ws = t.sheet
+        if rest == "" and method == "GET":
+            self._count("table")
+            return 200, {}, {"id": t.id, "name": t.name, "showHeaders": True}
+
+        if rest == "/headerRowRange":
+            r, c0, c1 = t.origin_row, t.origin_col, t.last_col()
+            if method == "PATCH":
+                self._count("header PATCH")
+                self._patch_values(ws, r, c0, r, c1, body.get("values"))
+            else:
+                self._count("header read")
+            return 200, {}, _range_body(ws, r, c0, r, c1)
+
+        if rest in ("/dataBodyRange", "/range") and method == "GET":
+            self._count("dataBodyRange read" if rest == "/dataBodyRange" else "table range read")
+            r0, c0, r1, c1 = t.body_bounds()
+            if rest == "/range":
+                r0 = t.origin_row
+            body_out = _range_body(ws, r0, c0, r1, c1)
+            body_out["rowCount"] = len(t.rows) + (1 if rest == "/range" else 0)
+            if not t.rows:
+                body_out["values"] = body_out["values"][:1 if rest == "/range" else 0]
+            return 200, {}, body_out
+        if rest in ("/dataBodyRange/clear", "/range/clear") and method == "POST":
+            self._count("clear")
+            for row in t.rows:
+                row[:] = [""] * t.n_cols
+            if rest == "/range/clear":
+                t.headers = [f"Column{i + 1}" for i in range(t.n_cols)]
+            return 204, {}, None
+
+        if rest == "/rows" and method == "GET":
+            self._count("rows page")
+            skip = int(query.get("$skip") or 0)
+            top = query.get("$top")
+            end = len(t.rows) if top in (None, "") else skip + int(top)
+            return 200, {}, {"value": [{"index": i, "values": [list(t.rows[i])]}
+                                       for i in range(skip, min(end, len(t.rows)))]}
+        if rest == "/rows/add" and method == "POST":
+            self._count("rows/add")
+            values = body.get("values") or []
+            rows = [t._fit(v) for v in values]
+            index = body.get("index")
+            index = len(t.rows) if index is None else int(index)
+            t.rows[index:index] = rows
+            return 201, {}, {"index": index, "values": values}
+        m = re.fullmatch(r"/rows/(?:\$/)?(?:itemAt\(index=(\d+)\)|(\d+))", rest, re.IGNORECASE)
+        if m:
+            i = int(m.group(1) or m.group(2))
+            if i >= len(t.rows):
+                raise GraphError(404, "ItemNotFound", f"Row {i} não existe (tabela com {len(t.rows)}).")
+            if method == "DELETE":
+                self._count("row delete")
+                del t.rows[i]
+                return 204, {}, None
+            self._count("row read")
+            return 200, {}, {"index": i, "values": [list(t.rows[i])]}
+
+        if rest == "/columns" and method == "GET":
+            self._count("columns")
+            return 200, {}, {"value": [{"id": str(i + 1), "name": h, "index": i,
+                                        "values": [[h]] + [[row[i]] for row in t.rows]}
+                                       for i, h in enumerate(t.headers)]}
+        m = re.fullmatch(r"/columns/itemAt\(index=(\d+)\)/dataBodyRange", rest, re.IGNORECASE)
+        if m and method == "GET":
+            self._count("column read")
+            i = int(m.group(1))
+            if i >= t.n_cols:
+                raise GraphError(404, "ItemNotFound", f"Coluna {i} não existe.")
+            r0, _, r1, _ = t.body_bounds()
+            out = _range_body(ws, r0, t.origin_col + i, r1, t.origin_col + i)
+            out["values"] = [[row[i]] for row in t.rows]
+            out["rowCount"] = len(t.rows)
+            return 200, {}, out
+
+        if rest == "/sort/apply" and method == "POST":
+            self._count("sort")
+            for field in reversed(body.get("fields") or []):
+                k = int(field.get("key", 0))
+                filled = [r for r in t.rows if not _is_blank(r[k])]
+                blank = [r for r in t.rows if _is_blank(r[k])]
+                filled.sort(key=lambda r: _sort_key(r[k]), reverse=not field.get("ascending", True))
+                t.rows = filled + blank   # vazios ficam no fim, como no Excel
+            return 204, {}, None
+        raise GraphError(400, "BadRequest", f"Emulador: rota de tabela não suportada {method} {rest}")
+
+    def _patch_values(self, ws, r0, c0, r1, c1, values):
+        if values is None:
+            return
+        if len(values) != r1 - r0 + 1 or any(len(row) != c1 - c0 + 1 for row in values):
+            raise GraphError(400, "InvalidArgument", "As dimensões de 'values' não batem certo com o range.")
+        for i, row in enumerate(values):
+            for j, v in enumerate(row):
+                ws.set(r0 + i, c0 + j, v)
+
+    def _worksheet_route(self, method, wb, key, rest, body):
+        ws = wb.worksheet(key)
+        if rest == "":
+            if method == "DELETE":
+                self._count("worksheet delete")
+                wb.delete_worksheet(key)
+                return 204, {}, None
+            self._count("worksheet")
+            return 200, {}, ws.as_dict()
+
+        m = re.fullmatch(r"/usedRange(?:\(valuesOnly=(?:true|false)\))?", rest, re.IGNORECASE)
+        if m and method == "GET":
+            self._count("usedRange")
+            bounds = ws.used_bounds() or (1, 0, 1, 0)
+            return 200, {}, _range_body(ws, *bounds)
+
+        m = re.fullmatch(r"/range\(address='([^']*)'\)(/delete|/clear)?", rest)
+        if m:
+            _, r0, c0, r1, c1 = parse_address(m.group(1))
+            action = m.group(2)
+            if action == "/delete" and method == "POST":
+                self._count("range delete")
+                if (body.get("shift") or "Up").lower() != "up":
+                    raise GraphError(400, "NotImplemented", "Emulador: só shift=Up.")
+                ws.delete_shift_up(r0, c0, r1, c1)
+                return 204, {}, None
+            if action == "/clear" and method == "POST":
+                self._count("range clear")
+                self._patch_values(ws, r0, c0, r1, c1, [[""] * (c1 - c0 + 1) for _ in range(r1 - r0 + 1)])
+                return 204, {}, None
+            if method == "PATCH":
+                self._count("range PATCH")
+                self._patch_values(ws, r0, c0, r1, c1, body.get("values"))
+                return 200, {}, _range_body(ws, r0, c0, r1, c1)
+            if method == "GET":
+                self._count("range read")
+                return 200, {}, _range_body(ws, r0, c0, r1, c1)
+        raise GraphError(400, "BadRequest", f"Emulador: rota de folha não suportada {method} {rest}")
+
+    # ---- $batch ----
+    def _batch(self, body):
+        reqs = (body or {}).get("requests") or []
+        if len(reqs) > BATCH_LIMIT:
+            raise GraphError(400, "BadRequest", f"Um $batch aceita no máximo {BATCH_LIMIT} pedidos.")
+        done = {}
+        responses = []
+        for req in reqs:
+            rid = str(req.get("id"))
+            failed_dep = [d for d in (req.get("dependsOn") or []) if done.get(str(d), 500) >= 400]
+            if failed_dep:
+                status, hdrs, out = 424, {}, {"error": {"code": "FailedDependency",
+                                                        "message": f"Dependência {failed_dep[0]} falhou."}}
+            else:
+                # o lock é reentrante: os sub-pedidos correm em série, como no Graph com dependsOn
+                status, hdrs, out = self.handle(req.get("method", "GET"), req.get("url", ""), req.get("body"),
+                                                req.get("headers") or {}, top_level=False)
+            done[rid] = status
+            resp = {"id": rid, "status": status, "headers": {"Content-Type": "application/json", **hdrs}}
+            if out is not None:
+                resp["body"] = out
+            responses.append(resp)
+        return 200, {}, {"responses": responses}
+
+    # ---- Servidor HTTP ----
+    def _handler_class(self):
+        emulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                cfg = emulator.config
+                if length > cfg.max_request_bytes and not self.path.endswith(":/content"):
+                    status, hdrs, out = 413, {}, {"error": {"code": "RequestEntityTooLarge",
+                                                            "message": "Emulador: pedido acima do limite."}}
+                else:
+                    ctype = (self.headers.get("Content-Type") or "").lower()
+                    body = raw
+                    if raw and "json" in ctype:
+                        try:
+                            body = json.loads(raw)
+                        except ValueError:
+                            body = None
+                    status, hdrs, out = emulator.handle(self.command, self.path, body, dict(self.headers.items()))
+                payload = b"" if out is None else (out if isinstance(out, (bytes, bytearray))
+                                                   else json.dumps(out).encode("utf-8"))
+                delay = cfg.latency_ms + cfg.latency_per_kb_ms * (len(raw) + len(payload)) / 1024
+                if delay > 0:
+                    time.sleep(delay / 1000)
+                self.send_response(status)
+                for k, v in hdrs.items():
+                    self.send_header(k, v)
+                if payload:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                if payload:
+                    self.wfile.write(payload)
+
+            do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _serve
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self, host=EMULATOR_HOST, port=0):
+        """Arranca o servidor numa thread (port=0 → porta livre); devolve o base URL."""
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="graph-emulator", daemon=True)
+        self._thread.start()
+        print(f"[DEBUG][EMU] Graph emulado em {self.base_url}")
+        return self.base_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1.0"
+
+    def __enter__(self):
+        if self._server is None:
+            self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def stats(self):
+        return {"requests": self.requests, "throttled": self.throttled, "errors": self.errors,
+                "by_route": dict(sorted(self.by_route.items(), key=lambda kv: -kv[1]))}
+
+
+if __name__ == "__main__":
+    emu = GraphEmulator()
+    emu.start(EMULATOR_HOST, EMULATOR_PORT)
+    print(f"[DEBUG][EMU] export GRAPH_BASE={emu.base_url} GRAPH_STATIC_TOKEN=emulador")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        emu.stop()
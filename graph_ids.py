@@ -0,0 +1,167 @@
+"""
+Resolução de IDs Graph (site / drive / item) com cache em disco.
+
+Os IDs do site, do drive e dos ficheiros praticamente nunca mudam, mas todos os
+scripts os pediam no arranque (e o GreenTapeFinal várias vezes por run). Aqui:
+- os IDs ficam em GRAPH_ID_CACHE (JSON) durante GRAPH_ID_CACHE_TTL segundos,
+  partilhados por todos os scripts / passos do mesmo runner;
+- os que faltam são resolvidos de uma vez: o site (se faltar) e depois drive +
+  todos os caminhos num único $batch;
+- os item ids vindos da cache são confirmados uma vez por processo (um $batch de
+  GET items/{id}?$select=id): um ficheiro recriado / substituído no SharePoint tem
+  outro id, e o antigo dá 404 itemNotFound em todas as chamadas até expirar o TTL.
+  Esses caminhos saem da cache e são resolvidos outra vez no mesmo run.
+
+Uso:
+    site_id, drive_id, (src_id, dst_id) = resolve_ids(SITE_HOSTNAME, SITE_PATH, [SRC_FILE_PATH, DST_FILE_PATH])
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from graph_batch import BatchCoalescer
+from graph_client import get_client
+
+# ========= CONFIG (ENV) =========
+ID_CACHE     = os.getenv("GRAPH_ID_CACHE") or os.path.join(tempfile.gettempdir(), "graph_id_cache.json")
+ID_CACHE_TTL = float(os.getenv("GRAPH_ID_CACHE_TTL") or "86400")   # segundos (0 = sem cache em disco)
+ID_VERIFY    = (os.getenv("GRAPH_ID_VERIFY") or "1") != "0"        # "0" = confiar na cache sem confirmar
+# ================================
+
+
+class IdResolver:
+    """Mapeia hostname/site path/caminho no drive → IDs, com TTL e persistência em disco."""
+
+    def __init__(self, cache_path=ID_CACHE, ttl=ID_CACHE_TTL, client=None, verify=ID_VERIFY):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.client = client or get_client()
+        self.verify = verify
+        self._verified = set()   # item ids confirmados (ou resolvidos) neste processo
+        self._entries = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # ---- Cache em disco ----
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            if self.ttl > 0 and self.cache_path and os.path.exists(self.cache_path):
+                try:
+                    with open(self.cache_path, "r", encoding="utf-8") as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"[DEBUG][IDS] Cache de IDs ignorada ({e})")
+        return self._entries
+
+    def _save(self):
+        if self.ttl <= 0 or not self.cache_path:
+            return
+        tmp = f"{self.cache_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self.cache_path)
+
+    def _get(self, key):
+        e = self._load().get(key)
+        if e and time.time() - e.get("ts", 0) < self.ttl:
+            self.hits += 1
+            return e["id"]
+        self.misses += 1
+        return None
+
+    def _put(self, key, value):
+        self._load()[key] = {"id": value, "ts": time.time()}
+
+    @staticmethod
+    def _site_key(hostname, site_path):
+        return f"site:{hostname}:/{site_path}"
+
+    @staticmethod
+    def _drive_key(site_id):
+        return f"drive:{site_id}"
+
+    @staticmethod
+    def _item_key(drive_id, path):
+        return f"item:{drive_id}:{path}"
+
+    # ---- Resolução ----
+    def resolve(self, hostname, site_path, paths=()):
+        """Devolve (site_id, drive_id, [item_id por cada caminho, pela mesma ordem])."""
+        paths = ["/" + p.strip("/") for p in paths]   # aceita "General/x.xlsx" ou "/General/x.xlsx"
+        with self._lock:
+            dirty = False
+            site_id = self._get(self._site_key(hostname, site_path))
+            if site_id is None:
+                r = self.client.get(f"/sites/{hostname}:/{site_path}")
+                r.raise_for_status()
+                site_id = r.json()["id"]
+                self._put(self._site_key(hostname, site_path), site_id)
+                dirty = True
+
+            drive_id = self._get(self._drive_key(site_id))
+            items = {}
+            if drive_id is not None:
+                for p in paths:
+                    item_id = self._get(self._item_key(drive_id, p))
+                    if item_id is not None:
+                        items[p] = item_id
+            stale = self._stale_items(drive_id, items) if drive_id is not None else []
+            for p in stale:
+                print(f"[DEBUG][IDS] {p}: item id da cache já não existe (ficheiro recriado?); a resolver de novo")
+                del items[p]
+                self._load().pop(self._item_key(drive_id, p), None)
+            missing = [p for p in dict.fromkeys(paths) if p not in items]
+
+            if drive_id is None or missing:
+                # drive + caminhos em falta num único $batch (só precisam do site_id)
+                with BatchCoalescer(self.client) as b:
+                    f_drive = b.get(f"/sites/{site_id}/drive?$select=id") if drive_id is None else None
+                    f_items = {p: b.get(f"/sites/{site_id}/drive/root:{urllib.parse.quote(p)}?$select=id")
+                               for p in missing}
+                if f_drive is not None:
+                    drive_id = f_drive.raise_for_status().json()["id"]
+                    self._put(self._drive_key(site_id), drive_id)
+                for p, fut in f_items.items():
+                    items[p] = fut.raise_for_status().json()["id"]
+                    self._put(self._item_key(drive_id, p), items[p])
+                    self._verified.add(items[p])
+                dirty = True
+
+            if dirty:
+                self._save()
+            print(f"[DEBUG][IDS] site={site_id} drive={drive_id} caminhos={len(paths)} "
+                  f"(cache: {self.hits} hits, {self.misses} misses)")
+            return site_id, drive_id, [items[p] for p in paths]
+
+    def _stale_items(self, drive_id, items):
+        """Caminhos cujo item id (da cache, ainda não confirmado) dá 404 itemNotFound."""
+        todo = {p: i for p, i in items.items() if i not in self._verified}
+        if not self.verify or not todo:
+            return []
+        with BatchCoalescer(self.client) as b:
+            futures = {p: b.get(f"/drives/{drive_id}/items/{i}?$select=id") for p, i in todo.items()}
+        stale = []
+        for p, fut in futures.items():
+            if fut.status_code == 404:
+                stale.append(p)
+            elif fut.ok:
+                self._verified.add(todo[p])
+        return stale
+
+
+# ---- Resolver por processo ----
+_resolver = None
+
+def get_resolver():
+    global _resolver
+    if _resolver is None:
+        _resolver = IdResolver()
+    return _resolver
+
+def resolve_ids(hostname, site_path, paths=()):
+    return get_resolver().resolve(hostname, site_path, paths)
@@ -0,0 +1,192 @@
+"""
+Índice local (SQLite) das tabelas de destino: por row, a data e o fingerprint.
+
+Para saber que rows apagar, cada run lia a coluna de data (ou a tabela inteira) do
+Historico; o modo diff lia ainda as rows do mês. Como só os nossos jobs escrevem
+nestas tabelas, o estado no fim de um run é o estado no início do seguinte:
+- por tabela guarda-se a data de cada row (pela ordem das rows) e o fingerprint
+  dos valores quando é conhecido (rows que inserimos ou lemos);
+- no arranque, o índice só é usado se o eTag do workbook e o nº de rows da tabela
+  forem os gravados no fim do run anterior (um $batch para todos os destinos);
+  senão o job faz a leitura normal e o índice é reconstruído a partir dela;
+- durante o job o índice acompanha as escritas (apagar / inserir) e é gravado no
+  fim, com o eTag pós-run, só se o job correu bem e o nº de rows bate certo.
+
+Alterações feitas por terceiros durante um run não são detetadas (o eTag gravado já
+as inclui); o Excel Online pode ainda mudar o eTag depois de fechar a sessão, o que
+só custa uma leitura completa no run seguinte.
+
+Uso:
+    index = get_table_index()
+    versions = fetch_table_versions(drive_id, [(dst_id, DST_TABLE)])
+    snap = index.load(drive_id, dst_id, DST_TABLE, DATE_COLUMN, *versions[(dst_id, DST_TABLE)])
+    ...
+    index.save(snap, etag, row_count)
+"""
+import array
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from graph_batch import BatchCoalescer
+from graph_client import GRAPH_BASE
+
+# ========= CONFIG (ENV) =========
+INDEX_ENABLED = (os.getenv("GRAPH_INDEX") or "1") != "0"                  # "0" = sem índice local
+INDEX_PATH    = os.getenv("GRAPH_INDEX_PATH") or os.path.join(tempfile.gettempdir(), "graph_table_index.sqlite")
+# ================================
+
+FP_SIZE = 16
+NO_DAY = -1                 # row sem data reconhecida
+NO_FP = bytes(FP_SIZE)      # fingerprint desconhecido
+
+
+# ---- Fingerprints ----
+def normalize_cell(v):
+    """Valor comparável entre o que se envia (rows/add) e o que o Excel devolve depois."""
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+def row_fingerprint(values):
+    payload = json.dumps([normalize_cell(v) for v in values], ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=FP_SIZE).digest()
+
+
+class TableSnapshot:
+    """Estado conhecido de uma tabela: dia (ordinal da data, ou NO_DAY) e fingerprint por row."""
+
+    def __init__(self, key, date_column, days=None, fps=None, valid=False):
+        self.key = key
+        self.date_column = date_column
+        self.days = days if days is not None else array.array("i")
+        self.fps = fps if fps is not None else []
+        self.valid = valid
+
+    def __len__(self):
+        return len(self.days)
+
+    def month_indices(self, first_day, last_day):
+        lo, hi = first_day.toordinal(), last_day.toordinal()
+        return [i for i, d in enumerate(self.days) if lo <= d <= hi]
+
+    def observe_days(self, days):
+        """Datas lidas da tabela (verdade atual); fingerprints só se mantêm se nada mudou."""
+        days = array.array("i", (NO_DAY if d is None else d for d in days))
+        if not (self.valid and days == self.days):
+            self.fps = [None] * len(days)
+        self.days = days
+        self.valid = True
+
+    def invalidate(self):
+        """Posições deixaram de ser fiáveis (ex.: sort, deletes sem ordem garantida)."""
+        self.valid = False
+
+    def delete(self, indices):
+        drop = set(indices)
+        self.days = array.array("i", (d for i, d in enumerate(self.days) if i not in drop))
+        self.fps = [f for i, f in enumerate(self.fps) if i not in drop]
+
+    def delete_block(self, first, count):
+        del self.days[first:first + count]
+        del self.fps[first:first + count]
+
+    def append(self, days, fps):
+        self.days.extend(NO_DAY if d is None else d for d in days)
+        self.fps.extend(fps)
+
+    def set_fps(self, by_index):
+        for i, fp in by_index.items():
+            self.fps[i] = fp
+
+    def known_fps(self, indices):
+        return {i: self.fps[i] for i in indices if self.fps[i] is not None}
+
+
+class TableIndex:
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS snapshots (
+                              key TEXT PRIMARY KEY, etag TEXT, row_count INTEGER, date_column TEXT,
+                              days BLOB, fps BLOB, updated REAL)""")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def table_key(drive_id, item_id, table_name):
+        return f"{drive_id}:{item_id}:{table_name}"
+
+    def load(self, drive_id, item_id, table_name, date_column, etag, row_count):
+        """Snapshot válido se o eTag e o nº de rows baterem com o run anterior; senão um vazio (inválido)."""
+        key = self.table_key(drive_id, item_id, table_name)
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT etag, row_count, date_column, days, fps FROM snapshots WHERE key = ?",
+                             (key,)).fetchone()
+        if row is None:
+            print(f"[DEBUG][INDEX] {table_name}: sem índice local")
+            return TableSnapshot(key, date_column)
+        s_etag, s_rows, s_col, days_blob, fps_blob = row
+        if etag is None or s_etag != etag or s_rows != row_count or s_col != date_column:
+            print(f"[DEBUG][INDEX] {table_name}: índice desatualizado (eTag/rows/coluna mudaram fora dos jobs)")
+            return TableSnapshot(key, date_column)
+        days = array.array("i")
+        days.frombytes(days_blob)
+        fps = [fps_blob[i:i + FP_SIZE] for i in range(0, len(fps_blob), FP_SIZE)]
+        fps = [None if f == NO_FP else f for f in fps]
+        print(f"[DEBUG][INDEX] {table_name}: índice válido ({len(days)} rows, "
+              f"{sum(f is not None for f in fps)} fingerprints)")
+        return TableSnapshot(key, date_column, days, fps, valid=True)
+
+    def save(self, snap, etag, row_count):
+        if not snap.valid or etag is None or row_count != len(snap):
+            self.drop(snap.key)
+            print(f"[DEBUG][INDEX] {snap.key}: índice não gravado (rows={row_count}, índice={len(snap)})")
+            return False
+        fps_blob = b"".join(NO_FP if f is None else f for f in snap.fps)
+        with self._lock, self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (snap.key, etag, row_count, snap.date_column, snap.days.tobytes(), fps_blob, time.time()))
+        return True
+
+    def drop(self, key):
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM snapshots WHERE key = ?", (key,))
+
+
+def fetch_table_versions(drive_id, tables, client=None):
+    """
+    {(item_id, tabela): (eTag do workbook, nº de rows da tabela)} para [(item_id, tabela)],
+    num único $batch (None onde o Graph não respondeu).
+    """
+    with BatchCoalescer(client) as b:
+        f_items = {item_id: b.get(f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}?$select=id,eTag,cTag")
+                   for item_id in dict.fromkeys(i for i, _ in tables)}
+        f_rows = {(item_id, t): b.get(f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{t}"
+                                      f"/dataBodyRange?$select=rowCount")
+                  for item_id, t in tables}
+    versions = {}
+    for (item_id, t), f in f_rows.items():
+        fi = f_items[item_id]
+        etag = fi.json().get("eTag") if fi.ok else None
+        rows = f.json().get("rowCount") if f.ok else None
+        versions[(item_id, t)] = (etag, rows)
+    return versions
+
+
+# ---- Índice por processo ----
+_index = None
+
+def get_table_index():
+    global _index
+    if _index is None:
+        _index = TableIndex()
+    return _index
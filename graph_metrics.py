@@ -0,0 +1,310 @@
+"""
+Instrumentação das chamadas Graph e relatório de desempenho no fim do run.
+
+Cada pedido do GraphClient é registado no endpoint lógico a que pertence
+("rows page", "rows/add", "$batch row delete", "range PATCH", "createSession", …):
+nº de chamadas, códigos de estado, histograma de latência, bytes enviados /
+recebidos, repetições (graph_retry) e tempo de espera do throttling (429/503 e
+token bucket). Cada endpoint pertence a uma fase (read / delete / insert / write /
+session / ids / other), para se ver como o tempo de parede se reparte; por fase fica
+também o intervalo entre o 1.º e o último pedido e o RSS máximo observado (amostrado
+no máximo uma vez por GRAPH_METRICS_RSS_INTERVAL segundos em cada fase, não a cada pedido).
+
+No fim do processo (atexit) é escrito GRAPH_METRICS_DIR/<script>.json e .md; o
+Markdown vai também para o resumo do job no GitHub Actions ($GITHUB_STEP_SUMMARY).
+Com leituras concorrentes a soma das latências pode ser maior que o tempo de parede.
+"""
+import atexit
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+try:
+    import resource   # só Unix (runner do GitHub Actions)
+except ImportError:
+    resource = None
+
+# ========= CONFIG (ENV) =========
+METRICS_REPORT = (os.getenv("GRAPH_METRICS_REPORT") or "1") != "0"        # "0" = sem relatório
+METRICS_DIR    = os.getenv("GRAPH_METRICS_DIR") or "perf_reports"
+RSS_INTERVAL   = float(os.getenv("GRAPH_METRICS_RSS_INTERVAL") or "1.0")   # s entre leituras de RSS por fase
+# ================================
+
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# (método, padrão do caminho, endpoint lógico, fase) — o primeiro que bater ganha
+ENDPOINT_RULES = [
+    ("POST",   r"/createSession$",                        "createSession",       "session"),
+    ("POST",   r"/refreshSession$",                       "refreshSession",      "session"),
+    ("POST",   r"/closeSession$",                         "closeSession",        "session"),
+    ("GET",    r"/tables/[^/]+/rows$",                    "rows page",           "read"),
+    ("POST",   r"/rows/add$",                             "rows/add",            "insert"),
+    ("DELETE", r"/rows/(\$/)?ItemAt\(index=\d+\)$",       "row delete",          "delete"),
+    ("POST",   r"/range(\(address='[^']*'\))?/delete$",   "range delete",        "delete"),
+    ("POST",   r"/(dataBodyRange|range)/clear$",          "range clear",         "delete"),
+    ("GET",    r"/columns/itemAt\(index=\d+\)/dataBodyRange$", "column read",    "read"),
+    ("GET",    r"/dataBodyRange$",                        "dataBodyRange read",  "read"),
+    ("GET",    r"/headerRowRange$",                       "header read",         "read"),
+    ("GET",    r"/(range|usedRange)(\([^)]*\))?$",        "range read",          "read"),
+    ("PATCH",  r"/range(\([^)]*\))?$",                    "range PATCH",         "write"),
+    ("POST",   r"/sort/apply$",                           "sort",                "write"),
+    ("PUT",    r":/content$",                             "upload",              "write"),
+    ("GET",    r"/workbook/(tables|worksheets)(/[^/]+)?$", "workbook metadata",  "read"),
+    ("POST",   r"/worksheets/add$",                       "worksheet add",       "write"),
+    ("GET",    r"^/sites/",                               "ids",                 "ids"),
+    ("GET",    r"/root:",                                 "ids",                 "ids"),
+    ("GET",    r"^/drives/[^/]+/items/[^/]+(/children)?$", "ids",                "ids"),
+]
+_RULES = [(m, re.compile(p), name, phase) for m, p, name, phase in ENDPOINT_RULES]
+PHASES = ("read", "delete", "insert", "write", "session", "ids", "other")
+
+
+def peak_rss_mb():
+    """Pico de RSS do processo em MB (None se a plataforma não o expuser)."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0   # Linux devolve KB
+
+def current_rss_mb():
+    """RSS atual em MB (/proc no Linux; noutras plataformas, o pico)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0)
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+def _path(url):
+    path = url.split("?", 1)[0]
+    return re.sub(r"^https?://[^/]+(/v1\.0|/beta)?", "", path)
+
+def classify(method, url):
+    """(endpoint lógico, fase) de um pedido."""
+    method = method.upper()
+    path = _path(url)
+    for m, pattern, name, phase in _RULES:
+        if m == method and pattern.search(path):
+            return name, phase
+    return f"{method} other", "other"
+
+def classify_batch(requests_list):
+    """Um $batch herda o endpoint / fase dominante dos sub-pedidos (ex.: "$batch row delete")."""
+    counts = Counter(classify(req.get("method", "GET"), req.get("url", "")) for req in requests_list)
+    if not counts:
+        return "$batch", "other"
+    (name, phase), _ = counts.most_common(1)[0]
+    return f"$batch {name}", phase
+
+def body_size(kwargs):
+    data = kwargs.get("data")
+    if data is None and kwargs.get("json") is not None:
+        data = json.dumps(kwargs["json"])
+    if isinstance(data, str):
+        return len(data.encode("utf-8"))
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    return 0
+
+def response_size(r, streamed=False):
+    """Bytes da resposta; em stream=True só se o servidor mandar Content-Length."""
+    if not streamed:
+        try:
+            return len(r.content)
+        except Exception:
+            pass
+    try:
+        return int(r.headers.get("Content-Length") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class EndpointStats:
+    def __init__(self, phase):
+        self.phase = phase
+        self.calls = 0
+        self.statuses = Counter()
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.retries = 0
+        self.throttle_wait = 0.0
+        self.retry_wait = 0.0
+        self.first_start = None   # segundos desde o arranque das métricas
+        self.last_end = None
+        self.rss_max_mb = 0.0
+
+    def as_dict(self):
+        return {
+            "phase": self.phase,
+            "calls": self.calls,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items(), key=lambda kv: str(kv[0]))},
+            "latency_total_s": round(self.latency_total, 3),
+            "latency_avg_ms": round(1000 * self.latency_total / self.calls, 1) if self.calls else 0,
+            "latency_max_ms": round(1000 * self.latency_max, 1),
+            "latency_histogram_ms": {(f"<={b}" if i < len(LATENCY_BUCKETS_MS) else f">{LATENCY_BUCKETS_MS[-1]}"): n
+                                     for i, (b, n) in enumerate(zip(LATENCY_BUCKETS_MS + (None,), self.histogram))},
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "retries": self.retries,
+            "throttle_wait_s": round(self.throttle_wait, 3),
+            "retry_wait_s": round(self.retry_wait, 3),
+            "first_start_s": round(self.first_start or 0.0, 3),
+            "last_end_s": round(self.last_end or 0.0, 3),
+            "rss_max_mb": round(self.rss_max_mb, 1),
+        }
+
+
+class GraphMetrics:
+    def __init__(self, job=None, out_dir=METRICS_DIR):
+        self.job = job or os.path.splitext(os.path.basename(sys.argv[0] or "graph"))[0] or "graph"
+        self.out_dir = out_dir
+        self.started = time.time()
+        self._t0 = time.monotonic()
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        self._written = False
+        self._rss_mb = 0.0
+        self._rss_at = {}   # fase → instante da última amostra de RSS
+
+    def _sample_rss(self, phase, now):
+        """RSS atual, lido de /proc só se esta fase não foi amostrada nos últimos RSS_INTERVAL s."""
+        last = self._rss_at.get(phase)
+        if last is None or now - last >= RSS_INTERVAL:
+            self._rss_at[phase] = now
+            self._rss_mb = current_rss_mb() or 0.0
+        return self._rss_mb
+
+    def _stats(self, endpoint, phase):
+        s = self._endpoints.get(endpoint)
+        if s is None:
+            s = self._endpoints[endpoint] = EndpointStats(phase)
+        return s
+
+    # ---- Registo (chamado pelo GraphClient) ----
+    def record(self, endpoint, phase, status, latency, bytes_out=0, bytes_in=0):
+        """Uma tentativa HTTP (status None = erro de rede)."""
+        bucket = 0
+        ms = latency * 1000
+        while bucket < len(LATENCY_BUCKETS_MS) and ms > LATENCY_BUCKETS_MS[bucket]:
+            bucket += 1
+        now = time.monotonic()
+        end = now - self._t0
+        rss = self._sample_rss(phase, now)
+        with self._lock:
+            s = self._stats(endpoint, phase)
+            s.calls += 1
+            s.statuses[status if status is not None else "network"] += 1
+            s.latency_total += latency
+            s.latency_max = max(s.latency_max, latency)
+            s.histogram[bucket] += 1
+            s.bytes_out += bytes_out
+            s.bytes_in += bytes_in
+            if s.first_start is None:
+                s.first_start = end - latency
+            s.last_end = end
+            s.rss_max_mb = max(s.rss_max_mb, rss)
+
+    def record_wait(self, endpoint, phase, throttle=0.0, retry=0.0, retried=False):
+        with self._lock:
+            s = self._stats(endpoint, phase)
+            s.throttle_wait += throttle
+            s.retry_wait += retry
+            s.retries += int(retried)
+
+    # ---- Relatório ----
+    def summary(self):
+        with self._lock:
+            endpoints = {name: s.as_dict() for name, s in self._endpoints.items()}
+        phases = defaultdict(lambda: {"calls": 0, "latency_s": 0.0, "throttle_wait_s": 0.0, "retry_wait_s": 0.0,
+                                      "bytes": 0, "first_start_s": None, "last_end_s": 0.0, "rss_max_mb": 0.0})
+        for e in endpoints.values():
+            p = phases[e["phase"]]
+            p["calls"] += e["calls"]
+            p["latency_s"] = round(p["latency_s"] + e["latency_total_s"], 3)
+            p["throttle_wait_s"] = round(p["throttle_wait_s"] + e["throttle_wait_s"], 3)
+            p["retry_wait_s"] = round(p["retry_wait_s"] + e["retry_wait_s"], 3)
+            p["bytes"] += e["bytes_out"] + e["bytes_in"]
+            p["first_start_s"] = min(e["first_start_s"], p["first_start_s"] if p["first_start_s"] is not None
+                                     else e["first_start_s"])
+            p["last_end_s"] = max(p["last_end_s"], e["last_end_s"])
+            p["rss_max_mb"] = max(p["rss_max_mb"], e["rss_max_mb"])
+        for p in phases.values():
+            p["span_s"] = round(p["last_end_s"] - (p["first_start_s"] or 0.0), 3)   # 1.º pedido → último
+        peak = peak_rss_mb()
+        return {
+            "job": self.job,
+            "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(timespec="seconds"),
+            "wall_clock_s": round(time.monotonic() - self._t0, 3),
+            "calls": sum(e["calls"] for e in endpoints.values()),
+            "bytes": sum(e["bytes_out"] + e["bytes_in"] for e in endpoints.values()),
+            "peak_rss_mb": round(peak, 1) if peak is not None else None,
+            "phases": {ph: phases[ph] for ph in PHASES if ph in phases},
+            "endpoints": dict(sorted(endpoints.items(), key=lambda kv: -kv[1]["latency_total_s"])),
+        }
+
+    @staticmethod
+    def to_markdown(summary):
+        lines = [f"## Desempenho Graph — {summary['job']}", "",
+                 f"Início: {summary['started']} · tempo de parede: **{summary['wall_clock_s']:.1f}s**", "",
+                 "| Fase | Chamadas | Intervalo (s) | Latência (s) | Espera throttle (s) | Espera retries (s) | KB | RSS máx (MB) |",
+                 "|---|---:|---:|---:|---:|---:|---:|---:|"]
+        for ph, p in summary["phases"].items():
+            lines.append(f"| {ph} | {p['calls']} | {p['span_s']:.1f} | {p['latency_s']:.1f} | {p['throttle_wait_s']:.1f} | "
+                         f"{p['retry_wait_s']:.1f} | {p['bytes'] / 1024:.0f} | {p['rss_max_mb']:.0f} |")
+        lines += ["", "| Endpoint | Fase | Chamadas | Estados | Média (ms) | Máx (ms) | Total (s) | KB out | KB in | Retries | Espera throttle (s) |",
+                  "|---|---|---:|---|---:|---:|---:|---:|---:|---:|---:|"]
+        for name, e in summary["endpoints"].items():
+            statuses = " ".join(f"{k}×{v}" for k, v in e["statuses"].items())
+            lines.append(f"| {name} | {e['phase']} | {e['calls']} | {statuses} | {e['latency_avg_ms']:.0f} | "
+                         f"{e['latency_max_ms']:.0f} | {e['latency_total_s']:.1f} | {e['bytes_out'] / 1024:.0f} | "
+                         f"{e['bytes_in'] / 1024:.0f} | {e['retries']} | {e['throttle_wait_s']:.1f} |")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self):
+        """Escreve <job>.json e <job>.md (uma vez por processo); devolve o caminho do JSON."""
+        if self._written or not self._endpoints:
+            return None
+        self._written = True
+        summary = self.summary()
+        markdown = self.to_markdown(summary)
+        os.makedirs(self.out_dir, exist_ok=True)
+        json_path = os.path.join(self.out_dir, f"{self.job}.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        with open(os.path.join(self.out_dir, f"{self.job}.md"), "w", encoding="utf-8") as f:
+            f.write(markdown)
+        step_summary = os.getenv("GITHUB_STEP_SUMMARY")
+        if step_summary:
+            with open(step_summary, "a", encoding="utf-8") as f:
+                f.write(markdown)
+        print(f"[DEBUG][METRICS] Relatório de desempenho: {json_path} (tempo de parede {summary['wall_clock_s']:.1f}s)")
+        for ph, p in summary["phases"].items():
+            print(f"[DEBUG][METRICS]   {ph}: chamadas={p['calls']} latência={p['latency_s']:.1f}s "
+                  f"espera_throttle={p['throttle_wait_s']:.1f}s espera_retries={p['retry_wait_s']:.1f}s")
+        return json_path
+
+
+# ---- Métricas por processo ----
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def _write_at_exit():
+    try:
+        get_metrics().write_report()
+    except Exception as e:
+        print(f"[DEBUG][METRICS] Relatório não escrito ({e})")
+
+def get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = GraphMetrics()
+            if METRICS_REPORT:
+                atexit.register(_write_at_exit)
+        return _metrics
@@ -0,0 +1,222 @@
+"""
+Repetições de falhas transitórias (5xx, 504, rede) e circuit breaker por workbook.
+
+Complementa o governador (graph_throttle), que trata 429/503 com Retry-After:
+- back-off "decorrelated jitter": espera = min(cap, uniforme(base, 3 × espera anterior)),
+  para que threads / scripts que falham ao mesmo tempo não repitam em sincronia;
+- orçamento por endpoint (método + caminho sem IDs): no máximo
+  GRAPH_RETRY_BUDGET_MIN + GRAPH_RETRY_BUDGET_RATIO × pedidos desse endpoint
+  repetições por run. Esgotado o orçamento, a falha é devolvida ao chamador em vez de
+  multiplicar a carga num serviço que já está em baixo;
+- circuit breaker por workbook: GRAPH_BREAKER_THRESHOLD falhas seguidas abrem o
+  circuito e os pedidos a esse workbook ficam em pausa GRAPH_BREAKER_COOLDOWN
+  segundos (a dobrar a cada reabertura). Ao fim de GRAPH_BREAKER_MAX_TRIPS aberturas
+  sem um sucesso pelo meio, o job é interrompido com CircuitOpenError.
+
+Só se repetem erros em que repetir é seguro. Um 500/502/504 ou uma ligação cortada
+não dizem se a escrita já foi aplicada, por isso só se repetem em pedidos
+idempotentes (is_idempotent): GET / PUT / PATCH / DELETE que não endereçam rows por
+posição, o rows/add (o Graph documenta repetir o 504), o sort/apply e as sessões.
+Deletes por posição (ItemAt, rows/{n}, range delete com shift Up) e o worksheets/add
+não se repetem: a falha volta ao chamador, que confirma pelo rowCount da tabela.
+ConnectTimeout (o pedido nem saiu) repete-se sempre.
+"""
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+# ========= CONFIG (ENV) =========
+RETRY_MAX            = int(os.getenv("GRAPH_RETRY_MAX") or "5")                # repetições por pedido
+RETRY_BASE           = float(os.getenv("GRAPH_RETRY_BASE") or "1")             # segundos
+RETRY_CAP            = float(os.getenv("GRAPH_RETRY_CAP") or "60")             # segundos
+RETRY_BUDGET_MIN     = int(os.getenv("GRAPH_RETRY_BUDGET_MIN") or "10")        # repetições garantidas por endpoint
+RETRY_BUDGET_RATIO   = float(os.getenv("GRAPH_RETRY_BUDGET_RATIO") or "0.2")   # + fração dos pedidos do endpoint
+BREAKER_THRESHOLD    = int(os.getenv("GRAPH_BREAKER_THRESHOLD") or "5")        # falhas seguidas p/ abrir
+BREAKER_COOLDOWN     = float(os.getenv("GRAPH_BREAKER_COOLDOWN") or "30")      # segundos de pausa (1.ª abertura)
+BREAKER_MAX_TRIPS    = int(os.getenv("GRAPH_BREAKER_MAX_TRIPS") or "4")        # aberturas seguidas antes de abortar
+# ================================
+
+RETRY_STATUSES = (500, 502, 504)
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+IDEMPOTENT_METHODS = SAFE_METHODS + ("PUT", "PATCH", "DELETE")
+# POSTs em que repetir dá o mesmo resultado (ou, no rows/add, o Graph documenta repetir)
+_IDEMPOTENT_POST = re.compile(r"/rows/add$|/sort/apply$|/(create|refresh|close)Session$")
+
+_ENDPOINT_IDS = [
+    (re.compile(r"/(sites|drives|items|tables|worksheets|columns|names)/[^/?]+"), r"/\1/{id}"),
+    (re.compile(r"\(index=\d+\)"), "(index={n})"),
+    (re.compile(r"\(address='[^']*'\)"), "(address={a})"),
+    (re.compile(r"root:[^?]*"), "root:{path}"),
+    (re.compile(r"/sites/[^/?:]+:[^?]*"), "/sites/{site}"),
+]
+_WORKBOOK = re.compile(r"/items/([^/?]+)")
+# rows endereçadas pela posição: repetir depois de outros deletes apaga outra row
+_POSITIONAL = re.compile(r"/rows/(\$/)?ItemAt\(index=\d+\)$|/rows/\d+$|/range(\(address='[^']*'\))?/delete$",
+                         re.IGNORECASE)
+
+
+class CircuitOpenError(RuntimeError):
+    """O workbook continua a falhar depois de várias pausas do circuit breaker."""
+
+
+def endpoint_key(method, url):
+    """"GET https://…/drives/x/items/y/workbook/tables/T/rows?$top=5" → "GET /drives/{id}/items/{id}/workbook/tables/{id}/rows"."""
+    path = url.split("?", 1)[0]
+    path = re.sub(r"^https?://[^/]+(/v1\.0|/beta)?", "", path)
+    for pattern, repl in _ENDPOINT_IDS:
+        path = pattern.sub(repl, path)
+    return f"{method.upper()} {path}"
+
+def workbook_key(url):
+    m = _WORKBOOK.search(url)
+    return m.group(1) if m else "graph"
+
+def is_positional(url):
+    """Sub-pedido / pedido que endereça rows por posição (ItemAt, rows/{n}, range delete com shift)."""
+    return bool(_POSITIONAL.search(url.split("?", 1)[0]))
+
+def is_idempotent(method, url):
+    """Repetir o pedido depois de um 5xx / ligação cortada não muda o resultado (ver docstring do módulo)."""
+    method = method.upper()
+    path = url.split("?", 1)[0]
+    if is_positional(path):
+        return False
+    if method in IDEMPOTENT_METHODS:
+        return True
+    return method == "POST" and bool(_IDEMPOTENT_POST.search(path))
+
+def is_retryable_error(method, exc, idempotent=True):
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, (requests.exceptions.ReadTimeout, requests.exceptions.ChunkedEncodingError)):
+        return method.upper() in SAFE_METHODS
+    return idempotent and isinstance(exc, requests.exceptions.ConnectionError)
+
+
+class _Breaker:
+    __slots__ = ("failures", "trips", "open_until")
+
+    def __init__(self):
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+
+
+class RetryController:
+    def __init__(self, max_retries=RETRY_MAX, base=RETRY_BASE, cap=RETRY_CAP,
+                 budget_min=RETRY_BUDGET_MIN, budget_ratio=RETRY_BUDGET_RATIO,
+                 breaker_threshold=BREAKER_THRESHOLD, breaker_cooldown=BREAKER_COOLDOWN,
+                 breaker_max_trips=BREAKER_MAX_TRIPS):
+        self.max_retries = max_retries
+        self.base = base
+        self.cap = cap
+        self.budget_min = budget_min
+        self.budget_ratio = budget_ratio
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.breaker_max_trips = breaker_max_trips
+        self._breakers = defaultdict(_Breaker)
+        self._lock = threading.Lock()
+        # contadores
+        self.requests = defaultdict(int)    # endpoint -> pedidos (1.ª tentativa)
+        self.retries = defaultdict(int)     # endpoint -> repetições
+        self.failures = defaultdict(int)    # endpoint -> falhas transitórias vistas
+        self.budget_exhausted = 0
+        self.breaker_trips = 0
+        self.retry_wait_seconds = 0.0
+        self.breaker_wait_seconds = 0.0
+
+    # ---- Circuit breaker ----
+    def before_request(self, url):
+        """Espera enquanto o circuito do workbook estiver aberto."""
+        key = workbook_key(url)
+        while True:
+            with self._lock:
+                b = self._breakers[key]
+                delay = b.open_until - time.monotonic()
+            if delay <= 0:
+                return
+            print(f"[DEBUG][RETRY] Circuito aberto (item={key}): pausa {delay:.1f}s")
+            time.sleep(delay)
+            with self._lock:
+                self.breaker_wait_seconds += delay
+
+    def on_success(self, url):
+        with self._lock:
+            b = self._breakers[workbook_key(url)]
+            b.failures = 0
+            b.trips = 0
+
+    def on_failure(self, method, url):
+        """Falha transitória (5xx / rede): conta para o endpoint e para o breaker do workbook."""
+        key = workbook_key(url)
+        with self._lock:
+            self.failures[endpoint_key(method, url)] += 1
+            b = self._breakers[key]
+            b.failures += 1
+            if b.failures < self.breaker_threshold:
+                return
+            b.failures = 0
+            b.trips += 1
+            self.breaker_trips += 1
+            if b.trips > self.breaker_max_trips:
+                raise CircuitOpenError(f"Workbook {key} continua a falhar após {b.trips - 1} pausas do circuit breaker.")
+            cooldown = min(self.cap * 10, self.breaker_cooldown * 2 ** (b.trips - 1))
+            b.open_until = time.monotonic() + cooldown
+        print(f"[DEBUG][RETRY] Circuit breaker aberto (item={key}, abertura {b.trips}): pausa {cooldown:.1f}s")
+
+    # ---- Repetições ----
+    def count_request(self, method, url):
+        with self._lock:
+            self.requests[endpoint_key(method, url)] += 1
+
+    def next_delay(self, method, url, attempt, prev_delay, max_retries=None):
+        """Espera antes da repetição nº `attempt`+1, ou None (limite do pedido / orçamento do endpoint)."""
+        limit = self.max_retries if max_retries is None else max_retries
+        if attempt >= limit:
+            return None
+        ep = endpoint_key(method, url)
+        with self._lock:
+            budget = self.budget_min + self.budget_ratio * self.requests[ep]
+            if self.retries[ep] >= budget:
+                self.budget_exhausted += 1
+                print(f"[DEBUG][RETRY] Orçamento de repetições esgotado: {ep}")
+                return None
+            self.retries[ep] += 1
+        return min(self.cap, random.uniform(self.base, max(self.base, prev_delay * 3)))
+
+    def wait(self, delay):
+        time.sleep(delay)
+        with self._lock:
+            self.retry_wait_seconds += delay
+
+    # ---- Estatísticas ----
+    def stats(self):
+        with self._lock:
+            return {
+                "retries": sum(self.retries.values()),
+                "failures": sum(self.failures.values()),
+                "retry_wait_seconds": round(self.retry_wait_seconds, 2),
+                "breaker_trips": self.breaker_trips,
+                "breaker_wait_seconds": round(self.breaker_wait_seconds, 2),
+                "budget_exhausted": self.budget_exhausted,
+                "by_endpoint": {ep: {"requests": self.requests[ep], "retries": n, "failures": self.failures[ep]}
+                                for ep, n in sorted(self.retries.items(), key=lambda kv: -kv[1])},
+            }
+
+
+# ---- Controlador por processo ----
+_controller = None
+_controller_lock = threading.Lock()
+
+def get_retry_controller():
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = RetryController()
+        return _controller
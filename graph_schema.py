@@ -0,0 +1,167 @@
+"""
+Mapeamento de colunas origem → destino compilado uma vez e reutilizado entre rows e runs.
+
+reorder_values_by_headers reconstrói o dict {nome: posição} a cada row reordenada.
+Aqui:
+- ReorderPlan compila o mapeamento (cabeçalhos de origem → de destino) num plano de
+  índices fixo, aplicado com um único operator.itemgetter por row (no caminho
+  colunar, ColumnTable.select já escolhe colunas inteiras);
+- fetch_table_headers lê os cabeçalhos de todas as tabelas dos jobs num único $batch
+  (headerRowRange?$select=values, sem sessão): é a verificação barata, por tabela, de
+  que o esquema não mudou; substitui o headerRowRange de cada job;
+- SchemaCache guarda os planos por (tabela de origem, tabela de destino, hash dos
+  cabeçalhos de cada lado), em memória e em disco (GRAPH_SCHEMA_CACHE, JSON): com os
+  mesmos hashes, o plano do run anterior é reutilizado sem refazer o mapeamento.
+  Uma tabela com cabeçalhos diferentes tem outro hash e o plano é recompilado.
+
+Uso:
+    headers = fetch_table_headers(drive_id, [(item_id, table), ...])
+    plan = get_schema_cache().plan(src_key, dst_key, src_headers, dst_headers)
+    rows = plan.apply_many(rows)
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from operator import itemgetter
+
+from graph_batch import BatchCoalescer
+from graph_client import GRAPH_BASE
+
+# ========= CONFIG (ENV) =========
+SCHEMA_CACHE = os.getenv("GRAPH_SCHEMA_CACHE") or os.path.join(tempfile.gettempdir(), "graph_schema_cache.json")
+# ================================
+
+
+def headers_hash(headers):
+    return hashlib.sha1(json.dumps(list(headers), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ReorderPlan:
+    """
+    Posição na origem de cada coluna do destino (match por nome exato, a última se
+    houver nomes repetidos, como reorder_values_by_headers); colunas sem par → None.
+    """
+
+    def __init__(self, src_headers, dst_headers, indices=None):
+        """`indices`: plano já compilado para estes cabeçalhos (da SchemaCache); senão é calculado."""
+        self.src_headers = list(src_headers)
+        self.dst_headers = list(dst_headers)
+        self.width = len(self.src_headers)
+        if indices is None:
+            pos = {name: i for i, name in enumerate(self.src_headers)}
+            indices = [pos.get(name) for name in self.dst_headers]
+        self.indices = tuple(indices)
+        self.missing = [name for name, i in zip(self.dst_headers, self.indices) if i is None]
+        # colunas sem par lidas de uma célula None acrescentada no fim da row (posição `width`)
+        full = [self.width if i is None else i for i in self.indices]
+        self._get = itemgetter(*full) if full else (lambda row: ())
+        self._single = len(full) == 1
+        self._pad = [None] if self.missing else None
+
+    def apply(self, row):
+        """Row na ordem da origem → lista na ordem do destino (rows curtas: o que falta fica None)."""
+        if len(row) != self.width:
+            row = (list(row) + [None] * self.width)[:self.width]
+        if self._pad:
+            row = list(row) + self._pad
+        out = self._get(row)
+        return [out] if self._single else list(out)
+
+    def apply_many(self, rows):
+        """Lista de rows reordenadas; rows todas com a largura da origem → um map do itemgetter."""
+        rows = rows if isinstance(rows, list) else list(rows)
+        if not self._pad and not self._single and all(len(r) == self.width for r in rows):
+            return list(map(list, map(self._get, rows)))
+        apply = self.apply
+        return [apply(r) for r in rows]
+
+    def describe(self):
+        moved = sum(1 for k, i in enumerate(self.indices) if i is not None and i != k)
+        return (f"{len(self.dst_headers)} colunas no destino, {moved} reordenadas, "
+                f"{len(self.missing)} sem par na origem")
+
+
+def fetch_table_headers(drive_id, tables, client=None):
+    """{(item_id, tabela): cabeçalhos} para [(item_id, tabela)] num único $batch (None onde falhou)."""
+    with BatchCoalescer(client) as b:
+        futures = {(item_id, t): b.get(f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{t}"
+                                       f"/headerRowRange?$select=values")
+                   for item_id, t in dict.fromkeys(tables)}
+    headers = {}
+    for key, f in futures.items():
+        values = (f.json().get("values") or [[]]) if f.ok else [[]]
+        headers[key] = [str(x) for x in values[0]] if values and values[0] else None
+        if headers[key] is None:
+            print(f"[DEBUG][SCHEMA] Cabeçalhos de {key[1]} ({key[0]}) indisponíveis (status {f.status_code})")
+    return headers
+
+
+class SchemaCache:
+    """Planos por (tabela de origem, tabela de destino, hashes dos cabeçalhos), em memória e em disco (JSON)."""
+
+    def __init__(self, path=SCHEMA_CACHE):
+        self.path = path
+        self._entries = None
+        self._plans = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def table_key(drive_id, item_id, table_name):
+        return f"{drive_id}:{item_id}:{table_name}"
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            if self.path and os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"[DEBUG][SCHEMA] Cache de planos ignorada ({e})")
+        return self._entries
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def plan(self, src_key, dst_key, src_headers, dst_headers):
+        """Plano para estes cabeçalhos: da memória / disco se os hashes forem os mesmos, senão compilado."""
+        src_hash, dst_hash = headers_hash(src_headers), headers_hash(dst_headers)
+        key = (src_key, dst_key, src_hash, dst_hash)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self.hits += 1
+                return plan
+            entry_key = f"{src_key}>{dst_key}"
+            e = self._load().get(entry_key)
+            if e and e.get("src_hash") == src_hash and e.get("dst_hash") == dst_hash:
+                self.hits += 1
+                plan = ReorderPlan(src_headers, dst_headers, indices=e["indices"])
+            else:
+                self.misses += 1
+                plan = ReorderPlan(src_headers, dst_headers)
+                self._entries[entry_key] = {"src_hash": src_hash, "dst_hash": dst_hash,
+                                            "indices": list(plan.indices), "ts": time.time()}
+                self._save()
+            self._plans[key] = plan
+            return plan
+
+
+# ---- Cache por processo ----
+_cache = None
+
+def get_schema_cache():
+    global _cache
+    if _cache is None:
+        _cache = SchemaCache()
+    return _cache
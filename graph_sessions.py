@@ -0,0 +1,181 @@
+"""
+Gestor de sessões de workbook (createSession / refreshSession / closeSession).
+
+- Uma sessão por workbook por run, partilhada por todas as helpers (get()).
+- Origens só de leitura usam sessões não persistentes (persist=False); se o mesmo
+  workbook for pedido depois para escrita, passa a ter uma sessão persistente.
+- Keep-alive: uma thread envia refreshSession a cada GRAPH_SESSION_KEEPALIVE
+  segundos, para operações longas (sweeps, inserts grandes) não perderem a sessão
+  por inatividade.
+- Fecho garantido: close_all() no fim (with / finally), em SIGTERM (ex.: job
+  cancelado no GitHub Actions) e, em último caso, no atexit.
+
+Uso:
+    sessions = get_sessions().open()
+    src_sid = sessions.get(drive_id, src_id, persist=False)
+    dst_sid = sessions.get(drive_id, dst_id)
+    try: ...
+    finally: sessions.close_all()
+"""
+import atexit
+import json
+import os
+import signal
+import threading
+
+from graph_client import GRAPH_BASE, get_client
+
+# ========= CONFIG (ENV) =========
+KEEPALIVE_SECONDS = float(os.getenv("GRAPH_SESSION_KEEPALIVE") or "240")   # sessões expiram ~5 min sem uso
+# ================================
+
+
+def _raise_system_exit(signum, frame):
+    print(f"[DEBUG][SESSION] Sinal {signum} recebido: a fechar sessões …")
+    raise SystemExit(128 + signum)   # desenrola os finally/with → close_all()
+
+
+class WorkbookSessions:
+    def __init__(self, client=None, keepalive=KEEPALIVE_SECONDS):
+        self.client = client or get_client()
+        self.keepalive = keepalive
+        self._sessions = {}   # (drive_id, item_id) -> {"id": ..., "persist": bool}
+        self._retired = []    # sessões só de leitura substituídas por persistentes (ainda em uso por quem as pediu)
+        self._lock = threading.Lock()
+        self._key_locks = {}  # (drive_id, item_id) -> Lock do createSession desse workbook
+        self._stop = threading.Event()
+        self._thread = None
+        self._prev_sigterm = None
+        self._atexit = False
+        # contadores
+        self.created = 0
+        self.reused = 0
+        self.refreshed = 0
+
+    @staticmethod
+    def _workbook_url(drive_id, item_id):
+        return f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook"
+
+    # ---- Ciclo de vida ----
+    def open(self):
+        """Instala o handler de SIGTERM e o atexit (idempotente)."""
+        if not self._atexit:
+            atexit.register(self.close_all)
+            self._atexit = True
+        if self._prev_sigterm is None and threading.current_thread() is threading.main_thread():
+            self._prev_sigterm = signal.signal(signal.SIGTERM, _raise_system_exit)
+        return self
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close_all()
+        return False
+
+    # ---- Sessões ----
+    def get(self, drive_id, item_id, persist=True):
+        """
+        Session id do workbook; reutiliza a existente (uma persistente serve também p/ leitura).
+        O createSession corre fora do lock global: só espera quem pede o mesmo workbook.
+        """
+        key = (drive_id, item_id)
+        with self._lock:
+            sid = self._reuse(key, persist)
+            if sid:
+                return sid
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                sid = self._reuse(key, persist)   # outra thread pode tê-la criado entretanto
+                if sid:
+                    return sid
+            r = self.client.post(f"{self._workbook_url(drive_id, item_id)}/createSession",
+                                 data=json.dumps({"persistChanges": bool(persist)}))
+            r.raise_for_status()
+            sid = r.json()["id"]
+            with self._lock:
+                s = self._sessions.get(key)
+                if s:
+                    self._retired.append((key, s))
+                self._sessions[key] = {"id": sid, "persist": bool(persist)}
+                self.created += 1
+                self._start_keepalive()
+        print(f"[DEBUG][SESSION] Sessão {'persistente' if persist else 'só leitura'} criada (item={item_id})")
+        return sid
+
+    def _reuse(self, key, persist):
+        """Session id reutilizável para `key` (chamar com self._lock), ou None."""
+        s = self._sessions.get(key)
+        if s and (s["persist"] or not persist):
+            self.reused += 1
+            return s["id"]
+        return None
+
+    def _close_one(self, key, s):
+        drive_id, item_id = key
+        r = self.client.post(f"{self._workbook_url(drive_id, item_id)}/closeSession", session_id=s["id"])
+        print(f"[DEBUG][SESSION] Sessão fechada (item={item_id}, status {r.status_code})")
+
+    def close(self, drive_id, item_id):
+        """Fecha já a sessão de um workbook (ex.: origem lida por completo)."""
+        key = (drive_id, item_id)
+        with self._lock:
+            s = self._sessions.pop(key, None)
+            retired = [(k, r) for k, r in self._retired if k == key]
+            self._retired = [(k, r) for k, r in self._retired if k != key]
+        for k, r in retired + ([(key, s)] if s else []):
+            self._close_one(k, r)
+
+    def close_all(self):
+        self._stop.set()
+        with self._lock:
+            items = self._retired + list(self._sessions.items())
+            self._retired = []
+            self._sessions = {}
+        for key, s in items:
+            try:
+                self._close_one(key, s)
+            except Exception as e:
+                print(f"[DEBUG][SESSION] Falha a fechar sessão (item={key[1]}): {e}")
+        if self._prev_sigterm is not None:
+            signal.signal(signal.SIGTERM, self._prev_sigterm)
+            self._prev_sigterm = None
+        if items:
+            print(f"[DEBUG][SESSION] criadas={self.created} reutilizadas={self.reused} refresh={self.refreshed}")
+        self._thread = None
+        self._stop = threading.Event()
+
+    # ---- Keep-alive ----
+    def _start_keepalive(self):
+        if self.keepalive <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._keepalive_loop, args=(self._stop,),
+                                        name="graph-session-keepalive", daemon=True)
+        self._thread.start()
+
+    def _keepalive_loop(self, stop):
+        while not stop.wait(self.keepalive):
+            with self._lock:
+                items = self._retired + list(self._sessions.items())
+            for (drive_id, item_id), s in items:
+                if stop.is_set():
+                    return
+                try:
+                    r = self.client.post(f"{self._workbook_url(drive_id, item_id)}/refreshSession",
+                                         session_id=s["id"])
+                    self.refreshed += 1
+                    if not r.ok:
+                        print(f"[DEBUG][SESSION] refreshSession falhou (item={item_id}): {r.status_code}")
+                except Exception as e:
+                    print(f"[DEBUG][SESSION] refreshSession falhou (item={item_id}): {e}")
+
+
+# ---- Gestor por processo ----
+_sessions = None
+
+def get_sessions():
+    global _sessions
+    if _sessions is None:
+        _sessions = WorkbookSessions()
+    return _sessions
@@ -0,0 +1,116 @@
+"""
+Leitura em streaming de ranges grandes (dataBodyRange / range da tabela inteira).
+
+O `.json()` de um range inteiro constrói a lista de listas completa, e depois o
+DataFrame / CSV faz outra cópia por cima: o pico de memória fica várias vezes o
+tamanho da tabela. Aqui a resposta é lida aos bocados (stream=True) e o array
+"values" é descodificado linha a linha (json.JSONDecoder.raw_decode), com cada
+célula a ir diretamente para a lista da sua coluna. Nunca existe a lista de
+linhas completa; em memória ficam só as colunas e o bocado de texto por consumir.
+
+Uso:
+    columns = stream_range_columns(url, session_id=sid)
+    df = columns_to_dataframe(columns, hdr)
+"""
+import codecs
+import json
+import os
+import re
+
+from graph_client import get_client
+from graph_metrics import peak_rss_mb
+
+# ========= CONFIG (ENV) =========
+STREAM_CHUNK = int(os.getenv("GRAPH_STREAM_CHUNK") or "262144")   # bytes por leitura do socket
+# ================================
+
+_VALUES_KEY = re.compile(r'"values"\s*:\s*\[')
+_WS = " \t\r\n"
+
+
+def report_peak_rss(label):
+    rss = peak_rss_mb()
+    if rss is not None:
+        print(f"[DEBUG][MEM] {label}: pico RSS={rss:.1f} MB")
+
+def iter_stream_rows(text_chunks):
+    """
+    Gerador das linhas (listas) do array "values" de um JSON que chega aos bocados.
+    O resto do documento (@odata.context, address, ...) é ignorado.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    chunks = iter(text_chunks)
+    in_values = False
+
+    for chunk in chunks:
+        buf = buf[pos:] + chunk
+        pos = 0
+        if not in_values:
+            m = _VALUES_KEY.search(buf)
+            if not m:
+                buf = buf[-32:]   # a chave pode estar partida entre dois bocados
+                continue
+            pos = m.end()
+            in_values = True
+
+        while True:
+            while pos < len(buf) and buf[pos] in _WS + ",":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                return
+            try:
+                row, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                break   # linha incompleta → ler mais
+            pos = end
+            yield row
+
+    if in_values and buf[pos:].strip():
+        raise ValueError("Resposta JSON truncada a meio do array 'values'.")
+
+def stream_range_columns(url, session_id=None, client=None, chunk_size=STREAM_CHUNK, label="stream"):
+    """
+    GET de um range (…/dataBodyRange, …/range) em streaming → lista de colunas
+    (uma lista Python por coluna, pela ordem das linhas).
+    """
+    client = client or get_client()
+    r = client.get(url, session_id=session_id, stream=True)
+    try:
+        if not r.ok:
+            print("[DEBUG][stream] URL:", url)
+            print("[DEBUG][stream] STATUS:", r.status_code)
+            try: print("[DEBUG][stream] JSON:", r.json())
+            except Exception: print("[DEBUG][stream] TEXT:", r.text)
+            r.raise_for_status()
+
+        utf8 = codecs.getincrementaldecoder("utf-8")()
+        text = (utf8.decode(b) for b in r.iter_content(chunk_size=chunk_size) if b)
+
+        columns = []
+        n_rows = 0
+        for row in iter_stream_rows(text):
+            if not columns:
+                columns = [[] for _ in row]
+            for col, v in zip(columns, row):
+                col.append(v)
+            n_rows += 1
+    finally:
+        r.close()
+
+    print(f"[DEBUG][stream] {label}: linhas={n_rows} colunas={len(columns)}")
+    report_peak_rss(label)
+    return columns
+
+def columns_to_dataframe(columns, header):
+    """DataFrame a partir das colunas (aceita cabeçalhos repetidos, como pd.DataFrame(body, columns=hdr))."""
+    import pandas as pd
+
+    if not columns:
+        return pd.DataFrame(columns=header)
+    df = pd.DataFrame({i: col for i, col in enumerate(columns)}, copy=False)
+    df.columns = header
+    return df
@@ -0,0 +1,191 @@
+"""
+Leituras de tabelas Excel só com o necessário.
+
+- Rows: pedir apenas `index` e `values` ($select), sem o resto dos metadados.
+- Coluna única: para descobrir índices de linhas (ex.: linhas do mês a apagar)
+  basta o dataBodyRange da coluna de data, em vez das linhas completas. Nas
+  tabelas largas (Historico/Visitas) é menos de 10% dos bytes.
+- Janelas A1: endereço do dataBodyRange partido em blocos de linhas, lidos com
+  range(address=...) (ver graph_async.iter_table_rows_windows).
+- Apagar em bloco: com a tabela ordenada (sort/apply), rows seguidas saem com um
+  único range(address=...)/delete em vez de um DELETE ItemAt por row.
+- Apagar por intervalos: rows soltas juntas em intervalos contínuos, um range
+  delete por intervalo (do fim para o início, encadeados com dependsOn num $batch).
+"""
+import json
+import re
+import urllib.parse
+
+from graph_client import GRAPH_BASE, get_client
+from graph_retry import RETRY_STATUSES
+
+ROWS_SELECT = "$select=index,values"
+
+
+def table_url(drive_id, item_id, table_name):
+    return f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}"
+
+def rows_url(drive_id, item_id, table_name, top=None, skip=None):
+    """URL de rows com projeção (e janela $top/$skip se indicada)."""
+    url = f"{table_url(drive_id, item_id, table_name)}/rows?{ROWS_SELECT}"
+    if top is not None:
+        url += f"&$top={top}&$skip={skip or 0}"
+    return url
+
+def read_table_column(drive_id, item_id, table_name, session_id, column_index, client=None):
+    """
+    Valores de UMA coluna da tabela (dataBodyRange da coluna), por ordem de linha:
+    a posição na lista é o índice 0-based da row. None se o Graph recusar (o
+    chamador volta à leitura de rows).
+    """
+    client = client or get_client()
+    url = (f"{table_url(drive_id, item_id, table_name)}/columns/itemAt(index={int(column_index)})"
+           f"/dataBodyRange?$select=values")
+    r = client.get(url, session_id=session_id)
+    if not r.ok:
+        print("[DEBUG][coluna] URL:", url)
+        print("[DEBUG][coluna] STATUS:", r.status_code)
+        return None
+    values = [row[0] if row else None for row in r.json().get("values", [])]
+    print(f"[DEBUG][coluna] {table_name}[{column_index}]: {len(values)} valores")
+    return values
+
+# ---- Janelas A1 ----
+def parse_a1_range(address):
+    """"'Folha 1'!A2:AF500" → (folha, "A", 2, "AF", 500)."""
+    sheet, cells = address.rsplit("!", 1)
+    start, end = (cells.split(":") + [cells])[:2]
+    m1 = re.match(r"\$?([A-Z]+)\$?(\d+)", start)
+    m2 = re.match(r"\$?([A-Z]+)\$?(\d+)", end)
+    sheet = sheet[1:-1].replace("''", "'") if sheet.startswith("'") else sheet
+    return sheet, m1.group(1), int(m1.group(2)), m2.group(1), int(m2.group(2))
+
+def get_table_body_info(drive_id, item_id, table_name, session_id, client=None):
+    """{"address", "rowCount", "columnCount"} do dataBodyRange da tabela."""
+    client = client or get_client()
+    r = client.get(f"{table_url(drive_id, item_id, table_name)}/dataBodyRange?$select=address,rowCount,columnCount",
+                   session_id=session_id)
+    r.raise_for_status()
+    return r.json()
+
+def worksheet_range_url(drive_id, item_id, sheet, address):
+    """range(address=...) de uma folha, só com os valores."""
+    return (f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets/"
+            f"{urllib.parse.quote(sheet, safe='')}/range(address='{address}')?$select=values")
+
+# ---- Ordenar / apagar em bloco ----
+def sort_table(drive_id, item_id, table_name, session_id, column_index, ascending=True, client=None):
+    """sort/apply da tabela por uma coluna (a ordem fica gravada no workbook)."""
+    client = client or get_client()
+    body = {"fields": [{"key": int(column_index), "ascending": ascending}], "matchCase": False}
+    r = client.post(f"{table_url(drive_id, item_id, table_name)}/sort/apply",
+                    session_id=session_id, data=json.dumps(body))
+    r.raise_for_status()
+
+def delete_table_rows_block(drive_id, item_id, table_name, session_id, first, count, body_address=None, client=None):
+    """
+    Apaga `count` rows seguidas a partir do índice 0-based `first` com um único
+    range(address=...)/delete (shift Up) na folha da tabela. `body_address` é o
+    endereço do dataBodyRange (se já conhecido).
+
+    Um 5xx não é repetido pelo cliente (a escrita pode já ter sido aplicada): o
+    rowCount da tabela diz se o delete entrou; só se não entrou é repetido uma vez.
+    """
+    client = client or get_client()
+    info = get_table_body_info(drive_id, item_id, table_name, session_id, client=client)
+    body_address = body_address or info["address"]
+    sheet, c0, r0, c1, _ = parse_a1_range(body_address)
+    address = f"{c0}{r0 + first}:{c1}{r0 + first + count - 1}"
+    url = (f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets/"
+           f"{urllib.parse.quote(sheet, safe='')}/range(address='{address}')/delete")
+    print(f"[DEBUG][BLOCK-DEL] {table_name}: {sheet}!{address} ({count} rows)")
+    r = client.post(url, session_id=session_id, data=json.dumps({"shift": "Up"}))
+    if r.status_code in RETRY_STATUSES:
+        row_count = get_table_body_info(drive_id, item_id, table_name, session_id, client=client)["rowCount"]
+        if row_count == info["rowCount"] - count:
+            print(f"[DEBUG][BLOCK-DEL] {r.status_code}, mas o rowCount ({row_count}) confirma o delete.")
+            return count
+        if row_count == info["rowCount"]:
+            print(f"[DEBUG][BLOCK-DEL] {r.status_code} e rowCount inalterado ({row_count}); a repetir uma vez.")
+            r = client.post(url, session_id=session_id, data=json.dumps({"shift": "Up"}))
+    if not r.ok:
+        print("[DEBUG][BLOCK-DEL] STATUS:", r.status_code)
+        try: print("[DEBUG][BLOCK-DEL] JSON:", r.json())
+        except Exception: print("[DEBUG][BLOCK-DEL] TEXT:", r.text)
+        r.raise_for_status()
+    return count
+
+def coalesce_row_ranges(indices):
+    """Índices 0-based → [(first, count)] de rows seguidas, do último intervalo para o primeiro."""
+    ranges = []
+    for idx in sorted(set(indices)):
+        if ranges and idx == ranges[-1][0] + ranges[-1][1]:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([idx, 1])
+    return [(first, count) for first, count in reversed(ranges)]
+
+def delete_table_row_ranges(drive_id, item_id, table_name, session_id, ranges, body_address=None, row_count=None,
+                            max_batch_size=20, client=None):
+    """
+    Apaga os intervalos [(first, count)] (índices antes de qualquer delete) com um
+    range(address=...)/delete (shift Up) cada. Do último para o primeiro, encadeados
+    com dependsOn em cada $batch: um delete nunca mexe nas posições dos seguintes.
+    Devolve o nº de rows apagadas; pára no primeiro intervalo que falhe. Um 5xx (não
+    repetido pelo cliente) é decidido pelo rowCount da tabela (`row_count` = antes dos
+    deletes): se o delete entrou conta e segue; se não entrou é repetido uma vez.
+    """
+    client = client or get_client()
+    if body_address is None or row_count is None:
+        info = get_table_body_info(drive_id, item_id, table_name, session_id, client=client)
+        body_address, row_count = body_address or info["address"], info["rowCount"]
+    sheet, c0, r0, c1, _ = parse_a1_range(body_address)
+    base = f"/drives/{drive_id}/items/{item_id}/workbook/worksheets/{urllib.parse.quote(sheet, safe='')}"
+    ranges = sorted(ranges, reverse=True)
+    pending = list(ranges)
+    deleted = 0
+    repeated = False
+    while pending:
+        chunk = pending[:max_batch_size]
+        requests_list = []
+        for i, (first, count) in enumerate(chunk, start=1):
+            req = {
+                "id": str(i),
+                "method": "POST",
+                "url": f"{base}/range(address='{c0}{r0 + first}:{c1}{r0 + first + count - 1}')/delete",
+                "headers": {"workbook-session-id": session_id, "Content-Type": "application/json"},
+                "body": {"shift": "Up"},
+            }
+            if i > 1:
+                req["dependsOn"] = [str(i - 1)]
+            requests_list.append(req)
+        responses = client.batch(requests_list)
+        failed = None
+        for (first, count), e in zip(chunk, responses):
+            if e.get("status") not in (200, 204):
+                failed = e
+                break
+            deleted += count
+            pending.pop(0)
+        if failed is None:
+            continue
+        first, count = pending[0]
+        if failed.get("status") in RETRY_STATUSES:
+            now = get_table_body_info(drive_id, item_id, table_name, session_id, client=client)["rowCount"]
+            if now == row_count - deleted - count:
+                print(f"[DEBUG][RANGE-DEL] {table_name}: {first}+{count} com {failed.get('status')}, "
+                      f"mas o rowCount ({now}) confirma o delete")
+                deleted += count
+                pending.pop(0)
+                continue
+            if now == row_count - deleted and not repeated:
+                print(f"[DEBUG][RANGE-DEL] {table_name}: {first}+{count} com {failed.get('status')} e rowCount "
+                      f"inalterado ({now}); a repetir")
+                repeated = True
+                continue
+        print(f"[DEBUG][RANGE-DEL] {table_name}: falhou {first}+{count} | status: {failed.get('status')} "
+              f"| body: {failed.get('body')}")
+        print(f"[DEBUG][RANGE-DEL] {table_name}: {deleted} rows apagadas em intervalos")
+        return deleted
+    print(f"[DEBUG][RANGE-DEL] {table_name}: {deleted} rows apagadas em {len(ranges)} intervalos")
+    return deleted
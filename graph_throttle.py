@@ -0,0 +1,118 @@
+"""
+Governador de throttling partilhado por todo o processo.
+
+Todas as chamadas Graph passam por aqui (via GraphClient):
+- token bucket: limita o ritmo de pedidos (um $batch conta como N pedidos);
+- back-off global: um 429/503 com Retry-After (de topo ou de uma sub-resposta de
+  $batch) pausa TODAS as threads até ao fim da janela, em vez de cada call site
+  dormir e repetir por conta própria;
+- ritmo adaptativo (AIMD): cada 429/503 corta o ritmo para metade, cada resposta
+  OK sobe-o um pouco, até GRAPH_MAX_RPS. Assim ficamos perto do máximo que o
+  tenant aceita sem tempestades de retries.
+"""
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# ========= CONFIG (ENV) =========
+MAX_RPS             = float(os.getenv("GRAPH_MAX_RPS") or "20")     # teto do ritmo (pedidos/s)
+MIN_RPS             = float(os.getenv("GRAPH_MIN_RPS") or "0.5")    # chão do ritmo após cortes
+START_RPS           = float(os.getenv("GRAPH_START_RPS") or "10")
+BURST               = float(os.getenv("GRAPH_BURST") or "20")       # capacidade do bucket
+RPS_STEP            = float(os.getenv("GRAPH_RPS_STEP") or "0.1")   # subida por resposta OK
+DEFAULT_RETRY_AFTER = float(os.getenv("GRAPH_DEFAULT_RETRY_AFTER") or "5")
+THROTTLE_MAX_RETRIES = int(os.getenv("GRAPH_THROTTLE_MAX_RETRIES") or "6")
+# ================================
+
+THROTTLE_STATUSES = (429, 503)
+
+
+def parse_retry_after(value, default=DEFAULT_RETRY_AFTER):
+    """Retry-After em segundos (aceita inteiro/float ou data HTTP)."""
+    if value is None or value == "":
+        return default
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(str(value)).timestamp() - time.time())
+    except Exception:
+        return default
+
+def header_value(headers, name):
+    """Lê um header sem depender de maiúsculas (dict de sub-resposta de $batch ou CaseInsensitiveDict)."""
+    if not headers:
+        return None
+    for k, v in headers.items():
+        if k.lower() == name.lower():
+            return v
+    return None
+
+
+class ThrottleGovernor:
+    def __init__(self, start_rps=START_RPS, min_rps=MIN_RPS, max_rps=MAX_RPS, burst=BURST, step=RPS_STEP):
+        self.rate = min(max_rps, max(min_rps, start_rps))
+        self.min_rps = min_rps
+        self.max_rps = max_rps
+        self.capacity = max(1.0, burst)
+        self.step = step
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._backoff_until = 0.0
+        self._lock = threading.Lock()
+        # contadores
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, cost=1):
+        """Bloqueia até haver back-off livre e tokens para `cost` pedidos."""
+        need = min(float(cost), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._backoff_until:
+                    delay = self._backoff_until - now
+                elif self._tokens >= need:
+                    self._tokens -= cost   # pode ficar negativo (batch > bucket) → os seguintes esperam mais
+                    self.wait_seconds += waited
+                    return waited
+                else:
+                    delay = (need - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def on_throttle(self, retry_after):
+        """429/503 observado: back-off global + corte multiplicativo do ritmo."""
+        with self._lock:
+            self.throttled += 1
+            self._backoff_until = max(self._backoff_until, time.monotonic() + retry_after)
+            self.rate = max(self.min_rps, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+        print(f"[DEBUG][THROTTLE] Throttled: pausa global {retry_after:.1f}s, ritmo → {self.rate:.2f} req/s")
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rps, self.rate + self.step)
+
+    def stats(self):
+        return {"throttled": self.throttled, "wait_seconds": round(self.wait_seconds, 2), "rate": round(self.rate, 2)}
+
+
+# ---- Governador por processo ----
+_governor = None
+_governor_lock = threading.Lock()
+
+def get_governor():
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = ThrottleGovernor()
+        return _governor
@@ -0,0 +1,112 @@
+"""
+Marcas de água das origens: saltar um job se o ficheiro "Mensal" não mudou.
+
+Os jobs correm por agenda, quer o Power Automate tenha ou não atualizado a origem
+desde o run anterior. Aqui:
+- antes de abrir sessões, um único GET de metadados (num $batch para todas as
+  origens) devolve eTag / cTag / lastModifiedDateTime de cada ficheiro;
+- depois de um job correr bem, guarda-se a versão lida NO ARRANQUE (se a origem
+  mudou durante o run, o run seguinte volta a correr o job);
+- no run seguinte, o job é saltado se a versão for a mesma e a assinatura do job
+  (origem, destino, coluna de data, janela de datas, modo e modo de apagar) também.
+
+A assinatura inclui a janela: no primeiro run de um mês novo o job corre sempre.
+Alterações feitas à mão no destino não são detetadas; SYNC_SKIP_UNCHANGED=0 força
+todos os jobs.
+
+Uso:
+    marks = get_watermarks()
+    versions = fetch_item_versions(drive_id, [src_id])
+    if marks.unchanged(name, signature, versions[src_id]): ...
+    marks.record(name, signature, versions[src_id])
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+from graph_batch import BatchCoalescer
+from graph_client import GRAPH_BASE
+
+# ========= CONFIG (ENV) =========
+SKIP_UNCHANGED  = (os.getenv("SYNC_SKIP_UNCHANGED") or "1") != "0"          # "0" = corre sempre
+WATERMARKS_PATH = os.getenv("GRAPH_WATERMARKS") or os.path.join(tempfile.gettempdir(), "graph_watermarks.json")
+# ================================
+
+VERSION_FIELDS = ("eTag", "cTag", "lastModifiedDateTime")
+
+
+def fetch_item_versions(drive_id, item_ids, client=None):
+    """{item_id: {eTag, cTag, lastModifiedDateTime}} num único $batch (None onde o Graph não respondeu)."""
+    select = ",".join(("id",) + VERSION_FIELDS)
+    with BatchCoalescer(client) as b:
+        futures = {item_id: b.get(f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}?$select={select}")
+                   for item_id in dict.fromkeys(item_ids)}
+    versions = {}
+    for item_id, f in futures.items():
+        if f.ok:
+            body = f.json()
+            versions[item_id] = {k: body.get(k) for k in VERSION_FIELDS}
+        else:
+            print(f"[DEBUG][WATERMARK] Metadados de {item_id} indisponíveis (status {f.status_code})")
+            versions[item_id] = None
+    return versions
+
+
+class SourceWatermarks:
+    """Última versão da origem sincronizada com sucesso, por job (JSON em disco)."""
+
+    def __init__(self, path=WATERMARKS_PATH):
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            if self.path and os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"[DEBUG][WATERMARK] Marcas de água ignoradas ({e})")
+        return self._entries
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def unchanged(self, name, signature, version):
+        """True se a origem (eTag / cTag / lastModifiedDateTime) e a assinatura são as do último sucesso."""
+        if not version or not (version.get("eTag") or version.get("cTag")):
+            return False
+        with self._lock:
+            e = self._load().get(name)
+        return bool(e) and e.get("signature") == signature and e.get("version") == version
+
+    def record(self, name, signature, version):
+        if not version:
+            return
+        with self._lock:
+            self._load()[name] = {"signature": signature, "version": version, "ts": time.time()}
+            self._save()
+
+    def forget(self, name):
+        with self._lock:
+            if self._load().pop(name, None) is not None:
+                self._save()
+
+
+# ---- Marcas por processo ----
+_marks = None
+
+def get_watermarks():
+    global _marks
+    if _marks is None:
+        _marks = SourceWatermarks()
+    return _marks
@@ -2,16 +2,12 @@
 import os
 import json
 import urllib.parse
-import requests
-import msal
 
-GRAPH_BASE = "https://graph.microsoft.com/v1.0"
+from graph_client import GRAPH_BASE, get_client
+from graph_ids import resolve_ids
+from graph_sessions import get_sessions
 
 # ========= CONFIG por variáveis de ambiente =========
-TENANT_ID     = os.getenv("TENANT_ID")
-CLIENT_ID     = os.getenv("CLIENT_ID")
-CLIENT_SECRET = os.getenv("CLIENT_SECRET")
-
 SITE_HOSTNAME = os.getenv("SITE_HOSTNAME", "").strip()
 SITE_PATH     = os.getenv("SITE_PATH_W", "sites/geral.brands").strip()
 
@@ -38,37 +34,15 @@ ALL_COLS      = [COL_MARCAS] + VAL_COLS + PCT_COLS + EXTRA_COLS  # 13 colunas
 COL_COUNT     = len(ALL_COLS)  # 13
 
 # ========= AUTH (MSAL) =========
-app = msal.ConfidentialClientApplication(
-    CLIENT_ID, authority=f"https://login.microsoftonline.com/{TENANT_ID}",
-    client_credential=CLIENT_SECRET
-)
-token_result = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-if "access_token" not in token_result:
-    raise RuntimeError(f"Falha a obter token: {token_result.get('error')} - {token_result.get('error_description')}")
-token = token_result["access_token"]
-base_headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+# Autenticação preguiçosa (1.ª chamada Graph) com renovação automática: ver graph_auth.
+graph = get_client()
 
 # ========= HELPERS Graph =========
-def get_site_id():
-    return requests.get(f"{GRAPH_BASE}/sites/{SITE_HOSTNAME}:/{SITE_PATH}", headers=base_headers).json()["id"]
-
-def get_drive_id(site_id):
-    return requests.get(f"{GRAPH_BASE}/sites/{site_id}/drive", headers=base_headers).json()["id"]
-
-def get_item_id_by_path(token: str, drive_id: str, drive_relative_path: str) -> str:
-    """ devolve item_id dado caminho relativo (SEM %20) """
-    h = {"Authorization": f"Bearer {token}"}
-    enc = urllib.parse.quote(drive_relative_path.strip("/"))
-    url = f"{GRAPH_BASE}/drives/{drive_id}/root:/{enc}"
-    r = requests.get(url, headers=h); r.raise_for_status()
-    return r.json()["id"]
-
-def list_children_recursive(token: str, drive_id: str, drive_relative_folder: str) -> list[dict]:
+def list_children_recursive(drive_id: str, drive_relative_folder: str) -> list[dict]:
     """ devolve todos os ficheiros (.xlsx/.xlsm) dentro da pasta (e subpastas) """
-    h = {"Authorization": f"Bearer {token}"}
     enc = urllib.parse.quote(drive_relative_folder.strip("/"))
     url_item = f"{GRAPH_BASE}/drives/{drive_id}/root:/{enc}"
-    r = requests.get(url_item, headers=h); r.raise_for_status()
+    r = graph.get(url_item); r.raise_for_status()
     folder_id = r.json()["id"]
 
     files = []
@@ -77,7 +51,7 @@ def list_children_recursive(token: str, drive_id: str, drive_relative_folder: st
         url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/children"
         next_url = url
         while next_url:
-            resp = requests.get(next_url, headers=h); resp.raise_for_status()
+            resp = graph.get(next_url); resp.raise_for_status()
             data = resp.json()
             for it in data.get("value", []):
                 name = it.get("name", "")
@@ -91,71 +65,51 @@ def list_children_recursive(token: str, drive_id: str, drive_relative_folder: st
     return files
 
 # ========= Workbook APIs =========
-def create_session(token: str, drive_id: str, item_id: str, persist=True) -> str:
-    h = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/createSession"
-    body = {"persistChanges": bool(persist)}
-    r = requests.post(url, headers=h, data=json.dumps(body)); r.raise_for_status()
-    sid = r.json()["id"]
-    print(f"[DEBUG] Session criada: {sid}")
-    return sid
-
-def close_session(token: str, drive_id: str, item_id: str, session_id: str):
-    h = {"Authorization": f"Bearer {token}", "workbook-session-id": session_id}
-    r = requests.post(f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/closeSession", headers=h)
-    print(f"[DEBUG] Session fechada (status {r.status_code})")
-
-def get_worksheets(token: str, drive_id: str, item_id: str, session_id: str) -> list[dict]:
-    h = {"Authorization": f"Bearer {token}", "workbook-session-id": session_id}
+def get_worksheets(drive_id: str, item_id: str, session_id: str) -> list[dict]:
     url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets"
-    r = requests.get(url, headers=h); r.raise_for_status()
+    r = graph.get(url, session_id=session_id); r.raise_for_status()
     return r.json().get("value", [])
 
-def get_worksheet_id_by_name(token: str, drive_id: str, item_id: str, session_id: str, sheet_name: str) -> str | None:
-    for s in get_worksheets(token, drive_id, item_id, session_id):
+def get_worksheet_id_by_name(drive_id: str, item_id: str, session_id: str, sheet_name: str) -> str | None:
+    for s in get_worksheets(drive_id, item_id, session_id):
         if s.get("name") == sheet_name:
             return s.get("id")
     return None
 
-def add_worksheet(token: str, drive_id: str, item_id: str, session_id: str, sheet_name: str) -> str:
-    h = {"Authorization": f"Bearer {token}", "workbook-session-id": session_id, "Content-Type":"application/json"}
+def add_worksheet(drive_id: str, item_id: str, session_id: str, sheet_name: str) -> str:
     url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets/add"
-    r = requests.post(url, headers=h, data=json.dumps({"name": sheet_name})); r.raise_for_status()
+    r = graph.post(url, session_id=session_id, data=json.dumps({"name": sheet_name})); r.raise_for_status()
     return r.json()["id"]
 
-def delete_worksheet(token: str, drive_id: str, item_id: str, session_id: str, worksheet_id: str):
-    h = {"Authorization": f"Bearer {token}", "workbook-session-id": session_id}
+def delete_worksheet(drive_id: str, item_id: str, session_id: str, worksheet_id: str):
     url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets/{worksheet_id}"
-    r = requests.delete(url, headers=h)  # 204 esperado; ignoramos falhas leves
+    r = graph.delete(url, session_id=session_id)  # 204 esperado; ignoramos falhas leves
     print(f"[DEBUG] DELETE worksheet id={worksheet_id} (status {r.status_code})")
 
-def get_range_values(token: str, drive_id: str, item_id: str, session_id: str, worksheet_id: str, address: str) -> list[list]:
-    h = {"Authorization": f"Bearer {token}", "workbook-session-id": session_id}
+def get_range_values(drive_id: str, item_id: str, session_id: str, worksheet_id: str, address: str) -> list[list]:
     url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets/{worksheet_id}/range(address='{address}')"
     print(f"[DEBUG] GET range {address} …")
-    r = requests.get(url, headers=h)
+    r = graph.get(url, session_id=session_id)
     if not r.ok:
         raise RuntimeError(f"GET range {address} falhou: {r.status_code} {r.text}")
     vals = r.json().get("values", [])
     print(f"[DEBUG] Range {address}: {len(vals)} linhas")
     return vals
 
-def get_used_range(token: str, drive_id: str, item_id: str, session_id: str, worksheet_id: str) -> dict:
-    h = {"Authorization": f"Bearer {token}", "workbook-session-id": session_id}
+def get_used_range(drive_id: str, item_id: str, session_id: str, worksheet_id: str) -> dict:
     url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets/{worksheet_id}/usedRange(valuesOnly=true)"
-    r = requests.get(url, headers=h)
+    r = graph.get(url, session_id=session_id)
     if not r.ok:
         raise RuntimeError(f"GET usedRange falhou: {r.status_code} {r.text}")
     return r.json()  # contém 'address' e 'values'
 
-def patch_range_values(token: str, drive_id: str, item_id: str, session_id: str, worksheet_id: str, address: str, values_2d: list[list]):
-    h = {"Authorization": f"Bearer {token}", "workbook-session-id": session_id, "Content-Type":"application/json"}
+def patch_range_values(drive_id: str, item_id: str, session_id: str, worksheet_id: str, address: str, values_2d: list[list]):
     url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/worksheets/{worksheet_id}/range(address='{address}')"
     rows = len(values_2d)
     cols = len(values_2d[0]) if rows > 0 else 0
     print(f"[DEBUG] PATCH range {address} com {rows}x{cols} …")
     body = {"values": values_2d}
-    r = requests.patch(url, headers=h, data=json.dumps(body))
+    r = graph.patch(url, session_id=session_id, data=json.dumps(body))
     if not r.ok:
         raise RuntimeError(f"PATCH {address} falhou: {r.status_code} {r.text}")
 
@@ -185,28 +139,27 @@ def main():
     print(f"[DEBUG] CONSOLIDATE_FILE_PATH={CONSOLIDATE_FILE_PATH!r}")
     print(f"[DEBUG] CONSOLIDATE_SHEET_NAME efetivo: {CONSOLIDATE_SHEET_NAME!r}")
 
-    site_id  = get_site_id()
-    drive_id = get_drive_id(site_id)
+    site_id, drive_id, (cons_item_id,) = resolve_ids(SITE_HOSTNAME, SITE_PATH, [CONSOLIDATE_FILE_PATH])
     print(f"[DEBUG] site_id={site_id}")
     print(f"[DEBUG] drive_id={drive_id}")
 
-    # Resolver item do consolidado e criar sessão única
-    cons_item_id = get_item_id_by_path(token, drive_id, CONSOLIDATE_FILE_PATH)
-    cons_sess_id = create_session(token, drive_id, cons_item_id, persist=True)
+    # Sessão única (persistente) do consolidado; origens em sessões só de leitura
+    sessions = get_sessions().open()
+    cons_sess_id = sessions.get(drive_id, cons_item_id)
 
     try:
         # >>> Overwrite total: Delete + Add da folha
-        cons_ws_id = get_worksheet_id_by_name(token, drive_id, cons_item_id, cons_sess_id, CONSOLIDATE_SHEET_NAME)
+        cons_ws_id = get_worksheet_id_by_name(drive_id, cons_item_id, cons_sess_id, CONSOLIDATE_SHEET_NAME)
         if cons_ws_id:
             print(f"[DEBUG] Overwrite: a eliminar folha '{CONSOLIDATE_SHEET_NAME}' (id={cons_ws_id})")
-            delete_worksheet(token, drive_id, cons_item_id, cons_sess_id, cons_ws_id)
+            delete_worksheet(drive_id, cons_item_id, cons_sess_id, cons_ws_id)
 
-        cons_ws_id = add_worksheet(token, drive_id, cons_item_id, cons_sess_id, CONSOLIDATE_SHEET_NAME)
+        cons_ws_id = add_worksheet(drive_id, cons_item_id, cons_sess_id, CONSOLIDATE_SHEET_NAME)
         print(f"[DEBUG] Folha recriada: '{CONSOLIDATE_SHEET_NAME}' (id={cons_ws_id})")
 
         # Escrever cabeçalho (A1:M1) e preparar próxima linha
         header_out = [pad_row(ALL_COLS, COL_COUNT)]
-        patch_range_values(token, drive_id, cons_item_id, cons_sess_id, cons_ws_id, "A1:M1", header_out)
+        patch_range_values(drive_id, cons_item_id, cons_sess_id, cons_ws_id, "A1:M1", header_out)
         next_row = 2
         # <<< Fim overwrite total
 
@@ -216,7 +169,7 @@ def main():
         for folder in DRIVE_FOLDERS:
             print(f"\n[Pasta] {folder}")
             try:
-                items = list_children_recursive(token, drive_id, folder)
+                items = list_children_recursive(drive_id, folder)
                 print(f"[DEBUG] {len(items)} ficheiros encontrados.")
             except Exception as e:
                 print(f"  [ERRO] A aceder à pasta: {e}")
@@ -225,18 +178,23 @@ def main():
             for it in items:
                 name    = it.get("name", "")
                 item_id = it.get("id")
+                if item_id == cons_item_id:
+                    # o consolidado numa das pastas: não é uma origem, e fechar a sessão dele
+                    # no fim da leitura partiria as escritas seguintes
+                    print(f"  [INFO] {name} é o ficheiro consolidado — a ignorar.")
+                    continue
                 print(f"  [Ler] {name}")
 
-                src_sess_id = create_session(token, drive_id, item_id, persist=False)
+                src_sess_id = sessions.get(drive_id, item_id, persist=False)
                 try:
                     # Verificar folha 'PowerBI'
-                    src_ws_id = get_worksheet_id_by_name(token, drive_id, item_id, src_sess_id, SOURCE_SHEET)
+                    src_ws_id = get_worksheet_id_by_name(drive_id, item_id, src_sess_id, SOURCE_SHEET)
                     if not src_ws_id:
                         print("     [INFO] Folha 'PowerBI' não existe — a ignorar.")
                         continue
 
                     # Ler usedRange da fonte
-                    used_src = get_used_range(token, drive_id, item_id, src_sess_id, src_ws_id)
+                    used_src = get_used_range(drive_id, item_id, src_sess_id, src_ws_id)
                     print(f"     [DEBUG] usedRange address: {used_src.get('address')!r}")
                     src_vals = used_src.get("values", [])
                     if not src_vals or len(src_vals) <= 1:
@@ -289,7 +247,7 @@ def main():
                         end_row = next_row + len(chunk) - 1
                         addr_out = f"A{next_row}:M{end_row}"
                         print(f"     [DEBUG] Append {len(chunk)} linhas → {addr_out}")
-                        patch_range_values(token, drive_id, cons_item_id, cons_sess_id, cons_ws_id, addr_out, chunk)
+                        patch_range_values(drive_id, cons_item_id, cons_sess_id, cons_ws_id, addr_out, chunk)
                         next_row = end_row + 1
                         total_appended += len(chunk)
 
@@ -298,12 +256,13 @@ def main():
                 except Exception as e:
                     print(f"     [ERRO] {e}")
                 finally:
-                    close_session(token, drive_id, item_id, src_sess_id)
+                    sessions.close(drive_id, item_id)
 
         print(f"\n[Resumo] Linhas totais anexadas: {total_appended}")
 
     finally:
-        close_session(token, drive_id, cons_item_id, cons_sess_id)
+        sessions.close_all()
+        graph.print_stats()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,1117 @@
+"""
+Sync mensal (ficheiro "Mensal" → histórico) para vários jobs num só processo.
+
+Os jobs estão declarados em sync_jobs.JOBS (origem, destino, coluna de data). Em vez
+de um processo por script, aqui todos partilham o token (graph_auth), o pool de
+ligações e o orçamento de throttling (GraphClient), a cache de IDs (resolvida de uma
+vez para todos os ficheiros) e as sessões de workbook.
+
+Jobs independentes correm em paralelo (por omissão uma thread por fila; SYNC_CONCURRENCY
+limita). Jobs com o mesmo ficheiro de destino (ex.: Implementacoes e Materiais,
+Historico_Sell_In e PhrOrd) ficam na mesma fila e correm um a seguir ao outro, para
+não haver escritas concorrentes no mesmo workbook. O run noturno dura ~ a fila mais
+lenta em vez da soma dos jobs (no fim: tempo de cada job, soma e tempo de parede).
+Um job que falhe não interrompe os outros; o código de saída é 1 se algum falhou.
+
+Por job: lê o mês atual da origem (paginado), apaga as linhas do mês no destino e
+insere as novas em chunks (rows/add). Em vez do mês atual pode ser uma janela:
+SYNC_MONTHS=N (últimos N meses, para apanhar correções tardias) ou SYNC_FROM /
+SYNC_TO; com SYNC_BACKFILL=1, os meses presentes na origem (recargas históricas).
+A janela inteira é tratada de uma vez: uma leitura do destino para todos os meses,
+deletes agrupados e um único insert repartido.
+Com SYNC_COLUMNAR=1 a origem é lida em colunas (graph_columns):
+filtro de datas vetorizado, reorder por colunas e payloads feitos de fatias. Para apagar (SYNC_DELETE_MODE, ou
+"delete_mode" no job):
+- "batch": DELETE ItemAt por row em $batch de 20 + um sweep (uma leitura, range
+  delete das rows que sobraram e confirmação pelo nº de rows);
+- "block": sort/apply pela coluna de data e um único range delete do bloco do mês
+  (a tabela de destino fica ordenada por data).
+
+Com SYNC_MODE=diff (ou "mode": "diff" no job) o mês não é substituído por inteiro:
+as rows do mês no destino são comparadas com as da origem por fingerprint (hash dos
+valores; com "key_columns" no job, pela chave) e só se apagam as que saíram ou
+mudaram e se inserem as novas / alteradas. Num mês já carregado são poucas escritas.
+
+O estado das tabelas de destino (data e fingerprint por row) fica num índice local
+SQLite (graph_index, GRAPH_INDEX / GRAPH_INDEX_PATH). Se o eTag do workbook e o nº de
+rows forem os do fim do run anterior, os índices a apagar e os fingerprints do modo
+diff saem do índice, sem ler a tabela; se o workbook mudou fora dos jobs, faz-se a
+leitura normal e o índice é reconstruído.
+
+Antes de abrir sessões, um $batch de metadados devolve eTag / cTag /
+lastModifiedDateTime de cada origem; um job cuja origem não mudou desde o último
+sucesso (no mesmo mês) é saltado sem sessões nem leituras (graph_watermarks,
+SYNC_SKIP_UNCHANGED=0 para correr sempre). Os cabeçalhos de todas as tabelas vêm
+num único $batch; o reorder origem → destino é um plano de índices guardado por
+(tabela de origem, tabela de destino, hashes dos cabeçalhos) (graph_schema).
+
+Uso:
+    python sync_engine.py                          # todos os jobs (ou SYNC_JOBS=a,b)
+    python sync_engine.py Rutura_de_Stocks Visitas
+    SYNC_CONCURRENCY=1 python sync_engine.py       # filas em série
+No GitHub Actions corre em .github/workflows/Sync-Mensal.yml (o estado local do sync
+— IDs, índice, marcas de água, cabeçalhos — passa de um run para o seguinte em cache).
+"""
+import os, sys, json, requests, threading, time, traceback
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from graph_client import GRAPH_BASE, get_client
+from graph_retry import RETRY_STATUSES
+from graph_columns import COLUMNAR, ColumnTable
+from graph_dates import DateParser, date_to_serial, day_ordinals, serial_to_date
+from graph_batch import BatchCoalescer
+from graph_ids import resolve_ids
+from graph_index import INDEX_ENABLED, fetch_table_versions, get_table_index, normalize_cell, row_fingerprint
+from graph_schema import fetch_table_headers, get_schema_cache
+from graph_sessions import get_sessions
+from graph_async import (READ_CONCURRENCY, READ_MODE, iter_table_rows_at, iter_table_rows_concurrent,
+                         iter_table_rows_windows)
+from graph_tables import (coalesce_row_ranges, delete_table_row_ranges, delete_table_rows_block, get_table_body_info,
+                          read_table_column, rows_url, sort_table)
+from graph_watermarks import SKIP_UNCHANGED, fetch_item_versions, get_watermarks
+from sync_jobs import JOBS
+
+# ========= CONFIG (ENV) =========
+SITE_HOSTNAME  = os.getenv("SITE_HOSTNAME")
+SITE_PATH      = os.getenv("SITE_PATH")
+
+SYNC_JOBS        = os.getenv("SYNC_JOBS") or ""                          # "a,b" (vazio = todos)
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY") or "0")             # filas em paralelo (0 = todas, 1 = em série)
+SYNC_MODE        = (os.getenv("SYNC_MODE") or "replace").lower()          # "replace" | "diff" (só as rows que mudaram)
+SYNC_DELETE_MODE = (os.getenv("SYNC_DELETE_MODE") or "batch").lower()    # "batch" | "block" (sort + range delete)
+
+# Janela de datas (por omissão só o mês atual)
+SYNC_MONTHS      = int(os.getenv("SYNC_MONTHS") or "1")                   # últimos N meses (1 = mês atual)
+SYNC_FROM        = os.getenv("SYNC_FROM") or ""                           # "AAAA-MM" ou "AAAA-MM-DD" (sobrepõe SYNC_MONTHS)
+SYNC_TO          = os.getenv("SYNC_TO") or ""                             # idem (vazio = fim do mês atual)
+SYNC_BACKFILL    = (os.getenv("SYNC_BACKFILL") or "0") == "1"             # janela = meses presentes na origem
+
+# Paginação e sweep (podes alterar via ENV)
+DEFAULT_TOP           = int(os.getenv("GRAPH_ROWS_TOP") or "5000")   # leitura paginada
+DEFAULT_SWEEP_PASSES  = int(os.getenv("SWEEP_MAX_PASSES") or "3")    # sweep final: leitura + range deletes
+
+# Importação em chunks (ENV)
+IMPORT_CHUNK_SIZE     = int(os.getenv("IMPORT_CHUNK_SIZE") or "2000")    # rows por POST /rows/add
+IMPORT_MAX_RETRIES    = int(os.getenv("IMPORT_MAX_RETRIES") or "3")
+IMPORT_USE_BATCH      = (os.getenv("IMPORT_USE_BATCH") or "false").lower() == "true"
+# ================================
+
+# ---- Cliente Graph (autentica só na 1.ª chamada; ver graph_auth) ----
+graph = get_client()
+
+# ---- DEBUG helpers ----
+def list_tables(drive_id, item_id, session_id, prefetched=None):
+    """`prefetched`: resposta já obtida (ex.: BatchFuture do $batch de arranque)."""
+    url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables"
+    r = prefetched or graph.get(url, session_id=session_id)
+    if not r.ok:
+        print("[DEBUG][list_tables] URL:", url)
+        print("[DEBUG][list_tables] STATUS:", r.status_code)
+        try:
+            print("[DEBUG][list_tables] JSON:", r.json())
+        except Exception:
+            print("[DEBUG][list_tables] TEXT:", r.text)
+        r.raise_for_status()
+    data = r.json().get("value", [])
+    print(f"[DEBUG] Tabelas no ficheiro (item_id={item_id}):")
+    for t in data:
+        ws_name = (t.get("worksheet") or {}).get("name")
+        print(" - id:", t.get("id"),
+              "| name:", t.get("name"),
+              "| showHeaders:", t.get("showHeaders"),
+              "| worksheet:", ws_name)
+    return data
+
+def get_table_headers(drive_id, item_id, table_name, session_id, prefetched=None):
+    url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/headerRowRange"
+    r = prefetched or graph.get(url, session_id=session_id)
+    if not r.ok:
+        print("[DEBUG][headerRowRange] URL:", url)
+        print("[DEBUG][headerRowRange] STATUS:", r.status_code)
+        try:
+            print("[DEBUG][headerRowRange] JSON:", r.json())
+        except Exception:
+            print("[DEBUG][headerRowRange] TEXT:", r.text)
+        r.raise_for_status()
+    rng = r.json()
+    values = rng.get("values", [[]])
+    headers = [str(x) for x in (values[0] if values and values[0] else [])]
+    return headers
+
+def get_table_headers_safe(drive_id, item_id, table_name, session_id, prefetched=None):
+    # 1) tentativa oficial (headerRowRange, possivelmente já pedido no $batch de arranque)
+    try:
+        headers = get_table_headers(drive_id, item_id, table_name, session_id, prefetched=prefetched)
+        if headers:
+            print(f"[DEBUG] headerRowRange → {headers}")
+            return headers
+    except requests.HTTPError:
+        print("[DEBUG] headerRowRange falhou; a tentar fallback por /columns...")
+
+    # 2) /columns -> names
+    url_cols = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/columns"
+    rc = graph.get(url_cols, session_id=session_id)
+    if rc.ok:
+        cols = rc.json().get("value", [])
+        names = [c.get("name") for c in cols if c.get("name") is not None]
+        if names:
+            print("[DEBUG] Fallback /columns →", names)
+            return names
+        else:
+            print("[DEBUG] /columns devolveu lista vazia ou sem 'name'.")
+    else:
+        print("[DEBUG] /columns falhou. STATUS:", rc.status_code)
+        try: print("[DEBUG] /columns JSON:", rc.json())
+        except Exception: print("[DEBUG] /columns TEXT:", rc.text)
+
+    # 3) /range -> primeira linha
+    url_rng = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/range"
+    rr = graph.get(url_rng, session_id=session_id)
+    if rr.ok:
+        rng = rr.json()
+        vals = rng.get("values", [[]])
+        if vals and vals[0]:
+            headers = [str(x) for x in vals[0]]
+            print("[DEBUG] Fallback /range primeira linha →", headers)
+            return headers
+        else:
+            print("[DEBUG] /range não devolveu valores (ou primeira linha vazia).")
+    else:
+        print("[DEBUG] /range falhou. STATUS:", rr.status_code)
+        try: print("[DEBUG] /range JSON:", rr.json())
+        except Exception: print("[DEBUG] /range TEXT:", rr.text)
+
+    rr.raise_for_status()  # força erro p/ ver detalhe
+
+# ---- Listar rows com paginação ($top/$skip)
+def list_table_rows_paged(drive_id, item_id, table_name, session_id, top=None, max_pages=100000):
+    """
+    Itera páginas usando $top/$skip para evitar 'ResponsePayloadSizeLimitExceeded'.
+    Cada item tem 'index' (0-based na Tabela) e 'values' (só estes campos: $select).
+    Com GRAPH_READ_CONCURRENCY > 1 as páginas são pedidas em paralelo (mesma ordem de saída).
+    Com GRAPH_READ_MODE=window lê blocos A1 do dataBodyRange em vez de $top/$skip.
+    """
+    if top is None:
+        top = DEFAULT_TOP
+    if READ_MODE == "window":
+        yield from iter_table_rows_windows(drive_id, item_id, table_name, session_id)
+        return
+    if READ_CONCURRENCY > 1:
+        yield from iter_table_rows_concurrent(drive_id, item_id, table_name, session_id, top=top)
+        return
+
+    skip = 0; page = 0; total = 0
+
+    while page < max_pages:
+        page += 1
+        url = rows_url(drive_id, item_id, table_name, top=top, skip=skip)
+        r = graph.get(url, session_id=session_id)
+        if not r.ok:
+            print("[DEBUG][list_table_rows_paged] URL:", url)
+            print("[DEBUG][list_table_rows_paged] STATUS:", r.status_code)
+            try: print("[DEBUG][list_table_rows_paged] JSON:", r.json())
+            except Exception: print("[DEBUG][list_table_rows_paged] TEXT:", r.text)
+            r.raise_for_status()
+        batch = r.json().get("value", [])
+        if not batch:
+            print(f"[DEBUG][list_table_rows_paged] Fim paginação. total={total}, páginas={page-1}, top_final={top}")
+            break
+
+        print(f"[DEBUG][list_table_rows_paged] page={page} top={top} skip={skip} count={len(batch)}")
+        for row in batch:
+            total += 1
+            yield row
+        skip += top
+
+# ---- Inserir rows (importação repartida)
+def add_rows_chunked_sequential(drive_id, item_id, table_name, session_id, values_2d,
+                                chunk_size=IMPORT_CHUNK_SIZE, max_retries=IMPORT_MAX_RETRIES):
+    """
+    Adiciona rows em CHUNKS sequenciais ao fim da Tabela (preserva ordem).
+    Reduz chunk_size se payload exceder limite (429/Retry-After e 5xx ficam a cargo do GraphClient).
+    Doc recomenda inserir várias rows numa chamada 'rows/add' e experimentar nº ideal. [1](https://learn.microsoft.com/en-us/graph/api/tablerowcollection-add?view=graph-rest-1.0)
+    """
+    if not values_2d:
+        return 0
+
+    url = f"{GRAPH_BASE}/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/rows/add"
+    total = 0; start = 0; n = len(values_2d)
+
+    # função p/ enviar um chunk
+    def post_chunk(vals, attempt=1):
+        body = {"index": None, "values": vals}
+        print(f"[DEBUG][ADD-CHUNK] POST {url} rows={len(vals)} attempt={attempt} chunk_size={chunk_size}")
+        # 504 ocasional → repetido no GraphClient (graph_retry), até max_retries. [1](https://learn.microsoft.com/en-us/graph/api/tablerowcollection-add?view=graph-rest-1.0)
+        r = graph.post(url, session_id=session_id, data=json.dumps(body), max_retries=max_retries)
+        # payload demasiado grande → reduzir chunk
+        if not r.ok:
+            try:
+                err = r.json()
+            except Exception:
+                err = {"error": {"message": r.text}}
+            code = (err.get("error", {}) or {}).get("code", "")
+            inner = (err.get("error", {}) or {}).get("innerError", {}) or {}
+            inner_code = inner.get("code", "") or ""
+            if (str(code).lower() in ("responsepayloadsizelimitexceeded","requestentitytoolarge")
+                or str(inner_code).lower() in ("responsepayloadsizelimitexceeded","requestentitytoolarge")):
+                # reduzir chunk e tentar de novo
+                new_size = max(100, len(vals) // 2)
+                print(f"[DEBUG][ADD-CHUNK] Payload grande. A dividir o chunk {len(vals)}→{new_size}.")  # reduzir payload. [4](https://learn.microsoft.com/en-us/office/dev/add-ins/excel/performance)[5](https://stackoverflow.com/questions/61168748/how-to-ensure-that-excel-online-request-is-less-than-5mb-using-office-javascript)
+                # dividir e enviar em duas metades
+                mid = len(vals) // 2
+                c1, c2 = vals[:mid], vals[mid:]
+                ok1 = post_chunk(c1, attempt+1 if attempt <= max_retries else attempt)
+                ok2 = post_chunk(c2, attempt+1 if attempt <= max_retries else attempt)
+                return ok1 and ok2
+            print("[DEBUG][ADD-CHUNK] STATUS:", r.status_code, "| BODY:", err)
+            r.raise_for_status()
+        return True
+
+    while start < n:
+        end = min(start + chunk_size, n)
+        chunk = values_2d[start:end]
+        ok = post_chunk(chunk, attempt=1)
+        if ok:
+            total += len(chunk)
+            print(f"[DEBUG][ADD-CHUNK] OK ({len(chunk)}) total={total}/{n}")
+            start = end
+        else:
+            # se falhar sem exceção, avança para evitar loop (r.raise_for_status já aborta)
+            start = end
+
+    print(f"[DEBUG][ADD-CHUNK] Inseridas (sequencial): {total}")
+    return total
+
+def add_rows_chunked_batch(drive_id, item_id, table_name, session_id, values_2d,
+                           chunk_size=IMPORT_CHUNK_SIZE, max_retries=IMPORT_MAX_RETRIES):
+    """
+    (Opcional) Adiciona rows em CHUNKS via $batch (até 20 subpedidos).
+    Atenção: ordem de execução dentro do batch **não é garantida**; se precisas preservá-la, usa o modo sequencial. [3](https://learn.microsoft.com/en-us/graph/sdks/batch-requests)
+    """
+    if not values_2d:
+        return 0
+    total = 0; start = 0; n = len(values_2d)
+
+    def chunks(lst, size):
+        for i in range(0, len(lst), size):
+            yield lst[i:i+size]
+
+    while start < n:
+        end = min(start + chunk_size, n)
+        big_chunk = values_2d[start:end]
+        print(f"[DEBUG][ADD-BATCH] Preparar chunk rows={len(big_chunk)}")
+        # subdividir o big_chunk em sub-chunks (um add por subpedido)
+        subchunks = list(chunks(big_chunk, max(len(big_chunk)//20, 100)))  # tentativa: ~20 pedidos
+        requests_list = []
+        for i, sc in enumerate(subchunks, start=1):
+            rel_url = f"/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/rows/add"
+            requests_list.append({
+                "id": str(i),
+                "method": "POST",
+                "url": rel_url,
+                "headers": {"workbook-session-id": session_id, "Content-Type": "application/json"},
+                "body": {"index": None, "values": sc}
+            })
+        print(f"[DEBUG][ADD-BATCH] POST $batch subpedidos={len(requests_list)}")
+
+        # throttling no batch (topo e sub-respostas, Retry-After) tratado pelo governador. [6](https://stackoverflow.com/questions/71999165/how-to-handle-throttling-of-microsoft-graph-in-powershell)
+        try:
+            responses = graph.batch(requests_list, max_throttle_retries=max_retries)
+        except requests.HTTPError as err:
+            r = err.response
+            print("[DEBUG][ADD-BATCH] STATUS:", r.status_code)
+            try: print("[DEBUG][ADD-BATCH] JSON:", r.json())
+            except Exception: print("[DEBUG][ADD-BATCH] TEXT:", r.text)
+            raise
+
+        ok_count = sum(1 for e in responses if e.get("status") in (200, 204))
+        # somar o nº de rows efetivamente inseridas (aproximação: soma dos subchunks OK)
+        inserted = sum(len(subchunks[int(e.get("id"))-1]) for e in responses if e.get("status") in (200, 204))
+        total += inserted
+        for e in responses:
+            if e.get("status") not in (200, 204):
+                print("[DEBUG][ADD-BATCH] Falhou id", e.get("id"), "| status:", e.get("status"), "| body:", e.get("body"))
+        print(f"[DEBUG][ADD-BATCH] OK {ok_count}/{len(subchunks)} | rows_inserted={inserted} | total={total}/{n}")
+        start = end
+
+    print(f"[DEBUG][ADD-BATCH] Inseridas (batch): {total}")
+    return total
+
+# ---- Utilidades Excel ----
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y")
+
+def excel_value_to_date(v):
+    if isinstance(v, (int, float)):
+        return datetime(1899, 12, 30) + timedelta(days=float(v))
+    if isinstance(v, str):
+        for fmt in DATE_FORMATS:
+            try: return datetime.strptime(v, fmt)
+            except: pass
+    return None
+
+# Colunas de datas inteiras de uma vez (formato inferido e memo por coluna, chave
+# (item_id, tabela, índice da coluna)); célula a célula só no fallback
+EXCEL_DATES = DateParser(DATE_FORMATS, fallback=excel_value_to_date)
+
+def release_job_dates(job, src_id, dst_id):
+    """Esquece o formato / memo das colunas de data das tabelas do job (no fim do job)."""
+    tables = {(src_id, job["src_table"]), (dst_id, job["dst_table"])}
+    EXCEL_DATES.release(*[k for k in EXCEL_DATES.keys() if k[:2] in tables])
+
+def window_mask(serials, start, end, backfill=False):
+    """Máscara das datas (nºs de série) em [start, end]; com backfill, de todas as que têm data."""
+    if backfill:
+        return serials == serials   # sem NaN
+    return (serials >= date_to_serial(start)) & (serials < date_to_serial(end) + 1)
+
+def present_months(serials):
+    """{(ano, mês)} das datas (nºs de série; NaN = sem data)."""
+    days = np.unique(np.floor(serials[serials == serials]))
+    return {(d.year, d.month) for d in map(serial_to_date, days.tolist())}
+
+def month_spans(months):
+    """[(1.º dia, último dia)] de cada sequência de meses seguidos em `months` ({(ano, mês)})."""
+    spans = []
+    prev = None
+    for y, m in sorted(months):
+        first, last = month_bounds(datetime(y, m, 1))
+        if prev is not None and prev == y * 12 + m - 1:
+            spans[-1] = (spans[-1][0], last)
+        else:
+            spans.append((first, last))
+        prev = y * 12 + m
+    return spans
+
+def rows_in_window(rows, date_idx, start, end, dates_key=None):
+    """As rows (lista ou ColumnTable) com a data em [start, end], pela mesma ordem."""
+    if isinstance(rows, ColumnTable):
+        return rows.take(window_mask(rows.date_serials(date_idx, EXCEL_DATES, column=dates_key), start, end))
+    keep = window_mask(EXCEL_DATES.serials([r[date_idx] for r in rows], column=dates_key), start, end)
+    return [rows[i] for i in np.flatnonzero(keep).tolist()]
+
+def month_bounds(d: datetime):
+    first = datetime(d.year, d.month, 1).date()
+    if d.month == 12:
+        next_first = datetime(d.year + 1, 1, 1).date()
+    else:
+        next_first = datetime(d.year, d.month + 1, 1).date()
+    last = next_first - timedelta(days=1)
+    return first, last
+
+def parse_window_date(s, end=False):
+    """"AAAA-MM" → 1.º (ou último, com end=True) dia do mês; "AAAA-MM-DD" → esse dia."""
+    s = s.strip()
+    if len(s) == 7:
+        first = datetime.strptime(s, "%Y-%m")
+        return month_bounds(first)[1 if end else 0]
+    return datetime.strptime(s, "%Y-%m-%d").date()
+
+def sync_window(today, months=SYNC_MONTHS, date_from=SYNC_FROM, date_to=SYNC_TO):
+    """
+    (início, fim) das datas a sincronizar: SYNC_FROM / SYNC_TO se indicados; senão os
+    últimos `months` meses até ao fim do mês de `today` (1 = só esse mês).
+    """
+    end = parse_window_date(date_to, end=True) if date_to else month_bounds(today)[1]
+    if date_from:
+        start = parse_window_date(date_from)
+    else:
+        y, m = end.year, end.month - (max(months, 1) - 1)
+        while m < 1:
+            y, m = y - 1, m + 12
+        start = datetime(y, m, 1).date()
+    if start > end:
+        raise ValueError(f"Janela inválida: {start} > {end}")
+    return start, end
+
+# ---- DELETE via $batch (ItemAt) + sweep em grupos (mantido do teu fluxo anterior)
+def delete_table_rows_by_index_batch(
+    drive_id, item_id, table_name, session_id, row_indices,
+    max_batch_size=20, max_retries=3, fallback_sequential=False
+):
+    if not row_indices:
+        print("[DEBUG][BATCH-DEL] Sem índices para apagar.")
+        return {"deleted": 0, "failed": []}
+
+    deleted_total = 0
+    failed_global = []
+
+    def chunks(lst, size):
+        for i in range(0, len(lst), size):
+            yield lst[i:i+size]
+
+    row_indices = sorted(set(row_indices), reverse=True)
+    print(f"[DEBUG][BATCH-DEL] Total de índices para apagar: {len(row_indices)}")
+
+    def delete_single(idx):
+        rel_url = f"/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/rows/$/ItemAt(index={idx})"
+        abs_url = f"{GRAPH_BASE}{rel_url}"
+        print(f"[DEBUG][DEL-ONE] DELETE {abs_url}")
+        r = graph.delete(abs_url, session_id=session_id)
+        if not r.ok:
+            print("[DEBUG][DEL-ONE] STATUS:", r.status_code)
+            try: print("[DEBUG][DEL-ONE] JSON:", r.json())
+            except Exception: print("[DEBUG][DEL-ONE] TEXT:", r.text)
+            return False
+        return True
+
+    for chunk in chunks(row_indices, max_batch_size):
+        requests_list = []
+        for i, idx in enumerate(chunk, start=1):
+            rel_url = f"/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/rows/$/ItemAt(index={idx})"
+            req = {
+                "id": str(i),
+                "method": "DELETE",
+                "url": rel_url,
+                "headers": { "workbook-session-id": session_id }
+            }
+            # encadeados do maior índice para o menor: um sub-pedido throttled e os 424 que
+            # dependem dele podem ser re-enviados com o mesmo ItemAt sem apontar para outra row
+            if i > 1:
+                req["dependsOn"] = [str(i - 1)]
+            requests_list.append(req)
+
+        print("[DEBUG][BATCH-DEL] URLs no lote:", [req["url"] for req in requests_list])
+
+        print(f"[DEBUG][BATCH-DEL] POST $batch (lote {len(chunk)})")
+        try:
+            # 429/503 (de topo ou por sub-pedido) ficam a cargo do governador de throttling
+            responses = graph.batch(requests_list, max_throttle_retries=max_retries)
+        except requests.HTTPError as err:
+            r = err.response
+            print("[DEBUG][BATCH-DEL] STATUS:", r.status_code)
+            try: print("[DEBUG][BATCH-DEL] JSON:", r.json())
+            except Exception: print("[DEBUG][BATCH-DEL] TEXT:", r.text)
+            if fallback_sequential:
+                print("[DEBUG][BATCH-DEL] Falha no lote. Fallback sequencial.")
+                for idx in chunk:
+                    if delete_single(idx):
+                        deleted_total += 1
+                    else:
+                        failed_global.append(idx)
+            continue
+
+        ok_ids = [e for e in responses if e.get("status") in (200, 204)]
+        deleted_total += len(ok_ids)
+
+        for e in responses:
+            status = e.get("status")
+            if status not in (200, 204):
+                body = e.get("body") or {}
+                print("[DEBUG][BATCH-DEL] Falhou id", e.get("id"),
+                      "| status:", status, "| body:", body)
+                try:
+                    failed_idx = chunk[int(e.get("id")) - 1]
+                    failed_global.append(failed_idx)
+                except Exception:
+                    pass
+
+    print(f"[DEBUG][BATCH-DEL] Total rows apagadas (batch): {deleted_total}")
+    return {"deleted": deleted_total, "failed": sorted(set(failed_global), reverse=True)}
+
+def find_month_row_indices(drive_id, item_id, table_name, session_id, date_idx, month_start, month_end, top=None,
+                           snapshot=None):
+    """
+    Índices (0-based) das rows do mês. Com um snapshot válido do índice local
+    (graph_index) não há leitura; senão lê só a coluna de data (dataBodyRange da
+    coluna) e, se o Graph a recusar, volta às rows paginadas. O que for lido
+    atualiza o snapshot.
+    """
+    if snapshot is not None and snapshot.valid:
+        indices = snapshot.month_indices(month_start, month_end)
+        print(f"[DEBUG][INDEX] {table_name}: {len(indices)} rows do mês pelo índice local (sem leitura)")
+        return indices
+    if top is None:
+        top = DEFAULT_TOP
+    dates = read_table_column(drive_id, item_id, table_name, session_id, date_idx)
+    if dates is None:
+        dates = []
+        for r in list_table_rows_paged(drive_id, item_id, table_name, session_id, top=top):
+            vals = (r.get("values", [[]])[0] or [])
+            dates.append(vals[date_idx] if len(vals) > date_idx else None)
+
+    serials = EXCEL_DATES.serials(dates, column=(item_id, table_name, date_idx))
+    if snapshot is not None:
+        snapshot.observe_days(day_ordinals(serials))
+    return np.flatnonzero(window_mask(serials, month_start, month_end)).tolist()
+
+def sweep_month_rows(drive_id, item_id, table_name, session_id, date_idx, month_start, month_end,
+                     top=DEFAULT_TOP, max_passes=DEFAULT_SWEEP_PASSES, snapshot=None):
+    """
+    Sweep final (rows do mês que sobraram ao $batch): UMA leitura da coluna de data,
+    as rows restantes juntas em intervalos contínuos e apagadas por range, e a
+    confirmação pelo nº de rows da tabela (dataBodyRange rowCount), sem reler a
+    tabela. Só se o nº não bater se faz nova passagem (até max_passes). O custo
+    cresce com as rows restantes, não com restantes × tamanho da tabela.
+    """
+    total_deleted = 0
+    for p in range(1, max_passes + 1):
+        if snapshot is not None:
+            snapshot.invalidate()   # após deletes sem ordem garantida, a verdade é a leitura
+        indices = find_month_row_indices(drive_id, item_id, table_name, session_id, date_idx, month_start, month_end,
+                                         top=top, snapshot=snapshot)
+        if not indices:
+            print(f"[DEBUG][SWEEP] Nada restante. passagens={p} total_deleted={total_deleted}")
+            return total_deleted
+        info = get_table_body_info(drive_id, item_id, table_name, session_id)
+        ranges = coalesce_row_ranges(indices)
+        print(f"[DEBUG][SWEEP] Passagem {p}: {len(indices)} rows restantes em {len(ranges)} intervalos.")
+        deleted = delete_table_row_ranges(drive_id, item_id, table_name, session_id, ranges,
+                                          body_address=info["address"], row_count=info["rowCount"])
+        total_deleted += deleted
+        expected = info["rowCount"] - len(indices)
+        row_count = get_table_body_info(drive_id, item_id, table_name, session_id)["rowCount"]
+        if deleted == len(indices) and row_count == expected:
+            if snapshot is not None:
+                for first, count in ranges:   # do fim para o início, como foram apagados
+                    snapshot.delete_block(first, count)
+            print(f"[DEBUG][SWEEP] Confirmado pelo nº de rows ({row_count}). total_deleted={total_deleted}")
+            return total_deleted
+        print(f"[DEBUG][SWEEP] Nº de rows {row_count} != {expected} esperado (apagadas {deleted}); nova passagem.")
+    raise Exception(f"Sweep de {table_name} não confirmou o mês apagado em {max_passes} passagens.")
+
+# ---- Apagar o mês no destino ----
+def delete_month_rows_batch(name, drive_id, item_id, table_name, session_id, date_idx, month_start, month_end,
+                            snapshot=None):
+    """Modo "batch": DELETE ItemAt por row em $batch de 20 + sweep das que sobraram (drift de índices)."""
+    # --- Destino: índices a remover (mês atual) — índice local ou só a coluna de data ---
+    indices_to_delete = find_month_row_indices(
+        drive_id, item_id, table_name, session_id, date_idx, month_start, month_end, top=DEFAULT_TOP,
+        snapshot=snapshot
+    )
+    print(f"[DEBUG][{name}] Total índices a apagar: {len(indices_to_delete)}")
+    print(f"[DEBUG][{name}] Amostra índices: {indices_to_delete[:50]}{' ...' if len(indices_to_delete)>50 else ''}")
+    if not indices_to_delete:
+        print(f"[DEBUG][{name}] Nenhuma linha do mês encontrada para apagar no destino.")
+        return 0
+
+    # --- Apagar via $batch + sweep (uma leitura + range deletes) ---
+    if snapshot is not None:
+        snapshot.invalidate()   # o sweep relê a coluna e volta a sincronizar o snapshot
+    res = delete_table_rows_by_index_batch(
+        drive_id, item_id, table_name, session_id, indices_to_delete,
+        max_batch_size=20, max_retries=3, fallback_sequential=False
+    )
+    print(f"[OK][{name}] Removi {res['deleted']} linhas via $batch. Falharam {len(res['failed'])} no batch.")
+    sweep_deleted = sweep_month_rows(
+        drive_id, item_id, table_name, session_id,
+        date_idx, month_start, month_end, top=DEFAULT_TOP, snapshot=snapshot
+    )
+    print(f"[OK][{name}] Sweep removeu {sweep_deleted} linhas remanescentes do mês.")
+    return res["deleted"] + sweep_deleted
+
+def delete_month_rows_block(drive_id, item_id, table_name, session_id, date_idx, month_start, month_end,
+                            snapshot=None):
+    """
+    Modo "block": ordena a tabela pela coluna de data e apaga o mês (agora rows
+    seguidas) com um único range delete — sort/apply + coluna de data + endereço +
+    delete, em vez de um DELETE por row. Devolve o nº de rows apagadas, ou None se o
+    mês não ficou num bloco contínuo (ex.: datas em texto misturadas com números),
+    para o chamador usar o modo "batch".
+    """
+    sort_table(drive_id, item_id, table_name, session_id, date_idx, ascending=True)
+    if snapshot is not None:
+        snapshot.invalidate()   # o sort mudou as posições
+    indices = find_month_row_indices(drive_id, item_id, table_name, session_id, date_idx, month_start, month_end,
+                                     snapshot=snapshot)
+    if not indices:
+        print("[DEBUG][BLOCK-DEL] Nenhuma linha do mês encontrada para apagar no destino.")
+        return 0
+    first, last = min(indices), max(indices)
+    if last - first + 1 != len(indices):
+        print(f"[DEBUG][BLOCK-DEL] Mês não contínuo após o sort ({len(indices)} rows em {first}..{last}); a usar batch.")
+        return None
+    deleted = delete_table_rows_block(drive_id, item_id, table_name, session_id, first, len(indices))
+    if snapshot is not None:
+        snapshot.delete_block(first, len(indices))
+    return deleted
+
+# ---- Modo "diff": só as rows que mudaram ----
+def diff_month_rows(src_rows, dst_fps, dst_keys=None, key_idx=None):
+    """
+    src_rows: rows da origem (já na ordem das colunas do destino); dst_fps: {índice:
+    fingerprint} das rows do mês no destino; com chave, dst_keys: {índice: chave}.
+    Devolve (índices do destino a apagar, rows da origem a inserir, contagens).
+    Sem chave, rows iguais (mesmo fingerprint) emparelham uma a uma. Com chave
+    (key_idx = posições das colunas-chave) a row do destino com a mesma chave fica se
+    for igual; se mudou, sai e entra a da origem.
+    """
+    dst_groups = {}
+    for idx in sorted(dst_fps):
+        fp = dst_fps[idx]
+        ident = dst_keys[idx] if key_idx else fp
+        dst_groups.setdefault(ident, []).append((idx, fp))
+
+    to_insert = []
+    unchanged = changed = 0
+    for vals in src_rows:
+        fp = row_fingerprint(vals)
+        ident = tuple(normalize_cell(vals[i]) for i in key_idx) if key_idx else fp
+        candidates = dst_groups.get(ident) or []
+        match = next((k for k, (_, f) in enumerate(candidates) if f == fp), None)
+        if match is not None:
+            candidates.pop(match)
+            unchanged += 1
+            continue
+        if candidates:
+            changed += 1
+        to_insert.append(vals)
+
+    to_delete = sorted(idx for group in dst_groups.values() for idx, _ in group)
+    stats = {"unchanged": unchanged, "changed": changed,
+             "new": len(to_insert) - changed, "removed": len(to_delete) - changed}
+    return to_delete, to_insert, stats
+
+def delete_table_rows_chained(drive_id, item_id, table_name, session_id, row_indices, max_batch_size=20, max_attempts=3):
+    """
+    DELETE ItemAt de rows soltas, do maior índice para o menor, encadeadas com
+    dependsOn dentro de cada $batch: a ordem fica garantida e um índice nunca aponta
+    para outra row (sem o sweep do modo replace, um drift apagaria a row errada).
+    Um sub-pedido que falhe trava os seguintes (424), que voltam no lote seguinte.
+    Se falhou com 5xx (não repetido pelo cliente: pode já ter sido aplicado), o
+    rowCount da tabela decide se conta como apagado antes de o voltar a enviar.
+    """
+    pending = sorted(set(row_indices), reverse=True)
+    row_count = get_table_body_info(drive_id, item_id, table_name, session_id)["rowCount"]
+    deleted = 0
+    attempts = 0
+    while pending:
+        chunk = pending[:max_batch_size]
+        requests_list = []
+        for i, idx in enumerate(chunk, start=1):
+            req = {
+                "id": str(i),
+                "method": "DELETE",
+                "url": f"/drives/{drive_id}/items/{item_id}/workbook/tables/{table_name}/rows/$/ItemAt(index={idx})",
+                "headers": {"workbook-session-id": session_id},
+            }
+            if i > 1:
+                req["dependsOn"] = [str(i - 1)]
+            requests_list.append(req)
+        responses = graph.batch(requests_list)
+        ok = 0
+        for e in responses:
+            if e.get("status") not in (200, 204):
+                break
+            ok += 1
+        if ok < len(chunk) and responses[ok].get("status") in RETRY_STATUSES:
+            now = get_table_body_info(drive_id, item_id, table_name, session_id)["rowCount"]
+            if now == row_count - deleted - ok - 1:
+                print(f"[DEBUG][DIFF-DEL] Índice {chunk[ok]}: {responses[ok].get('status')}, mas o rowCount ({now}) "
+                      f"confirma o delete.")
+                ok += 1
+        deleted += ok
+        pending = pending[ok:]
+        if ok < len(chunk):
+            e = responses[ok]
+            print(f"[DEBUG][DIFF-DEL] Falhou índice {chunk[ok]} | status: {e.get('status')} | body: {e.get('body')}")
+            attempts = attempts + 1 if ok == 0 else 1
+            if attempts >= max_attempts:
+                raise Exception(f"Não foi possível apagar a row {chunk[ok]} de {table_name} ({len(pending)} por apagar).")
+        else:
+            attempts = 0
+    print(f"[DEBUG][DIFF-DEL] Total rows apagadas: {deleted}")
+    return deleted
+
+def sync_month_diff(name, job, drive_id, item_id, table_name, session_id, dst_headers, date_idx,
+                    month_start, month_end, to_import, snapshot=None):
+    """
+    Compara o mês da origem com o do destino e só apaga / insere as diferenças.
+    Os fingerprints do destino vêm do índice local quando válido; só as rows do mês
+    que faltarem (ou todas, com chave) são lidas (coluna de data → índices → blocos A1).
+    """
+    key_columns = job.get("key_columns") or []
+    missing = [c for c in key_columns if c not in dst_headers]
+    if missing:
+        raise Exception(f"Colunas-chave inexistentes no destino: {missing}")
+    key_idx = [dst_headers.index(c) for c in key_columns] or None
+
+    indices = find_month_row_indices(drive_id, item_id, table_name, session_id, date_idx, month_start, month_end,
+                                     snapshot=snapshot)
+    dst_fps = snapshot.known_fps(indices) if snapshot is not None and not key_idx else {}
+    to_read = [i for i in indices if i not in dst_fps]
+    dst_keys = {}
+    if to_read:
+        for r in iter_table_rows_at(drive_id, item_id, table_name, session_id, to_read):
+            vals = (r.get("values") or [[]])[0]
+            dst_fps[int(r["index"])] = row_fingerprint(vals)
+            if key_idx:
+                dst_keys[int(r["index"])] = tuple(normalize_cell(vals[i]) for i in key_idx)
+        if snapshot is not None:
+            snapshot.set_fps({i: dst_fps[i] for i in to_read})
+    print(f"[DEBUG][{name}] Rows do mês no destino: {len(indices)} (lidas {len(to_read)}, "
+          f"do índice local {len(indices) - len(to_read)})")
+
+    to_delete, to_insert, stats = diff_month_rows(to_import, dst_fps, dst_keys, key_idx)
+    print(f"[DEBUG][{name}] Diff do mês (chave={key_columns or 'row inteira'}): iguais={stats['unchanged']} "
+          f"alteradas={stats['changed']} novas={stats['new']} removidas={stats['removed']} "
+          f"→ apagar {len(to_delete)}, inserir {len(to_insert)}")
+
+    deleted = delete_table_rows_chained(drive_id, item_id, table_name, session_id, to_delete) if to_delete else 0
+    if snapshot is not None:
+        snapshot.delete(to_delete)   # ordem garantida pelo dependsOn → posições exatas
+    inserted = 0
+    if to_insert:
+        if IMPORT_USE_BATCH:
+            inserted = add_rows_chunked_batch(drive_id, item_id, table_name, session_id, to_insert,
+                                              chunk_size=IMPORT_CHUNK_SIZE, max_retries=IMPORT_MAX_RETRIES)
+        else:
+            inserted = add_rows_chunked_sequential(drive_id, item_id, table_name, session_id, to_insert,
+                                                   chunk_size=IMPORT_CHUNK_SIZE, max_retries=IMPORT_MAX_RETRIES)
+        track_inserted_rows(snapshot, to_insert, inserted, date_idx, dates_key=(item_id, table_name, date_idx))
+    print(f"[OK][{name}] Diff: apagadas {deleted}, inseridas {inserted}, iguais {stats['unchanged']}.")
+    return {"deleted": deleted, "inserted": inserted, "unchanged": stats["unchanged"]}
+
+def track_inserted_rows(snapshot, rows, inserted, date_idx, dates_key=None):
+    """Rows acrescentadas ao fim da tabela → fim do snapshot (só se entraram todas)."""
+    if snapshot is None:
+        return
+    if inserted != len(rows):
+        snapshot.invalidate()
+        return
+    if isinstance(rows, ColumnTable):
+        days = rows.day_ordinals(date_idx, EXCEL_DATES, column=dates_key)
+    else:
+        days = day_ordinals(EXCEL_DATES.serials([r[date_idx] for r in rows], column=dates_key))
+    snapshot.append(days, [row_fingerprint(r) for r in rows])
+
+# ---- Ler a origem ----
+def read_source_rows(drive_id, item_id, table_name, session_id, plan, date_idx, start, end, backfill=False):
+    """
+    (rows do intervalo na ordem do destino, {(ano, mês)} presentes nessas rows) — lista
+    de rows, reordenadas com o plano compilado `plan` (graph_schema.ReorderPlan); as
+    datas de cada bloco de rows convertidas de uma vez.
+    """
+    to_import = []
+    months = set()
+    block = []
+
+    def flush():
+        serials = EXCEL_DATES.serials([vals[date_idx] for vals in block], column=(item_id, table_name, date_idx))
+        keep = window_mask(serials, start, end, backfill)
+        to_import.extend(plan.apply_many(block[i] for i in np.flatnonzero(keep).tolist()))
+        months.update(present_months(serials[keep]))
+        block.clear()
+
+    for r in list_table_rows_paged(drive_id, item_id, table_name, session_id, top=DEFAULT_TOP):
+        vals = (r.get("values", [[]])[0] or [])
+        if len(vals) <= date_idx:
+            continue
+        block.append(vals)
+        if len(block) >= DEFAULT_TOP:
+            flush()
+    if block:
+        flush()
+    return to_import, months
+
+def read_source_columnar(drive_id, item_id, table_name, session_id, plan, date_idx, start, end, backfill=False):
+    """
+    Igual a read_source_rows, em colunas (graph_columns, SYNC_COLUMNAR=1): o filtro de
+    datas é uma máscara sobre os nºs de série (por bloco de rows, antes de passar a
+    colunas) e o reorder uma escolha de colunas. Devolve uma ColumnTable (lista de
+    rows só de leitura) em vez da lista.
+    """
+    def in_range(block):
+        return window_mask(EXCEL_DATES.serials([r[date_idx] for r in block], column=(item_id, table_name, date_idx)),
+                           start, end, backfill)
+
+    rows = ((r.get("values", [[]])[0] or []) for r in
+            list_table_rows_paged(drive_id, item_id, table_name, session_id, top=DEFAULT_TOP))
+    table = ColumnTable.from_rows(rows, plan.src_headers, keep=in_range)
+    print(f"[DEBUG][COLUMNAR] {table_name}: {len(table)} rows no intervalo")
+    if not len(table):
+        return table, set()
+    serials = table.date_serials(date_idx, EXCEL_DATES, column=(item_id, table_name, date_idx))
+    return table.select(plan.dst_headers), present_months(serials)
+
+# ---- Um job ----
+def run_job(name, job, drive_id, src_id, dst_id, sessions, month_start, month_end, snapshot=None, backfill=False,
+            headers=None):
+    """
+    Substitui o intervalo [month_start, month_end] do destino (o mês atual ou uma janela
+    de vários meses) pelas linhas desse intervalo na origem, com uma só leitura do
+    destino para todos os meses. Com `backfill`, são substituídos só os meses com rows
+    na origem (cada sequência de meses seguidos de uma vez); meses sem rows na origem
+    ficam como estão no destino.
+    `snapshot`: estado da tabela de destino no índice local (graph_index), atualizado aqui.
+    `headers`: {(item_id, tabela): cabeçalhos} já lidos no arranque (fetch_table_headers);
+    sem eles, um $batch com tabelas (debug) + headerRowRange de src e dst.
+    """
+    src_table, dst_table, date_column = job["src_table"], job["dst_table"], job["date_column"]
+    dst_sid = sessions.get(drive_id, dst_id)
+    src_sid = sessions.get(drive_id, src_id, persist=False)   # origem só de leitura
+    print(f"[SYNC][{name}] {job['src_file']}:{src_table} → {job['dst_file']}:{dst_table} (mês por '{date_column}')")
+
+    headers = headers or {}
+    src_headers = headers.get((src_id, src_table))
+    dst_headers = headers.get((dst_id, dst_table))
+    if src_headers is None or dst_headers is None:
+        # Arranque num único $batch: tabelas (debug) + headerRowRange que faltar
+        with BatchCoalescer() as boot:
+            f_src_tables = boot.get(f"{GRAPH_BASE}/drives/{drive_id}/items/{src_id}/workbook/tables", session_id=src_sid)
+            f_dst_tables = boot.get(f"{GRAPH_BASE}/drives/{drive_id}/items/{dst_id}/workbook/tables", session_id=dst_sid)
+            f_src_hdr = None if src_headers else boot.get(f"{GRAPH_BASE}/drives/{drive_id}/items/{src_id}/workbook/tables/{src_table}/headerRowRange", session_id=src_sid)
+            f_dst_hdr = None if dst_headers else boot.get(f"{GRAPH_BASE}/drives/{drive_id}/items/{dst_id}/workbook/tables/{dst_table}/headerRowRange", session_id=dst_sid)
+
+        # Listar tabelas p/ debug
+        _ = list_tables(drive_id, src_id, src_sid, prefetched=f_src_tables)
+        _ = list_tables(drive_id, dst_id, dst_sid, prefetched=f_dst_tables)
+
+        # Obter cabeçalhos com fallback
+        if src_headers is None:
+            src_headers = get_table_headers_safe(drive_id, src_id, src_table, src_sid, prefetched=f_src_hdr)
+        if dst_headers is None:
+            dst_headers = get_table_headers_safe(drive_id, dst_id, dst_table, dst_sid, prefetched=f_dst_hdr)
+    print(f"[DEBUG][{name}] src_headers:", src_headers)
+    print(f"[DEBUG][{name}] dst_headers:", dst_headers)
+
+    if date_column not in src_headers or date_column not in dst_headers:
+        raise Exception(f"A coluna '{date_column}' não existe em uma das tabelas.")
+
+    date_idx_src = src_headers.index(date_column)
+    date_idx_dst = dst_headers.index(date_column)
+
+    # Plano de reorder por (tabela de origem, tabela de destino, hashes dos cabeçalhos)
+    schemas = get_schema_cache()
+    plan = schemas.plan(schemas.table_key(drive_id, src_id, src_table), schemas.table_key(drive_id, dst_id, dst_table),
+                        src_headers, dst_headers)
+    print(f"[DEBUG][SCHEMA][{name}] Plano de colunas: {plan.describe()}")
+
+    # --- Origens: filtrar o intervalo e reordenar p/ o destino (paginação) ---
+    read_source = read_source_columnar if COLUMNAR else read_source_rows
+    to_import, months = read_source(drive_id, src_id, src_table, src_sid, plan, date_idx_src,
+                                    month_start, month_end, backfill)
+    if backfill:
+        spans = month_spans(months)
+        print(f"[DEBUG][{name}] Backfill: meses da origem {[f'{y}-{m:02d}' for y, m in sorted(months)]} "
+              f"→ intervalos {[(str(a), str(b)) for a, b in spans]}")
+    else:
+        spans = [(month_start, month_end)]
+    print(f"[DEBUG][{name}] Linhas a importar ({', '.join(f'{a} a {b}' for a, b in spans) or '-'}): {len(to_import)}")
+
+    result = {"imported": len(to_import), "deleted": 0, "inserted": 0}
+    if not to_import:
+        print(f"[SYNC][{name}] Nada para importar.")
+        return result
+
+    if (job.get("mode") or SYNC_MODE) == "diff":
+        for start, end in spans:
+            rows = to_import if len(spans) == 1 else rows_in_window(to_import, date_idx_dst, start, end,
+                                                                    dates_key=(dst_id, dst_table, date_idx_dst))
+            res = sync_month_diff(name, job, drive_id, dst_id, dst_table, dst_sid, dst_headers, date_idx_dst,
+                                  start, end, rows, snapshot=snapshot)
+            for k, v in res.items():
+                result[k] = result.get(k, 0) + v
+        return result
+
+    # --- Destino: apagar as linhas do intervalo (em backfill, de cada sequência de meses da origem) ---
+    for start, end in spans:
+        deleted = None
+        if (job.get("delete_mode") or SYNC_DELETE_MODE) == "block":
+            deleted = delete_month_rows_block(drive_id, dst_id, dst_table, dst_sid, date_idx_dst, start, end,
+                                              snapshot=snapshot)
+            if deleted is not None:
+                print(f"[OK][{name}] Removi {deleted} linhas de {start} a {end} (sort + range delete).")
+        if deleted is None:
+            deleted = delete_month_rows_batch(name, drive_id, dst_id, dst_table, dst_sid, date_idx_dst, start, end,
+                                              snapshot=snapshot)
+        result["deleted"] += deleted
+
+    # --- Inserir as novas linhas do intervalo (REPARTIDO) ---
+    if IMPORT_USE_BATCH:
+        inserted = add_rows_chunked_batch(
+            drive_id, dst_id, dst_table, dst_sid, to_import,
+            chunk_size=IMPORT_CHUNK_SIZE, max_retries=IMPORT_MAX_RETRIES
+        )
+    else:
+        inserted = add_rows_chunked_sequential(
+            drive_id, dst_id, dst_table, dst_sid, to_import,
+            chunk_size=IMPORT_CHUNK_SIZE, max_retries=IMPORT_MAX_RETRIES
+        )
+    print(f"[OK][{name}] Inseridas {inserted} linhas do mês no destino (repartido, {'batch' if IMPORT_USE_BATCH else 'sequencial'}).")
+    track_inserted_rows(snapshot, to_import, inserted, date_idx_dst, dates_key=(dst_id, dst_table, date_idx_dst))
+    result["inserted"] = inserted
+    return result
+
+# ---- Vários jobs ----
+def select_jobs(names=None):
+    """Nomes pedidos (args, senão SYNC_JOBS, senão todos) pela ordem de JOBS."""
+    if not names:
+        names = [n.strip() for n in SYNC_JOBS.split(",") if n.strip()]
+    if not names:
+        return list(JOBS)
+    unknown = [n for n in names if n not in JOBS]
+    if unknown:
+        raise SystemExit(f"Jobs desconhecidos: {unknown}. Disponíveis: {list(JOBS)}")
+    return [n for n in JOBS if n in names]
+
+def job_lanes(names):
+    """
+    Filas de jobs: uma por ficheiro de destino (jobs da mesma fila correm em série).
+    As filas com mais jobs primeiro: com menos threads do que filas, começam as mais longas.
+    """
+    lanes = {}
+    for n in names:
+        lanes.setdefault("/" + JOBS[n]["dst_file"].strip("/"), []).append(n)
+    return sorted(lanes.values(), key=len, reverse=True)
+
+def job_signature(job, src_id, dst_id, window):
+    """O que tem de ser igual, além da versão da origem, para o job poder ser saltado."""
+    mode = job.get("mode") or SYNC_MODE
+    delete_mode = job.get("delete_mode") or SYNC_DELETE_MODE
+    return (f"{src_id}:{job['src_table']}>{dst_id}:{job['dst_table']}:{job['date_column']}:{window}"
+            f":{mode}:{delete_mode}")
+
+def skip_unchanged_jobs(names, drive_id, item_ids, window):
+    """
+    (jobs a correr, {job: (assinatura, versão da origem)}): um $batch de metadados para
+    todas as origens; saltam os jobs cuja origem não mudou desde o último sucesso.
+    """
+    marks = get_watermarks()
+    try:
+        versions = fetch_item_versions(drive_id, [item_ids[JOBS[n]["src_file"]] for n in names])
+    except Exception as e:
+        print(f"[DEBUG][WATERMARK] Sem metadados das origens ({e!r}); todos os jobs correm")
+        return names, {}
+    todo, sources = [], {}
+    for n in names:
+        job = JOBS[n]
+        src_id = item_ids[job["src_file"]]
+        sig = job_signature(job, src_id, item_ids[job["dst_file"]], window)
+        version = versions.get(src_id)
+        if marks.unchanged(n, sig, version):
+            print(f"[SYNC][{n}] Origem sem alterações desde o último sync (eTag {version.get('eTag')}); job saltado")
+            continue
+        todo.append(n)
+        sources[n] = (sig, version)
+    return todo, sources
+
+def save_snapshots(index, drive_id, dst_tables, snapshots, results):
+    """Grava no índice local os snapshots dos jobs que correram bem, com o eTag depois das escritas."""
+    done = [n for n, snap in snapshots.items() if isinstance(results.get(n), dict) and snap.valid]
+    if not done:
+        return
+    try:
+        versions = fetch_table_versions(drive_id, list(dict.fromkeys(dst_tables[n] for n in done)))
+        for n in done:
+            index.save(snapshots[n], *versions[dst_tables[n]])
+    except Exception as e:
+        print(f"[DEBUG][INDEX] Índice local não gravado ({e!r})")
+
+def run_jobs(names, concurrency=SYNC_CONCURRENCY, today=None, window=None, backfill=SYNC_BACKFILL):
+    """
+    Corre os jobs partilhando IDs, sessões e cliente; devolve {job: resultado ou exceção}.
+    `window`: (início, fim) das datas a sincronizar (por omissão sync_window(today)).
+    """
+    today = today or datetime.today() - timedelta(days=1)
+    month_start, month_end = window or sync_window(today)
+    if backfill:
+        print(f"[SYNC] Jobs: {names} | backfill: meses presentes na origem")
+    else:
+        print(f"[SYNC] Jobs: {names} | janela: {month_start} a {month_end}")
+
+    paths = list(dict.fromkeys(p for n in names for p in (JOBS[n]["src_file"], JOBS[n]["dst_file"])))
+    _, drive_id, ids = resolve_ids(SITE_HOSTNAME, SITE_PATH, paths)
+    item_ids = dict(zip(paths, ids))
+
+    # Origens que não mudaram desde o último sucesso: sem sessões nem leituras
+    results = {}
+    sources = {}
+    if SKIP_UNCHANGED:
+        todo, sources = skip_unchanged_jobs(names, drive_id, item_ids,
+                                            "backfill" if backfill else f"{month_start}:{month_end}")
+        results = {n: {"imported": 0, "deleted": 0, "inserted": 0, "skipped": True} for n in names if n not in todo}
+        names = todo
+    if not names:
+        print("[SYNC] Nenhuma origem mudou; nada a fazer")
+        return results
+
+    # Índice local das tabelas de destino: validado pelo eTag / nº de rows antes de qualquer escrita
+    index = get_table_index() if INDEX_ENABLED else None
+    dst_tables = {n: (item_ids[JOBS[n]["dst_file"]], JOBS[n]["dst_table"]) for n in names}
+    snapshots = {}
+    if index is not None:
+        versions = fetch_table_versions(drive_id, list(dict.fromkeys(dst_tables.values())))
+        for n, (item_id, table) in dst_tables.items():
+            snapshots[n] = index.load(drive_id, item_id, table, JOBS[n]["date_column"], *versions[(item_id, table)])
+
+    # Cabeçalhos de todas as tabelas num $batch (em vez de um headerRowRange por job)
+    get_schema_cache()   # singleton criado antes das threads
+    tables = [(item_ids[JOBS[n][f"{side}_file"]], JOBS[n][f"{side}_table"]) for n in names for side in ("src", "dst")]
+    try:
+        headers = fetch_table_headers(drive_id, tables)
+    except Exception as e:
+        print(f"[DEBUG][SCHEMA] Cabeçalhos não lidos no arranque ({e!r}); cada job lê os seus")
+        headers = {}
+
+    sessions = get_sessions().open()   # uma sessão por workbook, keep-alive e fecho em SIGTERM
+    lock = threading.Lock()
+
+    def run_lane(lane):
+        for name in lane:
+            job = JOBS[name]
+            t0 = time.monotonic()
+            try:
+                res = run_job(name, job, drive_id, item_ids[job["src_file"]], item_ids[job["dst_file"]],
+                              sessions, month_start, month_end, snapshot=snapshots.get(name), backfill=backfill,
+                              headers=headers)
+            except Exception as e:
+                print(f"[SYNC][{name}] FALHOU: {e!r}")
+                traceback.print_exc()
+                res = e
+            finally:
+                release_job_dates(job, item_ids[job["src_file"]], item_ids[job["dst_file"]])
+            with lock:
+                results[name] = res
+                elapsed[name] = time.monotonic() - t0
+
+    lanes = job_lanes(names)
+    workers = len(lanes) if concurrency <= 0 else min(concurrency, len(lanes))
+    elapsed = {}
+    t_start = time.monotonic()
+    try:
+        if workers <= 1:
+            for lane in lanes:
+                run_lane(lane)
+        else:
+            # Threads partilham o cliente Graph: o mesmo token, pool de ligações e orçamento de throttling
+            print(f"[SYNC] {len(lanes)} filas (1 por workbook de destino) em {workers} threads: {lanes}")
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sync") as pool:
+                list(pool.map(run_lane, lanes))
+    finally:
+        sessions.close_all()
+        if index is not None:
+            save_snapshots(index, drive_id, dst_tables, snapshots, results)
+        graph.print_stats()
+
+    if SKIP_UNCHANGED:
+        # Versão lida no arranque: se a origem mudou durante o run, o próximo run volta a correr
+        marks = get_watermarks()
+        for name in names:
+            sig, version = sources.get(name, (None, None))
+            if isinstance(results.get(name), dict):
+                marks.record(name, sig, version)
+            else:
+                marks.forget(name)
+
+    wall = time.monotonic() - t_start
+    for name in names:
+        res = results.get(name)
+        if isinstance(res, dict):
+            print(f"[SYNC][{name}] OK: importadas={res['imported']} apagadas={res['deleted']} inseridas={res['inserted']} "
+                  f"({elapsed.get(name, 0):.1f}s)")
+        else:
+            print(f"[SYNC][{name}] FALHOU: {res!r} ({elapsed.get(name, 0):.1f}s)")
+    print(f"[SYNC] Tempo de parede {wall:.1f}s; soma dos jobs {sum(elapsed.values()):.1f}s "
+          f"({len(lanes)} filas, {workers} em paralelo)")
+    return results
+
+def main(argv=None):
+    names = select_jobs(sys.argv[1:] if argv is None else argv)
+    results = run_jobs(names)
+    return 0 if all(isinstance(r, dict) for r in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
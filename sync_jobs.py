@@ -0,0 +1,64 @@
+"""
+Jobs do sync mensal (ficheiro "Mensal" → histórico), corridos pelo sync_engine.
+
+Cada job: ficheiro / tabela de origem (export do mês), ficheiro / tabela de destino
+(histórico) e a coluna de data que define o mês a substituir. O nome do job é o
+nome do script que o corre isoladamente (python Rutura_de_Stocks.py).
+Opcionais: "mode" ("replace" | "diff") e "delete_mode" ("batch" | "block") sobrepõem
+SYNC_MODE / SYNC_DELETE_MODE para o job; "key_columns" (lista de colunas) identifica
+as rows no modo diff (sem chave compara-se a row inteira).
+"""
+
+FOLDER = "/General/Teste - Daniel PowerAutomate"
+
+JOBS = {
+    "Historico_Sell_In": {
+        "src_file": f"{FOLDER}/Historico Sell In Mensal.xlsx",
+        "src_table": "TabelaAutomatica",
+        "dst_file": f"{FOLDER}/Historico Sell In.xlsx",
+        "dst_table": "Historico",
+        "date_column": "Data Entrega",
+    },
+    "PhrOrd": {
+        "src_file": f"{FOLDER}/Historico Sell In Mensal.xlsx",
+        "src_table": "Dados",
+        "dst_file": f"{FOLDER}/Historico Sell In.xlsx",
+        "dst_table": "Dados",
+        "date_column": "Data Registo",
+    },
+    "Visitas": {
+        "src_file": f"{FOLDER}/Visitas Wize Mensal.xlsx",
+        "src_table": "TabelaAutomatica",
+        "dst_file": f"{FOLDER}/Visitas Wize.xlsx",
+        "dst_table": "Historico",
+        "date_column": "Data Visita",
+    },
+    "Rutura_de_Stocks": {
+        "src_file": f"{FOLDER}/Ruturas de Stocks Mensal.xlsx",
+        "src_table": "TabelaAutomatica",
+        "dst_file": f"{FOLDER}/Rutura de Stock.xlsx",
+        "dst_table": "Historico",
+        "date_column": "Data Validação da Visita",
+    },
+    "Detailing": {
+        "src_file": f"{FOLDER}/Detailings Mensal.xlsx",
+        "src_table": "TabelaAutomatica",
+        "dst_file": f"{FOLDER}/Detailings.xlsx",
+        "dst_table": "Historico",
+        "date_column": "Data da visita",
+    },
+    "Implementacoes": {
+        "src_file": f"{FOLDER}/Implementacoes e Materiais Mensal.xlsx",
+        "src_table": "TabelaAutomatica",
+        "dst_file": f"{FOLDER}/Implementacoes e Materiais.xlsx",
+        "dst_table": "Historico",
+        "date_column": "Data da visita",
+    },
+    "Materiais": {
+        "src_file": f"{FOLDER}/Implementacoes e Materiais Mensal.xlsx",
+        "src_table": "Materiais",
+        "dst_file": f"{FOLDER}/Implementacoes e Materiais.xlsx",
+        "dst_table": "Materiais",
+        "date_column": "Data da visita",
+    },
+}
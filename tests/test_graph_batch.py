@@ -0,0 +1,30 @@
+"""graph_batch.BatchCoalescer: dependsOn entre $batch diferentes."""
+from graph_batch import BatchCoalescer
+
+
+class FakeClient:
+    """Responde 404 a /falha e 200 ao resto; guarda os $batch enviados."""
+
+    def __init__(self):
+        self.sent = []
+
+    def batch(self, requests_list):
+        self.sent.append(requests_list)
+        return [{"id": r["id"], "status": 404 if r["url"] == "/falha" else 200, "body": {}}
+                for r in requests_list]
+
+
+def test_dependencia_falhada_num_batch_anterior_da_424_sem_enviar():
+    client = FakeClient()
+    b = BatchCoalescer(client, max_size=2)
+    f_bad = b.get("/falha")
+    f_ok = b.get("/ok")                                        # enche o 1.º $batch
+    f_dep = b.patch("/a", body={}, depends_on=[f_bad])
+    f_chain = b.patch("/b", body={}, depends_on=[f_dep])
+    f_good = b.patch("/c", body={}, depends_on=[f_ok])
+    b.flush()
+
+    assert [f.status_code for f in (f_bad, f_ok, f_dep, f_chain, f_good)] == [404, 200, 424, 424, 200]
+    assert f_dep.json()["error"]["code"] == "FailedDependency"
+    assert [r["url"] for r in client.sent[-1]] == ["/c"]        # /a e /b nunca chegam ao Graph
+    assert "dependsOn" not in client.sent[-1][0]
@@ -0,0 +1,33 @@
+"""graph_dates.DateParser: formato inferido e memo por coluna."""
+from datetime import datetime
+
+from graph_dates import DateParser, date_to_serial
+
+FORMATS = ("%Y-%m-%d", "%d/%m/%Y")
+
+
+def fallback(v):
+    for fmt in FORMATS:
+        try:
+            return datetime.strptime(v, fmt)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def test_colunas_com_formatos_diferentes_nao_caem_no_fallback():
+    parser = DateParser(FORMATS, fallback=fallback)
+    iso = [f"2024-03-{d:02d}" for d in range(1, 29)]
+    pt = [f"{d:02d}/04/2024" for d in range(1, 29)]
+
+    a = parser.serials(iso, column=("item", "Origem", 0))
+    b = parser.serials(pt + [45000, None], column=("item", "Historico", 0))
+
+    assert parser.fallbacks == 0   # cada coluna com o seu formato: nenhum texto célula a célula
+    assert a[0] == date_to_serial(datetime(2024, 3, 1))
+    assert b[0] == date_to_serial(datetime(2024, 4, 1)) and b[-2] == 45000 and b[-1] != b[-1]
+    assert parser.column(("item", "Origem", 0)).format == "%Y-%m-%d"
+    assert parser.column(("item", "Historico", 0)).format == "%d/%m/%Y"
+
+    parser.release(("item", "Origem", 0), ("item", "Historico", 0))
+    assert parser.keys() == []
@@ -0,0 +1,166 @@
+"""
+sync_engine contra o graph_emulator: o que fica na tabela de destino em cada modo.
+
+Destino com vários meses de histórico (rows baralhadas, como depois de vários runs);
+verifica-se por tag (2.ª coluna) que só o intervalo pedido foi substituído.
+"""
+import random
+
+import pytest
+
+from conftest import SyncCase, rows_for, tags
+from graph_emulator import EmulatorConfig
+
+
+def shuffled(rows):
+    rows = list(rows)
+    random.Random(7).shuffle(rows)
+    return rows
+
+
+@pytest.mark.parametrize("env", [{}, {"SYNC_DELETE_MODE": "block"}, {"SYNC_COLUMNAR": "1"}],
+                         ids=["batch", "block", "columnar"])
+def test_replace_substitui_so_o_mes_atual(sync_case, env):
+    dst = shuffled(rows_for(2, "old2", 30) + rows_for(1, "old1", 30) + rows_for(0, "old0", 40))
+    src = rows_for(1, "src1", 5) + rows_for(0, "new0", 25)
+    sync_case.setup(src, dst)
+
+    out = sync_case.run(**env)
+
+    values = sync_case.dst_values()
+    assert tags(values) == {"old2": 30, "old1": 30, "new0": 25}
+    assert "importadas=25 apagadas=40 inseridas=25" in out
+    if env.get("SYNC_DELETE_MODE") == "block":
+        dates = [v[0] for v in values]
+        assert dates == sorted(dates)   # sort/apply pela data antes do range delete
+
+
+def test_diff_so_escreve_as_rows_que_mudaram(sync_case):
+    dst = shuffled(rows_for(1, "old1", 20) + rows_for(0, "keep", 20) + rows_for(0, "gone", 5))
+    src = rows_for(0, "keep", 20) + rows_for(0, "new", 7)
+    sync_case.setup(src, dst)
+
+    out = sync_case.run(SYNC_MODE="diff")
+
+    assert tags(sync_case.dst_values()) == {"old1": 20, "keep": 20, "new": 7}
+    assert "apagadas=5 inseridas=7" in out
+
+
+def test_janela_de_meses(sync_case):
+    dst = shuffled(rows_for(3, "old3", 10) + rows_for(2, "old2", 10) + rows_for(1, "old1", 10) + rows_for(0, "old0", 10))
+    src = rows_for(3, "s3", 5) + rows_for(1, "s1", 6) + rows_for(0, "s0", 7)
+    sync_case.setup(src, dst)
+
+    sync_case.run(SYNC_MONTHS=2)
+
+    assert tags(sync_case.dst_values()) == {"old3": 10, "old2": 10, "s1": 6, "s0": 7}
+
+
+def test_backfill_substitui_os_meses_da_origem(sync_case):
+    dst = shuffled(rows_for(3, "old3", 10) + rows_for(2, "old2", 10) + rows_for(1, "old1", 10) + rows_for(0, "old0", 10))
+    src = rows_for(2, "s2", 4) + rows_for(1, "s1", 6)
+    sync_case.setup(src, dst)
+
+    sync_case.run(SYNC_BACKFILL=1)
+
+    assert tags(sync_case.dst_values()) == {"old3": 10, "s2": 4, "s1": 6, "old0": 10}
+
+
+def test_segundo_run_usa_o_indice_local(sync_case):
+    dst = shuffled(rows_for(1, "old1", 20) + rows_for(0, "old0", 20))
+    src = rows_for(0, "new0", 15)
+    sync_case.setup(src, dst)
+
+    sync_case.run()
+    out = sync_case.run()
+
+    assert "pelo índice local (sem leitura)" in out
+    assert tags(sync_case.dst_values()) == {"old1": 20, "new0": 15}
+
+
+def test_origem_sem_alteracoes_salta_o_job(sync_case):
+    sync_case.setup(rows_for(0, "new0", 10), rows_for(0, "old0", 10))
+
+    sync_case.run(SYNC_SKIP_UNCHANGED=1)
+    out = sync_case.run(SYNC_SKIP_UNCHANGED=1)
+
+    assert "job saltado" in out
+    assert tags(sync_case.dst_values()) == {"new0": 10}
+
+
+@pytest.mark.parametrize("env", [{}, {"SYNC_DELETE_MODE": "block"}, {"SYNC_MODE": "diff"}],
+                         ids=["batch", "block", "diff"])
+def test_backfill_mantem_meses_sem_rows_na_origem(sync_case, env):
+    dst = shuffled(rows_for(3, "old3", 10) + rows_for(2, "old2", 10) + rows_for(1, "old1", 10) + rows_for(0, "old0", 10))
+    src = rows_for(3, "s3", 4) + rows_for(1, "s1", 6)   # mês 2 ausente da origem
+    sync_case.setup(src, dst)
+
+    sync_case.run(SYNC_BACKFILL=1, **env)
+
+    assert tags(sync_case.dst_values()) == {"s3": 4, "old2": 10, "s1": 6, "old0": 10}
+
+
+def test_cabecalhos_da_origem_mudam_entre_runs(sync_case):
+    sync_case.setup(rows_for(0, "new0", 10), rows_for(1, "old1", 5) + rows_for(0, "old0", 10))
+    sync_case.run()
+
+    # Colunas da origem reordenadas sem mexer no eTag: o plano tem de seguir os cabeçalhos novos
+    t = sync_case.emu.workbook(sync_case.cfg["src_file"]).table(sync_case.cfg["src_table"])
+    t.headers = t.headers[::-1]
+    t.rows[:] = [r[::-1] for r in rows_for(0, "new1", 8)]
+    sync_case.run()
+
+    assert tags(sync_case.dst_values()) == {"old1": 5, "new1": 8}
+    assert all(isinstance(v[0], int) for v in sync_case.dst_values())   # data na 1.ª coluna do destino
+
+
+def test_mudar_o_modo_volta_a_correr_o_job(sync_case):
+    sync_case.setup(rows_for(0, "new0", 10), rows_for(0, "old0", 10))
+
+    sync_case.run(SYNC_SKIP_UNCHANGED=1)
+    out = sync_case.run(SYNC_SKIP_UNCHANGED=1, SYNC_MODE="diff")
+
+    assert "job saltado" not in out
+    assert "iguais=10" in out
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_replace_com_throttling_nao_apaga_rows_fora_do_mes(tmp_path, seed):
+    # rows do mês intercaladas com o histórico: um ItemAt repetido fora de ordem apagaria histórico
+    dst = [r for pair in zip(rows_for(1, "old1", 100), rows_for(0, "old0", 100)) for r in pair]
+    case = SyncCase(tmp_path, config=EmulatorConfig(throttle_rate=0.2, retry_after=0, random_seed=seed))
+    try:
+        case.setup(rows_for(0, "new0", 10), dst)
+        case.run(GRAPH_THROTTLE_MAX_RETRIES=50, GRAPH_MIN_RPS=100000)
+        assert tags(case.dst_values()) == {"old1": 100, "new0": 10}
+    finally:
+        case.close()
+
+
+@pytest.mark.parametrize("env", [{}, {"SYNC_DELETE_MODE": "block"}, {"SYNC_MODE": "diff"}],
+                         ids=["batch", "block", "diff"])
+def test_504_depois_do_delete_nao_apaga_rows_fora_do_mes(tmp_path, env):
+    # o delete entrou mas a resposta é 504: repeti-lo pela mesma posição apagaria histórico
+    dst = [r for pair in zip(rows_for(1, "old1", 100), rows_for(0, "old0", 100)) for r in pair]
+    case = SyncCase(tmp_path, config=EmulatorConfig(applied_error_rate=0.05, random_seed=4))
+    try:
+        case.setup(rows_for(0, "new0", 10), dst)
+        case.run(GRAPH_RETRY_BASE=0, GRAPH_RETRY_CAP=0, GRAPH_BREAKER_THRESHOLD=1000, **env)
+        assert tags(case.dst_values()) == {"old1": 100, "new0": 10}
+    finally:
+        case.close()
+
+
+def test_destino_recriado_com_outro_id_resolve_de_novo(sync_case):
+    sync_case.setup(rows_for(0, "new0", 10), rows_for(1, "old1", 5))
+    sync_case.run()
+
+    # Ficheiro substituído no SharePoint: mesmo caminho, item id novo (o da cache dá 404)
+    dst_file = sync_case.cfg["dst_file"]
+    sync_case.emu.remove_file(dst_file)
+    sync_case.emu.add_workbook(dst_file, tables={sync_case.cfg["dst_table"]: {
+        "sheet": "Historico", "headers": sync_case.headers, "rows": rows_for(1, "old1", 7)}})
+    out = sync_case.run()
+
+    assert "item id da cache já não existe" in out
+    assert tags(sync_case.dst_values()) == {"old1": 7, "new0": 10}